@@ -1,68 +1,371 @@
-from __future__ import annotations
-
-from pathlib import Path
-
-from fastapi import FastAPI
-from pydantic import BaseModel, Field
-
-from assistant.agent import handle_query
-from assistant.config import Paths
-from assistant.ingestion import build_chunks, load_documents, save_metadata
-from assistant.logging_utils import JsonlLogger
-from assistant.rag_store import RagStore
-
-
-BASE_DIR = Path(__file__).resolve().parents[1]
-paths = Paths(base_dir=BASE_DIR)
-logger = JsonlLogger(paths.run_log_path)
-rag = RagStore(paths)
-
-app = FastAPI(title="Tunisian Digital Service Assistant (Prototype)")
-
-
-class IngestResponse(BaseModel):
-    documents: int
-    chunks: int
-    index_path: str
-
-
-@app.post("/ingest", response_model=IngestResponse)
-def ingest() -> IngestResponse:
-    docs = load_documents(paths.data_raw)
-    chunks = build_chunks(docs)
-    save_metadata(paths, chunks)
-    rag.build_and_save([c.text for c in chunks])
-    logger.log("Ingest", documents=len(docs), chunks=len(chunks), index=str(paths.faiss_index_path))
-    return IngestResponse(documents=len(docs), chunks=len(chunks), index_path=str(paths.faiss_index_path))
-
-
-class QueryRequest(BaseModel):
-    text: str = Field(..., description="Citizen/civil-servant request in Arabic/French")
-    top_k: int = 4
-    allow_generation: bool = False
-
-
-class QueryResponse(BaseModel):
-    action: str
-    answer: str
-    language: str
-    retrieved_sources: list[str]
-    eval_hooks: dict
-
-
-@app.post("/query", response_model=QueryResponse)
-def query(req: QueryRequest) -> QueryResponse:
-    res = handle_query(
-        user_text=req.text,
-        rag=rag,
-        logger=logger,
-        top_k=req.top_k,
-        allow_generation=req.allow_generation,
-    )
-    return QueryResponse(
-        action=res.action,
-        answer=res.answer,
-        language=res.language,
-        retrieved_sources=[r.source for r in res.retrieved],
-        eval_hooks=res.eval_hooks,
-    )
+from __future__ import annotations
+
+import json
+import threading
+import time
+import uuid
+from datetime import date
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Literal
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+
+from assistant.agent import AgentResponse, AnswerCache, handle_batch_async, handle_query_async, stream_query
+from assistant.config import (
+    DEFAULT_TOP_K,
+    MAX_TOP_K,
+    QUERY_BATCH_MAX,
+    QUERY_BATCH_WINDOW_MS,
+    RERANK_ENABLED,
+    RETRIEVAL_SERVICE,
+    RETRIEVAL_WORKERS,
+    Paths,
+)
+from assistant.index_factory import SearchTuning
+from assistant.ingestion import ingest_incremental
+from assistant.io_utils import FileLock, atomic_write_text
+from assistant.langid import detect_language
+from assistant.llm_ollama import OllamaClient
+from assistant.logging_utils import JsonlLogger
+from assistant.meta_store import ChunkFilter
+from assistant.metrics import REGISTRY
+from assistant.rag_store import RagStore, published_files
+from assistant.reranker import Reranker
+from assistant.retrieval_service import RetrievalClient
+
+
+BASE_DIR = Path(__file__).resolve().parents[1]
+paths = Paths(base_dir=BASE_DIR)
+logger = JsonlLogger(paths.run_log_path)
+rag = RagStore(
+    paths,
+    logger=logger,
+    batch_window_ms=QUERY_BATCH_WINDOW_MS,
+    batch_max=QUERY_BATCH_MAX,
+    reranker=Reranker(cache_dir=paths.hf_cache_dir) if RERANK_ENABLED else None,
+)
+# Queries go to `retriever`: the local store, or with RETRIEVAL_SERVICE a thin client of the
+# shared retrieval process (the local store then only loads its model if /ingest runs here).
+retriever: RagStore | RetrievalClient = rag
+if RETRIEVAL_SERVICE:
+    retriever = RetrievalClient(
+        RETRIEVAL_SERVICE, paths, batch_window_ms=QUERY_BATCH_WINDOW_MS, batch_max=QUERY_BATCH_MAX
+    )
+answer_cache = AnswerCache()
+
+# Embedding/search runs here instead of the default threadpool, so slow LLM calls
+# (which are awaited on the event loop) can never starve pure-retrieval queries.
+retrieval_pool = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="retrieval")
+ingest_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+
+
+# Readiness: "warming" until the model, index and first inferences are done.
+warm_state: dict = {"status": "warming"}
+
+
+def _warmup() -> None:
+    t0 = time.perf_counter()
+    try:
+        detect_language("Bonjour, je voudrais renouveler ma carte d'identité.")
+        timings = retriever.warmup()
+    except Exception as exc:
+        logger.log("Warmup", error=repr(exc))
+        warm_state.update(status="failed", error=repr(exc))
+        return
+    warm_state.update(status="ready", warmup_ms=round((time.perf_counter() - t0) * 1000, 1), steps=timings)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One keep-alive connection pool and generation queue to Ollama for the whole process.
+    app.state.llm = OllamaClient()
+    # Warm up off the event loop so /health answers while the model loads.
+    threading.Thread(target=_warmup, name="warmup", daemon=True).start()
+    try:
+        yield
+    finally:
+        await app.state.llm.aclose()
+        retrieval_pool.shutdown(wait=False)
+        ingest_pool.shutdown(wait=False)
+        logger.flush()
+
+
+app = FastAPI(title="Tunisian Digital Service Assistant (Prototype)", lifespan=lifespan)
+
+
+@app.get("/health")
+def health() -> dict:
+    """Liveness: the process is up and serving HTTP (it may still be warming up)."""
+
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+def ready() -> JSONResponse:
+    """Readiness: 200 once the model and index are loaded and warmed, else 503."""
+
+    return JSONResponse(warm_state, status_code=200 if warm_state["status"] == "ready" else 503)
+
+
+class IngestResponse(BaseModel):
+    documents: int
+    chunks: int
+    added: int
+    removed: int
+    unchanged: int
+    index_path: str
+
+
+class IngestJob(BaseModel):
+    job_id: str
+    status: str  # queued | running | done | failed
+    full: bool
+    created: float
+    finished: float | None = None
+    result: IngestResponse | None = None
+    error: str | None = None
+
+
+# Jobs are files under data/index/jobs/ so any API worker can report them and
+# "one rebuild at a time" holds across workers. A pending job keeps <id>.lock
+# locked by the worker running it; if that worker dies the lock is released
+# and the job is marked failed.
+_JOB_KEEP_S = 7 * 24 * 3600
+_PENDING = {"queued", "running"}
+_jobs_lock = threading.Lock()
+_local_jobs: set[str] = set()  # pending jobs run by this process
+
+
+def _job_path(job_id: str, suffix: str = ".json") -> Path:
+    return paths.ingest_jobs_dir / f"{job_id}{suffix}"
+
+
+def _save_job(job: IngestJob) -> None:
+    atomic_write_text(_job_path(job.job_id), job.model_dump_json())
+
+
+def _load_job(job_id: str) -> IngestJob | None:
+    try:
+        return IngestJob.model_validate_json(_job_path(job_id).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _orphaned(job_id: str) -> bool:
+    if job_id in _local_jobs:
+        return False
+    probe = FileLock(_job_path(job_id, ".lock"))
+    if not probe.acquire(blocking=False):
+        return False
+    try:
+        # Re-read: the job may have finished between the scan and the probe.
+        job = _load_job(job_id)
+        return job is not None and job.status in _PENDING
+    finally:
+        probe.release()
+
+
+def _pending_job() -> IngestJob | None:
+    now = time.time()
+    for path in paths.ingest_jobs_dir.glob("*.json"):
+        job = _load_job(path.stem)
+        if job is None:
+            continue
+        if job.status in _PENDING:
+            if not _orphaned(job.job_id):
+                return job
+            job.status, job.error, job.finished = "failed", "worker exited before the job finished", now
+            _save_job(job)
+        if job.finished is not None and now - job.finished > _JOB_KEEP_S:
+            _job_path(job.job_id).unlink(missing_ok=True)
+            _job_path(job.job_id, ".lock").unlink(missing_ok=True)
+    return None
+
+
+def _run_ingest(job: IngestJob, lock: FileLock) -> None:
+    job.status = "running"
+    _save_job(job)
+    try:
+        res = ingest_incremental(paths, rag, logger=logger, full=job.full)
+        index_path = str(published_files(paths).root)
+        logger.log("Ingest", **res.__dict__, index=index_path, job_id=job.job_id)
+        job.result = IngestResponse(**res.__dict__, index_path=index_path)
+        job.status = "done"
+    except Exception as exc:
+        logger.log("Ingest", job_id=job.job_id, error=repr(exc))
+        job.error = repr(exc)
+        job.status = "failed"
+    finally:
+        job.finished = time.time()
+        _save_job(job)
+        _local_jobs.discard(job.job_id)
+        lock.release()
+
+
+@app.post("/ingest", response_model=IngestJob, status_code=202)
+def ingest(full: bool = False) -> IngestJob:
+    """Start an index rebuild in the background; poll `GET /ingest/{job_id}` on any worker."""
+
+    paths.ingest_jobs_dir.mkdir(parents=True, exist_ok=True)
+    with _jobs_lock, FileLock(paths.ingest_jobs_dir / "jobs.lock"):
+        # Only one rebuild at a time: hand back the job that is already pending.
+        pending = _pending_job()
+        if pending is not None:
+            return pending
+        job = IngestJob(job_id=uuid.uuid4().hex, status="queued", full=full, created=time.time())
+        lock = FileLock(_job_path(job.job_id, ".lock"))
+        lock.acquire()
+        _local_jobs.add(job.job_id)
+        _save_job(job)
+    ingest_pool.submit(_run_ingest, job, lock)
+    return job
+
+
+@app.get("/ingest/{job_id}", response_model=IngestJob)
+def ingest_status(job_id: str) -> IngestJob:
+    job = _load_job(job_id) if job_id.isalnum() else None
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown ingest job")
+    return job
+
+
+class QueryFilters(BaseModel):
+    # Applied inside the search; every given field must match.
+    lang: list[str] = Field(default_factory=list, description="e.g. ['fr'] or ['ar']")
+    domain: list[str] = Field(default_factory=list, description="e.g. ['cin_renewal']")
+    source: list[str] = Field(default_factory=list, description="file names or full paths")
+    date_from: date | None = Field(None, description="YYYY-MM-DD, inclusive")
+    date_to: date | None = Field(None, description="YYYY-MM-DD, inclusive")
+
+    def to_filter(self) -> ChunkFilter:
+        return ChunkFilter(
+            lang=tuple(self.lang),
+            domain=tuple(self.domain),
+            source=tuple(self.source),
+            date_from=self.date_from.isoformat() if self.date_from else None,
+            date_to=self.date_to.isoformat() if self.date_to else None,
+        )
+
+
+class QueryRequest(BaseModel):
+    text: str = Field(..., description="Citizen/civil-servant request in Arabic/French")
+    top_k: int = Field(DEFAULT_TOP_K, ge=1, le=MAX_TOP_K)
+    allow_generation: bool = False
+    # Search-time recall/latency trade-off for ANN indexes (defaults come from the index).
+    nprobe: int | None = Field(None, ge=1)
+    ef_search: int | None = Field(None, ge=1)
+    # dense | hybrid | lexical (default: RETRIEVAL_MODE); rerank=false skips the cross-encoder.
+    mode: Literal["dense", "hybrid", "lexical"] | None = None
+    rerank: bool | None = None
+    filters: QueryFilters | None = None
+
+
+class QueryResponse(BaseModel):
+    action: str
+    answer: str
+    language: str
+    retrieved_sources: list[str]
+    # Character spans of the retrieved chunks in their source (start/end are -1 if unknown).
+    citations: list[dict]
+    eval_hooks: dict
+
+
+def _to_response(res: AgentResponse) -> QueryResponse:
+    return QueryResponse(
+        action=res.action,
+        answer=res.answer,
+        language=res.language,
+        retrieved_sources=[r.source for r in res.retrieved],
+        citations=[{"source": r.source, "chunk_id": r.chunk_id, "start": r.start, "end": r.end} for r in res.retrieved],
+        eval_hooks=res.eval_hooks,
+    )
+
+
+async def _run_query(text: str, req: QueryRequest) -> QueryResponse:
+    res = await handle_query_async(
+        user_text=text,
+        rag=retriever,
+        logger=logger,
+        executor=retrieval_pool,
+        llm=app.state.llm,
+        top_k=req.top_k,
+        allow_generation=req.allow_generation,
+        tuning=SearchTuning(nprobe=req.nprobe, ef_search=req.ef_search, mode=req.mode, rerank=req.rerank),
+        filters=req.filters.to_filter() if req.filters else None,
+        cache=answer_cache,
+    )
+    return _to_response(res)
+
+
+@app.post("/query", response_model=QueryResponse)
+async def query(req: QueryRequest) -> QueryResponse:
+    return await _run_query(req.text, req)
+
+
+@app.post("/query/stream")
+async def query_stream(req: QueryRequest) -> StreamingResponse:
+    """Server-sent events: `sources` first, then `token` events, then `done`."""
+
+    async def events():
+        stream = stream_query(
+            user_text=req.text,
+            rag=retriever,
+            logger=logger,
+            executor=retrieval_pool,
+            llm=app.state.llm,
+            top_k=req.top_k,
+            allow_generation=req.allow_generation,
+            tuning=SearchTuning(nprobe=req.nprobe, ef_search=req.ef_search, mode=req.mode, rerank=req.rerank),
+            filters=req.filters.to_filter() if req.filters else None,
+        )
+        try:
+            async for event, data in stream:
+                yield f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+        except Exception as exc:  # headers are already sent; report in-band
+            yield f"event: error\ndata: {json.dumps({'error': repr(exc)})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+class BatchQueryRequest(BaseModel):
+    texts: list[str] = Field(..., min_length=1, max_length=256)
+    top_k: int = Field(DEFAULT_TOP_K, ge=1, le=MAX_TOP_K)
+    allow_generation: bool = False
+    nprobe: int | None = Field(None, ge=1)
+    ef_search: int | None = Field(None, ge=1)
+    mode: Literal["dense", "hybrid", "lexical"] | None = None
+    rerank: bool | None = None
+    filters: QueryFilters | None = None
+
+
+class BatchQueryResponse(BaseModel):
+    results: list[QueryResponse]
+
+
+@app.post("/query/batch", response_model=BatchQueryResponse)
+async def query_batch(req: BatchQueryRequest) -> BatchQueryResponse:
+    # One executor job screens all texts and retrieves them with one encode and one search.
+    results = await handle_batch_async(
+        texts=req.texts,
+        rag=retriever,
+        logger=logger,
+        executor=retrieval_pool,
+        llm=app.state.llm,
+        top_k=req.top_k,
+        allow_generation=req.allow_generation,
+        tuning=SearchTuning(nprobe=req.nprobe, ef_search=req.ef_search, mode=req.mode, rerank=req.rerank),
+        filters=req.filters.to_filter() if req.filters else None,
+        cache=answer_cache,
+    )
+    return BatchQueryResponse(results=[_to_response(res) for res in results])
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    """Per-stage latency histograms in Prometheus text format."""
+
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
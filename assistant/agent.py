@@ -1,142 +1,702 @@
-from __future__ import annotations
-
-from dataclasses import dataclass
-from typing import Any
-
-from assistant.logging_utils import JsonlLogger
-from assistant.rag_store import RagStore, Retrieved
-from assistant.safety import check_safety
-from assistant.text_utils import detect_language
-
-
-@dataclass(frozen=True)
-class AgentResponse:
-    action: str
-    answer: str
-    language: str
-    retrieved: list[Retrieved]
-    eval_hooks: dict[str, Any]
-
-
-def _format_context(retrieved: list[Retrieved]) -> str:
-    parts = []
-    for r in retrieved:
-        parts.append(f"[source={r.source} chunk={r.chunk_id} score={r.score:.3f}]\n{r.text}")
-    return "\n\n---\n\n".join(parts)
-
-
-def _extractive_answer(user_text: str, retrieved: list[Retrieved]) -> str:
-    if not retrieved:
-        return "Je n'ai pas trouvé de document pertinent dans la base locale."
-    # Simple “grounded” response: show steps + citations.
-    top = retrieved[0]
-    return (
-        "Réponse (basée sur les documents locaux):\n\n"
-        f"{top.text}\n\n"
-        "Sources:\n"
-        + "\n".join(f"- {r.source} (chunk {r.chunk_id})" for r in retrieved)
-    )
-
-
-def handle_query(
-    *,
-    user_text: str,
-    rag: RagStore,
-    logger: JsonlLogger,
-    top_k: int = 4,
-    allow_generation: bool = False,
-) -> AgentResponse:
-    """Agentic decision: safety -> tool selection -> retrieval -> response.
-
-    Evaluation hooks are emitted as structured fields.
-    """
-
-    lang = detect_language(user_text)
-    logger.log("Log_Interaction", user_text=user_text, language=lang)
-
-    safety = check_safety(user_text)
-    logger.log("Safety_Check", action=safety.action, reason=safety.reason)
-
-    if safety.action == "refuse":
-        answer = (
-            "Je ne peux pas traiter des données personnelles/sensibles ici. "
-            "Merci de retirer les identifiants (CIN, téléphone, email) ou contactez un agent." 
-            f"Raison: {safety.reason}"
-        )
-        logger.log("Generate_Response", mode="refusal")
-        return AgentResponse(
-            action="refuse",
-            answer=answer,
-            language=lang,
-            retrieved=[],
-            eval_hooks={
-                "after_Tool_Select": {"selected": "none", "reason": "safety_refusal"},
-                "after_Generate_Response": {"type": "refusal"},
-            },
-        )
-
-    if safety.action == "escalate":
-        answer = (
-            "Je vous redirige vers un agent humain pour ce cas. "
-            "Veuillez fournir votre demande sans données sensibles, ou via le canal officiel."
-        )
-        logger.log("Generate_Response", mode="escalation")
-        return AgentResponse(
-            action="escalate",
-            answer=answer,
-            language=lang,
-            retrieved=[],
-            eval_hooks={
-                "after_Tool_Select": {"selected": "human", "reason": "escalation_trigger"},
-                "after_Generate_Response": {"type": "escalation"},
-            },
-        )
-
-    # Tool selection: always retrieve first for procedural queries.
-    logger.log("Tool_Select", selected="retrieve", top_k=top_k)
-
-    retrieved = rag.retrieve(user_text, top_k=top_k)
-    logger.log(
-        "Tool_Result",
-        selected="retrieve",
-        retrieved_count=len(retrieved),
-        retrieved_sources=[r.source for r in retrieved],
-    )
-
-    # In this prototype, generation is optional; we keep sovereignty by default.
-    if not allow_generation:
-        answer = _extractive_answer(user_text, retrieved)
-        logger.log("Generate_Response", mode="extractive")
-        return AgentResponse(
-            action="retrieve_document",
-            answer=answer,
-            language=lang,
-            retrieved=retrieved,
-            eval_hooks={
-                "after_Tool_Select": {"selected": "retrieve"},
-                "after_Generate_Response": {"type": "extractive", "grounded": True},
-            },
-        )
-
-    # Optional: connect a local LLM (e.g., Ollama). We keep the prompt grounded.
-    from assistant.llm_ollama import generate_with_ollama
-
-    context = _format_context(retrieved)
-    prompt = (
-        "You are a public administration assistant. Answer using ONLY the context. "
-        "If the context is insufficient, say so.\n\n"
-        f"User: {user_text}\n\nContext:\n{context}\n\nAnswer:"
-    )
-    llm = generate_with_ollama(prompt)
-    logger.log("Generate_Response", mode="ollama", model=llm.model)
-
-    return AgentResponse(
-        action="summarize_procedure",
-        answer=llm.text.strip() or _extractive_answer(user_text, retrieved),
-        language=lang,
-        retrieved=retrieved,
-        eval_hooks={
-            "after_Tool_Select": {"selected": "retrieve+generate", "model": llm.model},
-            "after_Generate_Response": {"type": "llm", "grounded": True},
-        },
-    )
+from __future__ import annotations
+
+import asyncio
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor
+from dataclasses import asdict, dataclass, replace
+from typing import Any, AsyncIterator
+
+import numpy as np
+
+from assistant.config import ANSWER_CACHE_SIMILARITY, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_S, LLM_TOKENIZER
+from assistant.context import build_context, llm_token_counter
+from assistant.index_factory import SearchTuning
+from assistant.langid import detect_language
+from assistant.llm_ollama import LlmResult, LlmUnavailable, OllamaClient, default_client
+from assistant.logging_utils import JsonlLogger
+from assistant.meta_store import ChunkFilter
+from assistant.metrics import REGISTRY, STAGE_METRIC, span
+from assistant.rag_store import RagStore, Retrieved
+from assistant.safety import PLACEHOLDERS, SafetyDecision, check_safety
+
+
+@dataclass(frozen=True)
+class AgentResponse:
+    action: str
+    answer: str
+    language: str
+    retrieved: list[Retrieved]
+    eval_hooks: dict[str, Any]
+
+
+@dataclass
+class _CacheEntry:
+    response: AgentResponse
+    scope: tuple
+    vector: np.ndarray | None
+    expires: float
+
+
+def normalize_query(text: str) -> str:
+    text = re.sub(r"\s+", " ", text.casefold()).strip()
+    return text.rstrip(" ?!.؟")
+
+
+class AnswerCache:
+    """Answer cache for repeated questions: exact hits on normalized text, and
+    near-duplicate hits on query-embedding cosine similarity.
+
+    Entries expire after `ttl_s`, the least recently used ones are evicted beyond
+    `max_entries`, and everything is dropped when the index generation changes.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_entries: int = ANSWER_CACHE_SIZE,
+        ttl_s: float = ANSWER_CACHE_TTL_S,
+        similarity: float = ANSWER_CACHE_SIMILARITY,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self.similarity = similarity
+        self._entries: OrderedDict[tuple, _CacheEntry] = OrderedDict()
+        self._generation: tuple | None = None
+        self._lock = threading.Lock()
+        # Small vector index over cached query embeddings (rebuilt lazily).
+        self._matrix: np.ndarray | None = None
+        self._matrix_keys: list[tuple] = []
+
+    def _sync(self, generation: tuple) -> None:
+        if generation != self._generation:
+            self._entries.clear()
+            self._matrix = None
+            self._generation = generation
+
+    def _hit(self, key: tuple, now: float) -> AgentResponse | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires < now:
+            del self._entries[key]
+            self._matrix = None
+            return None
+        self._entries.move_to_end(key)
+        return entry.response
+
+    def get_exact(self, text: str, scope: tuple, generation: tuple) -> AgentResponse | None:
+        with self._lock:
+            self._sync(generation)
+            return self._hit((normalize_query(text), scope), time.time())
+
+    def get_similar(
+        self, vector: np.ndarray, scope: tuple, generation: tuple
+    ) -> tuple[AgentResponse, float] | None:
+        with self._lock:
+            self._sync(generation)
+            if self._matrix is None:
+                keys = [k for k, e in self._entries.items() if e.vector is not None]
+                self._matrix_keys = keys
+                self._matrix = np.stack([self._entries[k].vector for k in keys]) if keys else None
+            if self._matrix is None:
+                return None
+            sims = self._matrix @ vector
+            for row in np.argsort(-sims)[:8].tolist():
+                if sims[row] < self.similarity:
+                    break
+                key = self._matrix_keys[row]
+                if key[1] != scope:
+                    continue
+                res = self._hit(key, time.time())
+                if res is not None:
+                    return res, float(sims[row])
+            return None
+
+    def put(
+        self, text: str, scope: tuple, vector: np.ndarray | None, response: AgentResponse, generation: tuple
+    ) -> None:
+        with self._lock:
+            if generation != self._generation:
+                # The index changed while this answer was computed; don't cache it.
+                return
+            key = (normalize_query(text), scope)
+            self._entries[key] = _CacheEntry(
+                response=response, scope=scope, vector=vector, expires=time.time() + self.ttl_s
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+
+def _cite(r: Retrieved) -> str:
+    if r.start < 0:
+        return f"{r.source} (chunk {r.chunk_id})"
+    return f"{r.source} (chunk {r.chunk_id}, chars {r.start}-{r.end})"
+
+
+def _extractive_answer(user_text: str, retrieved: list[Retrieved]) -> str:
+    if not retrieved:
+        return "Je n'ai pas trouvé de document pertinent dans la base locale."
+    # Simple “grounded” response: show steps + citations.
+    top = retrieved[0]
+    return (
+        "Réponse (basée sur les documents locaux):\n\n"
+        f"{top.text}\n\n"
+        "Sources:\n"
+        + "\n".join(f"- {_cite(r)}" for r in retrieved)
+    )
+
+
+def _screen(user_text: str, logger: JsonlLogger) -> tuple[str, SafetyDecision, AgentResponse | None]:
+    """Safety + language check.
+
+    Returns the language, the safety decision (whose `text` has identifiers
+    replaced by placeholders and is what the rest of the pipeline, the cache
+    and the log see) and, if the request stops here, the response.
+    """
+
+    with span("safety_check") as t_safety:
+        safety = check_safety(user_text)
+    with span("language_detect") as t_lang:
+        lang = detect_language(safety.text)
+    logger.log("Log_Interaction", user_text=safety.text, language=lang, duration_ms=t_lang.ms)
+    logger.log(
+        "Safety_Check",
+        action=safety.action,
+        reason=safety.reason,
+        spans=[(sp.kind, sp.start, sp.end) for sp in safety.spans],
+        duration_ms=t_safety.ms,
+    )
+
+    if safety.action == "refuse":
+        answer = (
+            "Je ne peux pas traiter des données personnelles/sensibles ici. "
+            "Merci de retirer les identifiants (CIN, téléphone, email) ou contactez un agent." 
+            f"Raison: {safety.reason}"
+        )
+        logger.log("Generate_Response", mode="refusal")
+        return lang, safety, AgentResponse(
+            action="refuse",
+            answer=answer,
+            language=lang,
+            retrieved=[],
+            eval_hooks={
+                "after_Tool_Select": {"selected": "none", "reason": "safety_refusal"},
+                "after_Generate_Response": {"type": "refusal"},
+            },
+        )
+
+    if safety.action == "escalate":
+        answer = (
+            "Je vous redirige vers un agent humain pour ce cas. "
+            "Veuillez fournir votre demande sans données sensibles, ou via le canal officiel."
+        )
+        logger.log("Generate_Response", mode="escalation")
+        return lang, safety, AgentResponse(
+            action="escalate",
+            answer=answer,
+            language=lang,
+            retrieved=[],
+            eval_hooks={
+                "after_Tool_Select": {"selected": "human", "reason": "escalation_trigger"},
+                "after_Generate_Response": {"type": "escalation"},
+            },
+        )
+    return lang, safety, None
+
+
+def _redaction_note(safety: SafetyDecision) -> str:
+    return (
+        f"Note : les données personnelles ({', '.join(PLACEHOLDERS[k] for k in safety.redacted)}) ont été masquées ; "
+        "seule la partie procédurale de la demande a été traitée.\n\n"
+    )
+
+
+def _with_redaction(res: AgentResponse, safety: SafetyDecision) -> AgentResponse:
+    if safety.action != "redact":
+        return res
+    return replace(
+        res,
+        answer=_redaction_note(safety) + res.answer,
+        eval_hooks={**res.eval_hooks, "after_Safety_Check": {"action": "redact", "redacted": safety.redacted}},
+    )
+
+
+def _cache_lookup(
+    user_text: str,
+    rag: RagStore,
+    cache: AnswerCache,
+    scope: tuple,
+    logger: JsonlLogger,
+) -> tuple[AgentResponse | None, np.ndarray | None]:
+    """Return a cached response, or the query embedding to reuse for retrieval."""
+
+    generation = rag.generation
+    hit = _cache_exact(user_text, cache, scope, generation, logger)
+    if hit is not None:
+        return hit, None
+    vector = rag.embed_query(user_text)
+    return _cache_similar(vector, cache, scope, generation, logger), vector
+
+
+def _cache_exact(
+    user_text: str, cache: AnswerCache, scope: tuple, generation: tuple, logger: JsonlLogger
+) -> AgentResponse | None:
+    with span("answer_cache") as t:
+        hit = cache.get_exact(user_text, scope, generation)
+    if hit is None:
+        return None
+    REGISTRY.inc("assistant_answer_cache_total", "exact")
+    logger.log("Answer_Cache", hit="exact", duration_ms=t.ms)
+    return _with_hooks(hit, answer_cache={"hit": "exact"})
+
+
+def _cache_similar(
+    vector: np.ndarray, cache: AnswerCache, scope: tuple, generation: tuple, logger: JsonlLogger
+) -> AgentResponse | None:
+    with span("answer_cache") as t:
+        found = cache.get_similar(vector, scope, generation)
+    if found is not None:
+        res, sim = found
+        REGISTRY.inc("assistant_answer_cache_total", "semantic")
+        logger.log("Answer_Cache", hit="semantic", similarity=round(sim, 4), duration_ms=t.ms)
+        return _with_hooks(res, answer_cache={"hit": "semantic", "similarity": sim})
+    REGISTRY.inc("assistant_answer_cache_total", "miss")
+    logger.log("Answer_Cache", hit="miss", duration_ms=t.ms)
+    return None
+
+
+def _with_hooks(res: AgentResponse, **hooks: Any) -> AgentResponse:
+    return replace(res, eval_hooks={**res.eval_hooks, **hooks})
+
+
+def _retrieve(
+    user_text: str,
+    rag: RagStore,
+    logger: JsonlLogger,
+    top_k: int,
+    tuning: SearchTuning | None,
+    vector: np.ndarray | None = None,
+    filters: ChunkFilter | None = None,
+) -> list[Retrieved]:
+    # Tool selection: always retrieve first for procedural queries.
+    logger.log("Tool_Select", selected="retrieve", top_k=top_k, filters=asdict(filters) if filters else None)
+
+    timings: dict[str, Any] = {}  # index search_ms, plus shard_ms per shard on a sharded index
+    with span("retrieve") as t:
+        retrieved = rag.retrieve(
+            user_text, top_k=top_k, tuning=tuning, vector=vector, filters=filters, timings=timings
+        )
+    logger.log(
+        "Tool_Result",
+        selected="retrieve",
+        retrieved_count=len(retrieved),
+        retrieved_sources=[r.source for r in retrieved],
+        duration_ms=t.ms,
+        **timings,
+    )
+    return retrieved
+
+
+def _extractive_response(
+    user_text: str, lang: str, retrieved: list[Retrieved], logger: JsonlLogger
+) -> AgentResponse:
+    with span("generate_extractive") as t:
+        answer = _extractive_answer(user_text, retrieved)
+    logger.log("Generate_Response", mode="extractive", duration_ms=t.ms)
+    return AgentResponse(
+        action="retrieve_document",
+        answer=answer,
+        language=lang,
+        retrieved=retrieved,
+        eval_hooks={
+            "after_Tool_Select": {"selected": "retrieve"},
+            "after_Generate_Response": {"type": "extractive", "grounded": True},
+        },
+    )
+
+
+def _build_prompt(
+    user_text: str, retrieved: list[Retrieved], rag: RagStore, logger: JsonlLogger
+) -> tuple[str, dict[str, Any]]:
+    """Grounded prompt over merged, deduplicated passages packed into the token budget."""
+
+    count = llm_token_counter(LLM_TOKENIZER, rag.paths.hf_cache_dir)
+    with span("build_context") as t:
+        ctx = build_context(retrieved, count_tokens=count)
+        prompt = (
+            "You are a public administration assistant. Answer using ONLY the context. "
+            "If the context is insufficient, say so.\n\n"
+            f"User: {user_text}\n\nContext:\n{ctx.text}\n\nAnswer:"
+        )
+        hooks = ctx.hooks(count(prompt))
+    logger.log("Build_Context", duration_ms=t.ms, **hooks)
+    return prompt, hooks
+
+
+def _llm_response(
+    user_text: str,
+    lang: str,
+    retrieved: list[Retrieved],
+    llm: LlmResult,
+    logger: JsonlLogger,
+    duration_ms: float,
+    context: dict[str, Any],
+) -> AgentResponse:
+    if llm.prompt_tokens is not None:
+        # Ollama's own count of the evaluated prompt, for comparison with the estimate.
+        context = {**context, "prompt_eval_count": llm.prompt_tokens}
+    logger.log(
+        "Generate_Response",
+        mode="ollama",
+        model=llm.model,
+        duration_ms=duration_ms,
+        queue_ms=round(llm.queue_ms, 1),
+        attempts=llm.attempts,
+    )
+    return AgentResponse(
+        action="summarize_procedure",
+        answer=llm.text.strip() or _extractive_answer(user_text, retrieved),
+        language=lang,
+        retrieved=retrieved,
+        eval_hooks={
+            "after_Tool_Select": {"selected": "retrieve+generate", "model": llm.model},
+            "after_Build_Context": context,
+            "after_Generate_Response": {"type": "llm", "grounded": True},
+        },
+    )
+
+
+def _fallback_response(
+    user_text: str, lang: str, retrieved: list[Retrieved], logger: JsonlLogger, exc: LlmUnavailable
+) -> AgentResponse:
+    # The LLM is saturated or down: answer from the retrieved chunks rather than fail.
+    logger.log("LLM_Unavailable", reason=exc.reason, detail=str(exc))
+    res = _extractive_response(user_text, lang, retrieved, logger)
+    return _with_hooks(res, llm_fallback={"reason": exc.reason})
+
+
+def handle_query(
+    *,
+    user_text: str,
+    rag: RagStore,
+    logger: JsonlLogger,
+    top_k: int = 4,
+    allow_generation: bool = False,
+    tuning: SearchTuning | None = None,
+    filters: ChunkFilter | None = None,
+    cache: AnswerCache | None = None,
+    llm: OllamaClient | None = None,
+) -> AgentResponse:
+    """Agentic decision: safety -> tool selection -> retrieval -> response.
+
+    Evaluation hooks are emitted as structured fields. With a `cache`, allowed
+    queries are answered from it when the same (or a near-identical) question
+    was already answered against the current index. Generation goes through
+    `llm` (default: the process-wide client) and falls back to the extractive
+    answer when it is unavailable; such answers are not cached.
+    """
+
+    lang, safety, early = _screen(user_text, logger)
+    if early is not None:
+        return early
+    user_text = safety.text
+
+    scope = (top_k, allow_generation, tuning, filters)
+    vector = generation = None
+    if cache is not None:
+        generation = rag.generation
+        hit, vector = _cache_lookup(user_text, rag, cache, scope, logger)
+        if hit is not None:
+            return _with_redaction(hit, safety)
+
+    retrieved = _retrieve(user_text, rag, logger, top_k, tuning, vector, filters)
+
+    # In this prototype, generation is optional; we keep sovereignty by default.
+    if not allow_generation:
+        res = _extractive_response(user_text, lang, retrieved, logger)
+    else:
+        # Optional: connect a local LLM (e.g., Ollama). We keep the prompt grounded.
+        prompt, context = _build_prompt(user_text, retrieved, rag, logger)
+        try:
+            with span("generate_llm") as t:
+                out = (llm or default_client()).generate(prompt)
+        except LlmUnavailable as exc:
+            return _with_redaction(_fallback_response(user_text, lang, retrieved, logger, exc), safety)
+        res = _llm_response(user_text, lang, retrieved, out, logger, t.ms, context)
+
+    if cache is None:
+        return _with_redaction(res, safety)
+    cache.put(user_text, scope, vector, res, generation)
+    return _with_redaction(_with_hooks(res, answer_cache={"hit": "miss"}), safety)
+
+
+async def handle_query_async(
+    *,
+    user_text: str,
+    rag: RagStore,
+    logger: JsonlLogger,
+    executor: Executor,
+    llm: OllamaClient,
+    top_k: int = 4,
+    allow_generation: bool = False,
+    tuning: SearchTuning | None = None,
+    filters: ChunkFilter | None = None,
+    cache: AnswerCache | None = None,
+) -> AgentResponse:
+    """Same pipeline as `handle_query` without blocking the event loop.
+
+    CPU-bound steps (language detection, embedding, search) run on `executor`;
+    generation goes through the shared `llm` client.
+    """
+
+    loop = asyncio.get_running_loop()
+    lang, safety, early = await loop.run_in_executor(executor, _screen, user_text, logger)
+    if early is not None:
+        return early
+    user_text = safety.text
+
+    scope = (top_k, allow_generation, tuning, filters)
+    vector = generation = None
+    if cache is not None:
+        generation = rag.generation
+        hit, vector = await loop.run_in_executor(executor, _cache_lookup, user_text, rag, cache, scope, logger)
+        if hit is not None:
+            return _with_redaction(hit, safety)
+
+    retrieved = await loop.run_in_executor(
+        executor, _retrieve, user_text, rag, logger, top_k, tuning, vector, filters
+    )
+    return await _respond_async(
+        user_text, lang, safety, retrieved, vector, rag=rag, logger=logger, executor=executor, llm=llm,
+        allow_generation=allow_generation, cache=cache, scope=scope, generation=generation,
+    )
+
+
+async def _respond_async(
+    user_text: str,
+    lang: str,
+    safety: SafetyDecision,
+    retrieved: list[Retrieved],
+    vector: np.ndarray | None,
+    *,
+    rag: RagStore,
+    logger: JsonlLogger,
+    executor: Executor,
+    llm: OllamaClient,
+    allow_generation: bool,
+    cache: AnswerCache | None,
+    scope: tuple,
+    generation: tuple | None,
+) -> AgentResponse:
+    # Answer from the retrieved chunks (extractive or generated), then cache it.
+    loop = asyncio.get_running_loop()
+    if not allow_generation:
+        res = _extractive_response(user_text, lang, retrieved, logger)
+    else:
+        prompt, context = await loop.run_in_executor(executor, _build_prompt, user_text, retrieved, rag, logger)
+        try:
+            with span("generate_llm") as t:
+                out = await llm.agenerate(prompt)
+        except LlmUnavailable as exc:
+            return _with_redaction(_fallback_response(user_text, lang, retrieved, logger, exc), safety)
+        res = _llm_response(user_text, lang, retrieved, out, logger, t.ms, context)
+
+    if cache is None:
+        return _with_redaction(res, safety)
+    cache.put(user_text, scope, vector, res, generation)
+    return _with_redaction(_with_hooks(res, answer_cache={"hit": "miss"}), safety)
+
+
+@dataclass
+class _BatchItem:
+    lang: str
+    safety: SafetyDecision
+    res: AgentResponse | None = None  # refusal, escalation or cache hit
+    vector: np.ndarray | None = None
+    retrieved: list[Retrieved] | None = None
+
+
+def _prepare_batch(
+    texts: list[str],
+    rag: RagStore,
+    logger: JsonlLogger,
+    cache: AnswerCache | None,
+    scope: tuple,
+    top_k: int,
+    tuning: SearchTuning | None,
+    filters: ChunkFilter | None,
+) -> tuple[list[_BatchItem], tuple | None]:
+    """Screening, answer-cache lookups and retrieval of a whole batch in one call.
+
+    Cache misses are embedded in one encode call and searched with one
+    `retrieve_many`, instead of one pipeline per text.
+    """
+
+    items = []
+    for text in texts:
+        lang, safety, early = _screen(text, logger)
+        items.append(_BatchItem(lang=lang, safety=safety, res=early))
+    todo = [it for it in items if it.res is None]
+    generation = None
+    if cache is not None:
+        generation = rag.generation
+        misses = []
+        for it in todo:
+            it.res = _cache_exact(it.safety.text, cache, scope, generation, logger)
+            if it.res is None:
+                misses.append(it)
+        todo = []
+        for it, vector in zip(misses, rag.embed_queries([it.safety.text for it in misses])):
+            it.vector = vector
+            it.res = _cache_similar(vector, cache, scope, generation, logger)
+            if it.res is None:
+                todo.append(it)
+    if todo:
+        texts_todo = [it.safety.text for it in todo]
+        for text in texts_todo:
+            logger.log("Tool_Select", selected="retrieve", top_k=top_k, filters=asdict(filters) if filters else None)
+        vectors = [it.vector for it in todo] if cache is not None else None
+        with span("retrieve") as t:
+            results = rag.retrieve_many(texts_todo, top_k=top_k, tuning=tuning, filters=filters, vectors=vectors)
+        for it, retrieved in zip(todo, results):
+            it.retrieved = retrieved
+            logger.log(
+                "Tool_Result",
+                selected="retrieve",
+                retrieved_count=len(retrieved),
+                retrieved_sources=[r.source for r in retrieved],
+                duration_ms=t.ms,
+                batch=len(todo),
+            )
+    return items, generation
+
+
+async def handle_batch_async(
+    *,
+    texts: list[str],
+    rag: RagStore,
+    logger: JsonlLogger,
+    executor: Executor,
+    llm: OllamaClient,
+    top_k: int = 4,
+    allow_generation: bool = False,
+    tuning: SearchTuning | None = None,
+    filters: ChunkFilter | None = None,
+    cache: AnswerCache | None = None,
+) -> list[AgentResponse]:
+    """Batch form of `handle_query_async`, one response per text.
+
+    Everything up to retrieval runs as a single `executor` job, so a large
+    batch shares one encode and one index search and holds one worker
+    instead of all of them. Generation, when allowed, then runs per text.
+    """
+
+    loop = asyncio.get_running_loop()
+    scope = (top_k, allow_generation, tuning, filters)
+    items, generation = await loop.run_in_executor(
+        executor, _prepare_batch, texts, rag, logger, cache, scope, top_k, tuning, filters
+    )
+
+    async def respond(it: _BatchItem) -> AgentResponse:
+        if it.res is not None:
+            return _with_redaction(it.res, it.safety)
+        return await _respond_async(
+            it.safety.text, it.lang, it.safety, it.retrieved, it.vector, rag=rag, logger=logger, executor=executor,
+            llm=llm, allow_generation=allow_generation, cache=cache, scope=scope, generation=generation,
+        )
+
+    return list(await asyncio.gather(*(respond(it) for it in items)))
+
+
+async def stream_query(
+    *,
+    user_text: str,
+    rag: RagStore,
+    logger: JsonlLogger,
+    executor: Executor,
+    llm: OllamaClient,
+    top_k: int = 4,
+    allow_generation: bool = True,
+    tuning: SearchTuning | None = None,
+    filters: ChunkFilter | None = None,
+) -> AsyncIterator[tuple[str, dict[str, Any]]]:
+    """Streaming variant of `handle_query_async` yielding (event, data) pairs.
+
+    Events: `sources` first (as soon as retrieval is done), then `token` for each
+    generated piece, then `done` with the action and evaluation hooks. Refusals
+    and escalations skip straight to `done`.
+    """
+
+    loop = asyncio.get_running_loop()
+    lang, safety, early = await loop.run_in_executor(executor, _screen, user_text, logger)
+    if early is not None:
+        yield "done", {"action": early.action, "answer": early.answer, "language": lang, "eval_hooks": early.eval_hooks}
+        return
+    user_text = safety.text
+
+    retrieved = await loop.run_in_executor(
+        executor, _retrieve, user_text, rag, logger, top_k, tuning, None, filters
+    )
+    yield "sources", {
+        "language": lang,
+        "sources": [
+            {"source": r.source, "chunk_id": r.chunk_id, "start": r.start, "end": r.end, "score": r.score}
+            for r in retrieved
+        ],
+    }
+    if safety.action == "redact":
+        yield "token", {"text": _redaction_note(safety)}
+    redaction = {}
+    if safety.action == "redact":
+        redaction = {"after_Safety_Check": {"action": "redact", "redacted": safety.redacted}}
+
+    if not allow_generation:
+        res = _extractive_response(user_text, lang, retrieved, logger)
+        yield "token", {"text": res.answer}
+        yield "done", {"action": res.action, "language": lang, "eval_hooks": {**res.eval_hooks, **redaction}}
+        return
+
+    prompt, context = await loop.run_in_executor(executor, _build_prompt, user_text, retrieved, rag, logger)
+    t0 = time.perf_counter()
+    ttft_ms: float | None = None
+    pieces = 0
+    try:
+        async for token in llm.astream(prompt):
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - t0) * 1000
+                REGISTRY.histogram(STAGE_METRIC, "generate_ttft").observe(ttft_ms / 1000)
+            pieces += 1
+            yield "token", {"text": token}
+    except LlmUnavailable as exc:
+        if pieces:
+            raise
+        res = _fallback_response(user_text, lang, retrieved, logger, exc)
+        yield "token", {"text": res.answer}
+        yield "done", {"action": res.action, "language": lang, "eval_hooks": {**res.eval_hooks, **redaction}}
+        return
+    total_ms = (time.perf_counter() - t0) * 1000
+    REGISTRY.histogram(STAGE_METRIC, "generate_stream").observe(total_ms / 1000)
+
+    logger.log(
+        "Generate_Response",
+        mode="ollama_stream",
+        model=llm.model,
+        ttft_ms=round(ttft_ms, 1) if ttft_ms is not None else None,
+        total_ms=round(total_ms, 1),
+        tokens=pieces,
+    )
+    yield "done", {
+        "action": "summarize_procedure",
+        "language": lang,
+        "eval_hooks": {
+            "after_Tool_Select": {"selected": "retrieve+generate", "model": llm.model},
+            "after_Build_Context": context,
+            "after_Generate_Response": {"type": "llm", "grounded": True, "stream": True},
+            **redaction,
+        },
+    }
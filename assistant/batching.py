@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import os
+import queue
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+from typing import Callable, Generic, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class MicroBatcher(Generic[T, R]):
+    """Coalesces concurrent single-item calls into one batched call.
+
+    The first item opens a window of `max_wait_ms`; everything submitted before
+    it closes (up to `max_batch` items) is passed to `fn` in one call. `fn` must
+    return one result per item, in order. If a batch raises, its items are
+    retried one by one, so an error only reaches the caller whose item caused
+    it. A forked child gets its own queue and worker thread (threads do not
+    survive `fork`).
+    """
+
+    def __init__(self, fn: Callable[[list[T]], list[R]], *, max_batch: int = 32, max_wait_ms: float = 3.0) -> None:
+        self._fn = fn
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_ms / 1000.0
+        self._start()
+        if hasattr(os, "register_at_fork"):
+            ref = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: (b := ref()) is not None and b._start())
+
+    def _start(self) -> None:
+        self._queue: queue.Queue[tuple[T, Future[R]]] = queue.Queue()
+        self._thread = threading.Thread(target=self._loop, name="micro-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: T) -> Future[R]:
+        fut: Future[R] = Future()
+        self._queue.put((item, fut))
+        return fut
+
+    def run(self, item: T) -> R:
+        return self.submit(item).result()
+
+    def _loop(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait_s
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            items = [item for item, _ in batch]
+            try:
+                results = self._fn(items)
+            except BaseException as exc:
+                if len(batch) == 1:
+                    batch[0][1].set_exception(exc)
+                else:
+                    self._run_each(batch)
+                continue
+            for (_, fut), res in zip(batch, results, strict=True):
+                fut.set_result(res)
+
+    def _run_each(self, batch: list[tuple[T, Future[R]]]) -> None:
+        # One bad item (or a transient failure) must not fail every caller of the batch.
+        for item, fut in batch:
+            try:
+                (res,) = self._fn([item])
+            except BaseException as exc:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(res)
@@ -1,48 +1,236 @@
-from __future__ import annotations
-
-import os
-from dataclasses import dataclass
-from pathlib import Path
-
-
-@dataclass(frozen=True)
-class Paths:
-    base_dir: Path
-
-    @property
-    def data_raw(self) -> Path:
-        return self.base_dir / "data" / "raw"
-
-    @property
-    def data_index(self) -> Path:
-        return self.base_dir / "data" / "index"
-
-    @property
-    def faiss_index_path(self) -> Path:
-        return self.data_index / "docs.faiss"
-
-    @property
-    def meta_path(self) -> Path:
-        return self.data_index / "docs_meta.json"
-
-    @property
-    def run_log_path(self) -> Path:
-        return self.base_dir / "reports" / "run.log"
-
-    @property
-    def eval_report_path(self) -> Path:
-        return self.base_dir / "reports" / "evaluation_report.md"
-
-    @property
-    def hf_cache_dir(self) -> Path:
-        # Local cache to avoid re-downloading embedding models.
-        return self.data_index / "hf_cache"
-
-
-DEFAULT_EMBED_MODEL = os.getenv(
-    "EMBED_MODEL",
-    "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
-)
-DEFAULT_TOP_K = 4
-DEFAULT_CHUNK_SIZE = 900
-DEFAULT_CHUNK_OVERLAP = 120
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+
+@dataclass(frozen=True)
+class IndexFiles:
+    """Files of one index generation, published together under `root`."""
+
+    root: Path
+
+    @property
+    def faiss_index_path(self) -> Path:
+        return self.root / "docs.faiss"
+
+    @property
+    def meta_path(self) -> Path:
+        return self.root / "docs_meta.bin"
+
+    @property
+    def index_settings_path(self) -> Path:
+        # Index kind and default search-time parameters of the published index.
+        return self.root / "docs_index.json"
+
+    @property
+    def lexical_index_path(self) -> Path:
+        # BM25 postings over the same chunk ids as docs.faiss.
+        return self.root / "docs_bm25.bin"
+
+    @property
+    def manifest_path(self) -> Path:
+        # Per-file and per-chunk content hashes used by incremental ingestion.
+        return self.root / "docs_manifest.json"
+
+    def shard_path(self, shard: int) -> Path:
+        # One FAISS file per shard when the index is sharded (IndexSettings.shards > 1).
+        return self.root / "shards" / f"docs.{shard:03d}.faiss"
+
+
+@dataclass(frozen=True)
+class Paths:
+    base_dir: Path
+
+    @property
+    def data_raw(self) -> Path:
+        return self.base_dir / "data" / "raw"
+
+    @property
+    def data_index(self) -> Path:
+        return self.base_dir / "data" / "index"
+
+    @property
+    def legacy_files(self) -> IndexFiles:
+        # Layout written before generation directories: everything directly in data/index.
+        return IndexFiles(self.data_index)
+
+    def generation_files(self, seq: int) -> IndexFiles:
+        return IndexFiles(self.data_index / "gen" / f"{seq:06d}")
+
+    @property
+    def faiss_index_path(self) -> Path:
+        return self.legacy_files.faiss_index_path
+
+    @property
+    def meta_path(self) -> Path:
+        return self.legacy_files.meta_path
+
+    @property
+    def legacy_meta_path(self) -> Path:
+        # Pretty-printed JSON written by earlier versions; see scripts/convert_meta.py.
+        return self.data_index / "docs_meta.json"
+
+    @property
+    def manifest_path(self) -> Path:
+        # Where generations published before the manifest moved into them keep it.
+        return self.legacy_files.manifest_path
+
+    @property
+    def embed_cache_path(self) -> Path:
+        return self.data_index / "embed_cache.sqlite"
+
+    @property
+    def ingest_lock_path(self) -> Path:
+        # Held for the whole of an ingest, so rebuilds from any process run one at a time.
+        return self.data_index / "ingest.lock"
+
+    @property
+    def ingest_jobs_dir(self) -> Path:
+        # State of /ingest jobs, readable from every API worker.
+        return self.data_index / "jobs"
+
+    @property
+    def generation_path(self) -> Path:
+        # Names the published generation directory. Replacing it is the one commit point of
+        # an ingest; readers reload when it changes.
+        return self.data_index / "docs.gen"
+
+    @property
+    def run_log_path(self) -> Path:
+        return self.base_dir / "reports" / "run.log"
+
+    @property
+    def eval_report_path(self) -> Path:
+        return self.base_dir / "reports" / "evaluation_report.md"
+
+    @property
+    def index_report_path(self) -> Path:
+        return self.base_dir / "reports" / "index_report.md"
+
+    @property
+    def hf_cache_dir(self) -> Path:
+        # Local cache to avoid re-downloading embedding models.
+        return self.data_index / "hf_cache"
+
+    @property
+    def onnx_dir(self) -> Path:
+        # Embedding models exported by scripts/download_embedding_model.py --export-onnx.
+        return self.data_index / "onnx"
+
+
+DEFAULT_EMBED_MODEL = os.getenv(
+    "EMBED_MODEL",
+    "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
+)
+# sentence-transformers (PyTorch) | onnx | onnx-int8 (ONNX Runtime, exported beforehand)
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "sentence-transformers")
+EMBED_ONNX_THREADS = int(os.getenv("EMBED_ONNX_THREADS", "0"))  # 0 = ONNX Runtime default
+DEFAULT_TOP_K = 4
+# Largest top_k a request may ask for; search and rerank cost grow with it.
+MAX_TOP_K = int(os.getenv("MAX_TOP_K", "50"))
+# Micro-batching of concurrent /query embeddings: wait up to N ms or M queries.
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "3"))
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", "32"))
+# Answer cache for repeated citizen questions (exact + near-duplicate matches).
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "1024"))
+ANSWER_CACHE_TTL_S = float(os.getenv("ANSWER_CACHE_TTL_S", "3600"))
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+# dense | hybrid (dense + BM25 fused by reciprocal rank) | lexical
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Candidates taken from each ranking before fusion.
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "50"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+# Filtered searches matching at most this many chunks scan just their vectors.
+FILTER_EXACT_MAX = int(os.getenv("FILTER_EXACT_MAX", "2048"))
+FILTER_CACHE_SIZE = int(os.getenv("FILTER_CACHE_SIZE", "32"))
+
+# Optional cross-encoder second stage (RERANK=1): over-fetch, rescore, keep top_k.
+RERANK_ENABLED = os.getenv("RERANK", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "20"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "200"))
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", "50000"))
+# Even when the cost estimate says a pass cannot fit, try one every N seconds so a
+# stale estimate (a slow cold pass, a load spike) does not disable reranking for good.
+RERANK_PROBE_S = float(os.getenv("RERANK_PROBE_S", "30"))
+
+# Prompt context for the local LLM: merged passages packed best-first into this many
+# tokens. LLM_TOKENIZER (HF id or local dir matching the Ollama model) gives exact
+# counts; without it tokens are estimated as characters / LLM_CHARS_PER_TOKEN.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+LLM_TOKENIZER = os.getenv("LLM_TOKENIZER", "")
+LLM_CHARS_PER_TOKEN = int(os.getenv("LLM_CHARS_PER_TOKEN", "3"))
+
+# Local Ollama server. KEEP_ALIVE keeps the model loaded between requests; NUM_THREAD=0
+# lets Ollama pick. At most MAX_CONCURRENT generations run at once; requests queued
+# longer than QUEUE_TIMEOUT_S get the extractive answer instead.
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1:8b")
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_NUM_CTX = int(os.getenv("OLLAMA_NUM_CTX", "4096"))
+OLLAMA_NUM_THREAD = int(os.getenv("OLLAMA_NUM_THREAD", "0"))
+OLLAMA_MAX_CONCURRENT = int(os.getenv("OLLAMA_MAX_CONCURRENT", "1"))
+OLLAMA_QUEUE_TIMEOUT_S = float(os.getenv("OLLAMA_QUEUE_TIMEOUT_S", "10"))
+OLLAMA_TIMEOUT_S = float(os.getenv("OLLAMA_TIMEOUT_S", "120"))
+OLLAMA_RETRIES = int(os.getenv("OLLAMA_RETRIES", "2"))
+
+# Startup warmup: query encodes + searches at these batch sizes before /ready turns 200.
+WARMUP_BATCH_SIZES = tuple(int(x) for x in os.getenv("WARMUP_BATCH_SIZES", "1,8,32").split(",") if x.strip())
+
+# Language identification (assistant/langid.py): results memoized for this many distinct
+# requests; only the first LANGID_MAX_CHARS characters of a text are scored.
+LANGID_CACHE_SIZE = int(os.getenv("LANGID_CACHE_SIZE", "4096"))
+LANGID_MAX_CHARS = int(os.getenv("LANGID_MAX_CHARS", "1000"))
+
+# Shared retrieval across API workers. RETRIEVAL_SERVICE ("unix:/path/to.sock" or
+# "host:port") sends embedding and search to one scripts/retrieval_service.py process
+# instead of loading the model in every worker. INDEX_MMAP=1 maps the FAISS index
+# read-only from disk, so workers on one host share its pages (metadata and BM25
+# postings are always mapped).
+RETRIEVAL_SERVICE = os.getenv("RETRIEVAL_SERVICE", "")
+RETRIEVAL_SERVICE_TIMEOUT_S = float(os.getenv("RETRIEVAL_SERVICE_TIMEOUT_S", "30"))
+INDEX_MMAP = os.getenv("INDEX_MMAP", "0") == "1"
+
+# Threads dedicated to language detection, embedding and index search in the API.
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "8"))
+DEFAULT_CHUNK_SIZE = 900
+DEFAULT_CHUNK_OVERLAP = 120
+# Also cut chunks at the embedding model's max sequence length (needs its tokenizer).
+CHUNK_TOKEN_AWARE = os.getenv("CHUNK_TOKEN_AWARE", "0") == "1"
+# Upper bound for the on-disk embedding cache (least recently used rows are evicted).
+EMBED_CACHE_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Ingestion: extraction processes and how many new chunks are embedded per batch.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))
+
+
+@dataclass(frozen=True)
+class IndexSettings:
+    """Vector index layout: Flat (exact), IVF-Flat, IVF-PQ or HNSW."""
+
+    kind: str = "Flat"
+    nlist: int = 0  # 0 = derived from corpus size at training time
+    pq_m: int = 16  # PQ sub-quantizers; must divide the embedding dimension
+    hnsw_m: int = 32
+    ef_construction: int = 80
+    nprobe: int = 16
+    ef_search: int = 64
+    train_sample: int = 50_000
+    # Vectors split over this many FAISS files, by chunk id ("hash"), "source" file or "domain".
+    shards: int = 1
+    shard_by: str = "hash"
+
+
+DEFAULT_INDEX_SETTINGS = IndexSettings(
+    kind=os.getenv("INDEX_KIND", "Flat"),
+    nlist=int(os.getenv("INDEX_NLIST", "0")),
+    pq_m=int(os.getenv("INDEX_PQ_M", "16")),
+    nprobe=int(os.getenv("INDEX_NPROBE", "16")),
+    ef_search=int(os.getenv("INDEX_EF_SEARCH", "64")),
+    shards=int(os.getenv("INDEX_SHARDS", "1")),
+    shard_by=os.getenv("INDEX_SHARD_BY", "hash"),
+)
+# Threads searching shards in parallel (one query batch fans out to every shard).
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", str(min(8, os.cpu_count() or 1))))
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable
+
+from assistant.config import CONTEXT_TOKEN_BUDGET, DEFAULT_CHUNK_OVERLAP, LLM_CHARS_PER_TOKEN, LLM_TOKENIZER
+from assistant.embed_cache import text_sha256
+from assistant.rag_store import Retrieved
+
+_SEPARATOR = "\n\n---\n\n"
+
+
+@dataclass(frozen=True)
+class Passage:
+    """Contiguous text of one source, made of one or more retrieved chunks."""
+
+    source: str
+    chunk_ids: tuple[int, ...]
+    text: str
+    score: float  # best score among its chunks
+    start: int = -1
+    end: int = -1
+
+    def header(self) -> str:
+        chunks = ",".join(str(c) for c in self.chunk_ids)
+        where = f" chars={self.start}-{self.end}" if self.start >= 0 else ""
+        return f"[source={self.source} chunk={chunks}{where} score={self.score:.3f}]"
+
+
+@dataclass(frozen=True)
+class PackedContext:
+    text: str
+    passages: list[Passage]
+    tokens: int  # context only, measured with the LLM tokenizer
+    merged: int  # chunks folded into a neighbour of the same source
+    duplicates: int  # chunks whose text was already present
+    dropped: int  # passages left out by the token budget
+    tokenizer: str
+
+    def hooks(self, prompt_tokens: int) -> dict:
+        return {
+            "prompt_tokens": prompt_tokens,
+            "context_tokens": self.tokens,
+            "passages": len(self.passages),
+            "merged": self.merged,
+            "duplicates": self.duplicates,
+            "dropped": self.dropped,
+            "tokenizer": self.tokenizer,
+        }
+
+
+@lru_cache(maxsize=4)
+def llm_token_counter(name: str = LLM_TOKENIZER, cache_dir: Path | None = None) -> Callable[[str], int]:
+    """Token counter for prompts sent to the LLM.
+
+    `name` is a Hugging Face tokenizer id or a local directory matching the
+    Ollama model. Without one, tokens are estimated from the character count.
+    """
+
+    if not name:
+        return lambda text: -(-len(text) // LLM_CHARS_PER_TOKEN) if text else 0
+    from transformers import AutoTokenizer
+
+    tok = AutoTokenizer.from_pretrained(name, cache_dir=str(cache_dir) if cache_dir else None)
+    return lambda text: len(tok.encode(text, add_special_tokens=False))
+
+
+def _suffix_prefix(a: str, b: str, limit: int) -> int:
+    """Length of the longest suffix of `a` (at most `limit` chars) that starts `b`."""
+
+    for n in range(min(limit, len(a), len(b)), 0, -1):
+        if a.endswith(b[:n]):
+            return n
+    return 0
+
+
+def merge_chunks(retrieved: list[Retrieved], *, overlap: int = DEFAULT_CHUNK_OVERLAP) -> tuple[list[Passage], int, int]:
+    """Fold overlapping or adjacent chunks of one source into passages.
+
+    Chunks with offsets are merged when their spans touch; older chunks without
+    offsets when their chunk ids are consecutive, dropping the text they share.
+    Chunks with the same text as an earlier one (e.g. boilerplate repeated
+    across forms) are dropped. Returns `(passages, merged, duplicates)`.
+    """
+
+    seen: set[str] = set()
+    duplicates = 0
+    by_source: dict[str, list[Retrieved]] = {}
+    for r in retrieved:
+        key = text_sha256(r.text.strip())
+        if key in seen:
+            duplicates += 1
+            continue
+        seen.add(key)
+        by_source.setdefault(r.source, []).append(r)
+
+    passages: list[Passage] = []
+    merged = 0
+    for source, items in by_source.items():
+        items.sort(key=lambda r: (r.start, r.chunk_id) if r.start >= 0 else (-1, r.chunk_id))
+        cur: Passage | None = None
+        last_id = -2
+        for r in items:
+            if cur is not None and r.start >= 0 and cur.start >= 0 and r.start <= cur.end + 2:
+                # Spans overlap or are separated by whitespace only: text is doc[start:end].
+                if r.end > cur.end:
+                    tail = r.text[cur.end - r.start :] if r.start < cur.end else "\n" + r.text
+                    cur = Passage(source, cur.chunk_ids + (r.chunk_id,), cur.text + tail,
+                                  max(cur.score, r.score), cur.start, r.end)
+                else:
+                    cur = Passage(source, cur.chunk_ids + (r.chunk_id,), cur.text,
+                                  max(cur.score, r.score), cur.start, cur.end)
+                merged += 1
+            elif cur is not None and r.start < 0 and cur.start < 0 and r.chunk_id == last_id + 1:
+                shared = _suffix_prefix(cur.text, r.text, overlap)
+                tail = r.text[shared:] if shared else "\n" + r.text
+                cur = Passage(source, cur.chunk_ids + (r.chunk_id,), cur.text + tail, max(cur.score, r.score))
+                merged += 1
+            else:
+                if cur is not None:
+                    passages.append(cur)
+                cur = Passage(source, (r.chunk_id,), r.text, r.score, r.start, r.end)
+            last_id = r.chunk_id
+        if cur is not None:
+            passages.append(cur)
+    return passages, merged, duplicates
+
+
+def build_context(
+    retrieved: list[Retrieved],
+    *,
+    budget_tokens: int = CONTEXT_TOKEN_BUDGET,
+    count_tokens: Callable[[str], int] | None = None,
+    tokenizer: str = LLM_TOKENIZER,
+) -> PackedContext:
+    """Merge, deduplicate and pack passages, best score first, into `budget_tokens`.
+
+    A passage that does not fit is skipped so a smaller, lower-ranked one can
+    still use the rest of the budget. If not even the best passage fits, its
+    leading part is kept so the model always gets some grounding.
+    """
+
+    count = count_tokens or llm_token_counter()
+    passages, merged, duplicates = merge_chunks(retrieved)
+    passages.sort(key=lambda p: p.score, reverse=True)
+
+    sep = count(_SEPARATOR)
+    used = 0
+    packed: list[Passage] = []
+    blocks: list[str] = []
+    for p in passages:
+        block = f"{p.header()}\n{p.text}"
+        cost = count(block) + (sep if blocks else 0)
+        if budget_tokens > 0 and used + cost > budget_tokens:
+            continue
+        packed.append(p)
+        blocks.append(block)
+        used += cost
+    if not packed and passages and budget_tokens > 0:
+        p = passages[0]
+        block = f"{p.header()}\n{p.text}"
+        keep = len(block) * budget_tokens // max(1, count(block))
+        while keep > 0 and count(block[:keep]) > budget_tokens:
+            keep = keep * 9 // 10
+        if keep > 0:
+            packed.append(p)
+            blocks.append(block[:keep])
+            used = count(blocks[0])
+
+    return PackedContext(
+        text=_SEPARATOR.join(blocks),
+        passages=packed,
+        tokens=used,
+        merged=merged,
+        duplicates=duplicates,
+        dropped=len(passages) - len(packed),
+        tokenizer=tokenizer or f"estimate:{LLM_CHARS_PER_TOKEN}",
+    )
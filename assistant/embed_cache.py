@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class CacheStats:
+    hits: int
+    misses: int
+    bytes: int
+    evicted: int
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk float32 embedding cache keyed by (model, normalize flag, text sha256).
+
+    Least-recently-used rows are evicted once the stored vectors exceed `max_bytes`.
+    Their total size is kept in a `totals` row, updated in the same transaction as
+    every insert and eviction and recounted only when the cache is opened.
+    """
+
+    def __init__(self, path: Path, *, max_bytes: int) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as db, db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, normalized INTEGER NOT NULL, sha256 TEXT NOT NULL,"
+                " dim INTEGER NOT NULL, vec BLOB NOT NULL, last_used REAL NOT NULL,"
+                " PRIMARY KEY (model, normalized, sha256))"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS embeddings_lru ON embeddings(last_used)")
+            db.execute("CREATE TABLE IF NOT EXISTS totals (name TEXT PRIMARY KEY, bytes INTEGER NOT NULL)")
+            db.execute(
+                "INSERT OR REPLACE INTO totals VALUES"
+                " ('vec', (SELECT COALESCE(SUM(length(vec)), 0) FROM embeddings))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30.0)
+
+    def get_many(self, model: str, normalized: bool, keys: list[str]) -> dict[str, np.ndarray]:
+        found: dict[str, np.ndarray] = {}
+        if not keys:
+            return found
+        now = time.time()
+        with closing(self._connect()) as db, db:
+            # Stay below SQLite's bound-parameter limit.
+            for i in range(0, len(keys), 500):
+                batch = keys[i : i + 500]
+                marks = ",".join("?" * len(batch))
+                rows = db.execute(
+                    f"SELECT sha256, vec FROM embeddings WHERE model = ? AND normalized = ? AND sha256 IN ({marks})",
+                    (model, int(normalized), *batch),
+                ).fetchall()
+                for sha, vec in rows:
+                    found[sha] = np.frombuffer(vec, dtype="<f4")
+                db.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND normalized = ? AND sha256 = ?",
+                    [(now, model, int(normalized), sha) for sha, _ in rows],
+                )
+        return found
+
+    def put_many(self, model: str, normalized: bool, keys: list[str], vectors: np.ndarray) -> int:
+        """Store vectors, then evict down to `max_bytes`. Returns the number of evicted rows."""
+
+        now = time.time()
+        vecs = np.asarray(vectors, dtype="<f4")
+        blobs = {k: v.tobytes() for k, v in zip(keys, vecs)}  # a repeated key is stored once
+        with closing(self._connect()) as db, db:
+            # Take the write lock first, so the replaced sizes read below stay exact.
+            db.execute("BEGIN IMMEDIATE")
+            replaced = self._stored_bytes(db, model, normalized, list(blobs))
+            db.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?, ?)",
+                [(model, int(normalized), k, vecs.shape[1], blob, now) for k, blob in blobs.items()],
+            )
+            total = self._add_bytes(db, sum(map(len, blobs.values())) - replaced)
+            return self._evict(db, total)
+
+    @staticmethod
+    def _stored_bytes(db: sqlite3.Connection, model: str, normalized: bool, keys: list[str]) -> int:
+        size = 0
+        for i in range(0, len(keys), 500):
+            batch = keys[i : i + 500]
+            marks = ",".join("?" * len(batch))
+            size += db.execute(
+                "SELECT COALESCE(SUM(length(vec)), 0) FROM embeddings"
+                f" WHERE model = ? AND normalized = ? AND sha256 IN ({marks})",
+                (model, int(normalized), *batch),
+            ).fetchone()[0]
+        return int(size)
+
+    @staticmethod
+    def _add_bytes(db: sqlite3.Connection, delta: int) -> int:
+        db.execute("UPDATE totals SET bytes = bytes + ? WHERE name = 'vec'", (delta,))
+        return int(db.execute("SELECT bytes FROM totals WHERE name = 'vec'").fetchone()[0])
+
+    def _evict(self, db: sqlite3.Connection, total: int) -> int:
+        if total <= self.max_bytes:
+            return 0
+        start = total
+        evicted = 0
+        # Drop oldest rows in batches until we are back under the bound.
+        while total > self.max_bytes:
+            rows = db.execute(
+                "SELECT rowid, length(vec) FROM embeddings ORDER BY last_used LIMIT 1000"
+            ).fetchall()
+            if not rows:
+                total = 0
+                break
+            drop = []
+            for rowid, size in rows:
+                drop.append((rowid,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+            db.executemany("DELETE FROM embeddings WHERE rowid = ?", drop)
+            evicted += len(drop)
+        self._add_bytes(db, total - start)
+        return evicted
+
+    def size_bytes(self) -> int:
+        with closing(self._connect()) as db:
+            return int(db.execute("SELECT bytes FROM totals WHERE name = 'vec'").fetchone()[0])
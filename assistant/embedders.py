@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import json
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Protocol
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from sentence_transformers import SentenceTransformer
+
+BACKENDS = ("sentence-transformers", "onnx", "onnx-int8")
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+EXPORT_CONFIG = "embedder.json"
+
+
+class Embedder(Protocol):
+    """Sentence encoder returning L2-normalized float32 rows."""
+
+    backend: str
+    dim: int
+    max_seq_length: int
+
+    def encode(self, texts: list[str], *, batch_size: int = 32) -> np.ndarray: ...
+
+    def count_tokens(self, text: str) -> int: ...
+
+
+@dataclass(frozen=True)
+class ExportConfig:
+    """Written next to an exported ONNX model; everything needed to run it without torch."""
+
+    source_model: str
+    dim: int
+    max_seq_length: int
+    pooling: str  # mean | cls
+    pad_id: int
+    pad_token: str
+
+    @classmethod
+    def load(cls, model_dir: Path) -> ExportConfig:
+        return cls(**json.loads((model_dir / EXPORT_CONFIG).read_text(encoding="utf-8")))
+
+    def save(self, model_dir: Path) -> None:
+        (model_dir / EXPORT_CONFIG).write_text(json.dumps(asdict(self), indent=2), encoding="utf-8")
+
+
+def onnx_dir(onnx_root: Path, model_name: str) -> Path:
+    return onnx_root / model_name.replace("/", "__")
+
+
+def embedder_id(model_name: str, backend: str) -> str:
+    """Key for cached vectors and the ingest manifest; int8 vectors differ slightly from float."""
+
+    return model_name if backend == "sentence-transformers" else f"{model_name}@{backend}"
+
+
+class SentenceTransformerEmbedder:
+    backend = "sentence-transformers"
+
+    def __init__(self, model_name: str, *, cache_dir: Path) -> None:
+        # Imported lazily: torch is heavy, and ingestion worker processes
+        # re-import the entry script without ever needing the model.
+        from sentence_transformers import SentenceTransformer
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        # cache_folder makes the environment reproducible and reduces repeated downloads.
+        self.model: SentenceTransformer = SentenceTransformer(model_name, cache_folder=str(cache_dir))
+        self.dim = int(self.model.get_sentence_embedding_dimension())
+        self.max_seq_length = int(self.model.max_seq_length)
+
+    def encode(self, texts: list[str], *, batch_size: int = 32) -> np.ndarray:
+        vecs = self.model.encode(texts, batch_size=batch_size, normalize_embeddings=True)
+        return np.asarray(vecs, dtype="float32")
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.model.tokenizer(text, add_special_tokens=True)["input_ids"])
+
+
+class OnnxEmbedder:
+    """Transformer exported to ONNX (see scripts/download_embedding_model.py --export-onnx).
+
+    Runs on ONNX Runtime with the fast `tokenizers` tokenizer, so neither torch
+    nor sentence-transformers is imported. Pooling and normalization match the
+    source model. Texts are sorted by length before batching to limit padding.
+    """
+
+    def __init__(self, model_dir: Path, *, quantized: bool = False, threads: int = 0) -> None:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        path = model_dir / (ONNX_INT8_FILE if quantized else ONNX_FILE)
+        if not path.exists():
+            raise FileNotFoundError(
+                f"Missing {path}; run: python scripts/download_embedding_model.py --export-onnx"
+                + (" --quantize" if quantized else "")
+            )
+        self.config = ExportConfig.load(model_dir)
+        if self.config.pooling not in ("mean", "cls"):
+            raise ValueError(f"Unsupported pooling {self.config.pooling!r}")
+        self.backend = "onnx-int8" if quantized else "onnx"
+        self.dim = self.config.dim
+        self.max_seq_length = self.config.max_seq_length
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads > 0:
+            opts.intra_op_num_threads = threads
+        self._session = ort.InferenceSession(str(path), opts, providers=["CPUExecutionProvider"])
+        self._inputs = {i.name for i in self._session.get_inputs()}
+        self._tokenizer = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self._tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self._tokenizer.enable_padding(pad_id=self.config.pad_id, pad_token=self.config.pad_token)
+        # Separate instance without truncation, for measuring chunk lengths.
+        self._counter = Tokenizer.from_file(str(model_dir / "tokenizer.json"))
+        self._counter.no_truncation()
+        self._counter.no_padding()
+
+    def count_tokens(self, text: str) -> int:
+        return len(self._counter.encode(text).ids)
+
+    def _forward(self, texts: list[str]) -> np.ndarray:
+        encs = self._tokenizer.encode_batch(texts)
+        ids = np.asarray([e.ids for e in encs], dtype="int64")
+        mask = np.asarray([e.attention_mask for e in encs], dtype="int64")
+        feed = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self._inputs:
+            feed["token_type_ids"] = np.zeros_like(ids)
+        hidden = self._session.run(None, feed)[0]  # (batch, seq, dim)
+        if self.config.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            m = mask[:, :, None].astype("float32")
+            pooled = (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype("float32")
+
+    def encode(self, texts: list[str], *, batch_size: int = 32) -> np.ndarray:
+        out = np.empty((len(texts), self.dim), dtype="float32")
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        for b in range(0, len(order), batch_size):
+            rows = order[b : b + batch_size]
+            out[rows] = self._forward([texts[i] for i in rows])
+        return out
+
+
+def make_embedder(model_name: str, backend: str, *, cache_dir: Path, onnx_root: Path, threads: int = 0) -> Embedder:
+    if backend == "sentence-transformers":
+        return SentenceTransformerEmbedder(model_name, cache_dir=cache_dir)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEmbedder(onnx_dir(onnx_root, model_name), quantized=backend == "onnx-int8", threads=threads)
+    raise ValueError(f"Unknown embedding backend {backend!r} (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from multiprocessing import get_context
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from pypdf import PdfReader
+
+from assistant.text_utils import normalize_text
+
+# Kept free of heavy imports (faiss, torch): worker processes are spawned and
+# only need to import this module.
+
+PDF_PAGES_PER_TASK = 16
+
+
+@dataclass(frozen=True)
+class Extracted:
+    path: Path
+    text: str
+    pages: int
+    seconds: float
+
+
+def read_txt(path: Path) -> str:
+    return path.read_text(encoding="utf-8", errors="ignore")
+
+
+def read_pdf_pages(path: Path, start: int = 0, stop: int | None = None) -> list[str]:
+    reader = PdfReader(str(path))
+    return [p.extract_text() or "" for p in reader.pages[start:stop]]
+
+
+def _run_task(path: str, start: int, stop: int | None) -> tuple[str, int, float]:
+    t0 = time.perf_counter()
+    p = Path(path)
+    if p.suffix.lower() == ".pdf":
+        pages = read_pdf_pages(p, start, stop)
+        return "\n\n".join(pages), len(pages), time.perf_counter() - t0
+    return read_txt(p), 1, time.perf_counter() - t0
+
+
+def _iter_tasks(paths: Iterable[Path]) -> Iterator[tuple[Path, int, int, int, int | None]]:
+    for path in paths:
+        if path.suffix.lower() == ".pdf":
+            n = len(PdfReader(str(path)).pages)
+            ranges = [(a, min(n, a + PDF_PAGES_PER_TASK)) for a in range(0, max(n, 1), PDF_PAGES_PER_TASK)]
+        else:
+            ranges = [(0, None)]
+        for i, (start, stop) in enumerate(ranges):
+            yield path, i, len(ranges), start, stop
+
+
+def iter_extracted(paths: Iterable[Path], *, workers: int) -> Iterator[Extracted]:
+    """Extract text from files, yielding each file as soon as all its pages are done.
+
+    PDFs are split into page ranges that run in a process pool. At most
+    `2 * workers` tasks are in flight, so memory stays bounded by the files
+    currently being extracted rather than by the corpus size.
+    """
+
+    paths = list(paths)
+    if workers <= 1 or not any(p.suffix.lower() == ".pdf" for p in paths):
+        # Plain text reads are I/O bound and cheap; a pool would only add startup cost.
+        for path in paths:
+            text, pages, seconds = _run_task(str(path), 0, None)
+            yield Extracted(path=path, text=normalize_text(text), pages=pages, seconds=seconds)
+        return
+
+    # spawn: /ingest runs inside a threaded server where fork is unsafe.
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        pending: dict[Future, tuple[Path, int]] = {}
+        parts: dict[Path, list[str | None]] = {}
+        stats: dict[Path, list[float]] = {}
+        tasks = _iter_tasks(paths)
+
+        def fill() -> None:
+            for path, i, n, start, stop in tasks:
+                if i == 0:
+                    parts[path] = [None] * n
+                    stats[path] = [0, 0.0]
+                pending[pool.submit(_run_task, str(path), start, stop)] = (path, i)
+                if len(pending) >= 2 * workers:
+                    return
+
+        fill()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                path, i = pending.pop(fut)
+                text, pages, elapsed = fut.result()
+                parts[path][i] = text
+                stats[path][0] += pages
+                stats[path][1] += elapsed
+                if all(p is not None for p in parts[path]):
+                    pieces = parts.pop(path)
+                    n_pages, seconds = stats.pop(path)
+                    yield Extracted(
+                        path=path,
+                        text=normalize_text("\n\n".join(pieces)),
+                        pages=int(n_pages),
+                        seconds=seconds,
+                    )
+            fill()
@@ -0,0 +1,168 @@
+from __future__ import annotations
+
+import math
+import time
+from dataclasses import dataclass, replace
+
+import faiss
+import numpy as np
+
+from assistant.config import IndexSettings
+
+INDEX_KINDS = ("Flat", "IVF-Flat", "IVF-PQ", "HNSW")
+
+# Below this many vectors, clustering-based indexes are not worth training.
+MIN_IVF_VECTORS = 1000
+
+
+@dataclass(frozen=True)
+class SearchTuning:
+    nprobe: int | None = None
+    ef_search: int | None = None
+    mode: str | None = None  # dense | hybrid | lexical; None uses RETRIEVAL_MODE
+    rerank: bool | None = None  # None: rerank whenever the store has a reranker
+
+
+def effective_kind(settings: IndexSettings, n_vectors: int) -> str:
+    if settings.kind not in INDEX_KINDS:
+        raise ValueError(f"Unknown index kind {settings.kind!r}; expected one of {INDEX_KINDS}")
+    if settings.kind.startswith("IVF") and n_vectors < MIN_IVF_VECTORS:
+        return "Flat"
+    return settings.kind
+
+
+def make_index(settings: IndexSettings, dim: int, sample: np.ndarray) -> tuple[faiss.Index, IndexSettings]:
+    """Build an empty (trained) index for `settings`, using `sample` for training.
+
+    Returns the index and the settings actually applied (kind may fall back to
+    Flat on tiny corpora, nlist is resolved when left on auto).
+    """
+
+    kind = effective_kind(settings, len(sample))
+    applied = replace(settings, kind=kind)
+    if kind == "Flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dim)), applied
+    if kind == "HNSW":
+        hnsw = faiss.IndexHNSWFlat(dim, settings.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = settings.ef_construction
+        hnsw.hnsw.efSearch = settings.ef_search
+        return faiss.IndexIDMap2(hnsw), applied
+
+    # IVF indexes keep external ids natively and support remove_ids directly.
+    nlist = settings.nlist or max(1, min(int(4 * math.sqrt(len(sample))), len(sample) // 39))
+    applied = replace(applied, nlist=nlist)
+    quantizer = faiss.IndexFlatIP(dim)
+    if kind == "IVF-Flat":
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+    else:
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, settings.pq_m, 8, faiss.METRIC_INNER_PRODUCT)
+    index.train(sample)
+    index.nprobe = settings.nprobe
+    return index, applied
+
+
+def supports_remove(index: faiss.Index) -> bool:
+    # HNSW graphs cannot drop nodes; those indexes are rebuilt instead.
+    if isinstance(index, faiss.IndexIDMap2):
+        return not isinstance(faiss.downcast_index(index.index), faiss.IndexHNSW)
+    return isinstance(index, faiss.IndexIVF)
+
+
+def has_stable_ids(index: faiss.Index) -> bool:
+    return isinstance(index, (faiss.IndexIDMap2, faiss.IndexIVF))
+
+
+def vectors_for_ids(index: faiss.Index, ids: np.ndarray) -> np.ndarray | None:
+    """Exact stored vectors of `ids`, or None when the index cannot return them (IVF)."""
+
+    if not isinstance(index, (faiss.IndexIDMap2, faiss.IndexFlat)):
+        return None
+    return np.asarray(index.reconstruct_batch(np.asarray(ids, dtype="int64")), dtype="float32")
+
+
+def all_vectors(index: faiss.IndexIDMap2) -> tuple[np.ndarray, np.ndarray]:
+    """(ids, vectors) stored in an id-mapped flat or HNSW index."""
+
+    ids = faiss.vector_to_array(index.id_map).astype("int64")
+    vecs = index.index.reconstruct_n(0, index.ntotal) if index.ntotal else np.zeros((0, index.d), dtype="float32")
+    return ids, np.asarray(vecs, dtype="float32")
+
+
+def search_params(
+    index: faiss.Index,
+    settings: IndexSettings,
+    tuning: SearchTuning | None,
+    sel: faiss.IDSelector | None = None,
+) -> faiss.SearchParameters | None:
+    """Per-request search parameters; never mutates the shared index.
+
+    `sel` restricts the search to the selected ids (IDMap2 translates it to
+    internal row numbers).
+    """
+
+    tuning = tuning or SearchTuning()
+    inner = faiss.downcast_index(index.index) if isinstance(index, faiss.IndexIDMap2) else index
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(nprobe=tuning.nprobe or settings.nprobe, sel=sel)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(efSearch=tuning.ef_search or settings.ef_search, sel=sel)
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+@dataclass(frozen=True)
+class KindReport:
+    kind: str
+    applied_kind: str
+    build_s: float
+    recall_at_k: float
+    mean_ms: float
+    p95_ms: float
+
+
+def compare_index_kinds(
+    vectors: np.ndarray,
+    ids: np.ndarray,
+    queries: np.ndarray,
+    *,
+    base: IndexSettings,
+    top_k: int,
+    kinds: tuple[str, ...] = INDEX_KINDS,
+) -> list[KindReport]:
+    """Recall@k and single-query latency of each index kind against exact Flat search."""
+
+    exact = faiss.IndexFlatIP(vectors.shape[1])
+    exact.add(vectors)
+    _, truth_rows = exact.search(queries, top_k)
+    truth = [set(ids[r[r >= 0]].tolist()) for r in truth_rows]
+
+    reports: list[KindReport] = []
+    for kind in kinds:
+        settings = replace(base, kind=kind)
+        t0 = time.perf_counter()
+        sample = vectors[: settings.train_sample]
+        index, applied = make_index(settings, vectors.shape[1], sample)
+        index.add_with_ids(vectors, ids)
+        build_s = time.perf_counter() - t0
+
+        params = search_params(index, applied, None)
+        latencies: list[float] = []
+        hits = 0
+        for q, expected in zip(queries, truth):
+            t0 = time.perf_counter()
+            _, found = index.search(q[None, :], top_k, params=params)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            hits += len(expected & set(found[0].tolist()))
+        denom = sum(len(t) for t in truth) or 1
+        reports.append(
+            KindReport(
+                kind=kind,
+                applied_kind=applied.kind,
+                build_s=build_s,
+                recall_at_k=hits / denom,
+                mean_ms=float(np.mean(latencies)) if latencies else 0.0,
+                p95_ms=float(np.percentile(latencies, 95)) if latencies else 0.0,
+            )
+        )
+    return reports
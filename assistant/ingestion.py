@@ -1,70 +1,403 @@
-from __future__ import annotations
-
-import json
-from dataclasses import dataclass
-from pathlib import Path
-from typing import Iterable
-
-from pypdf import PdfReader
-
-from assistant.config import DEFAULT_CHUNK_OVERLAP, DEFAULT_CHUNK_SIZE, Paths
-from assistant.text_utils import Chunk, chunk_text, normalize_text
-
-
-@dataclass(frozen=True)
-class Doc:
-    source: str
-    text: str
-
-
-def _read_txt(path: Path) -> str:
-    return path.read_text(encoding="utf-8", errors="ignore")
-
-
-def _read_pdf(path: Path) -> str:
-    reader = PdfReader(str(path))
-    pages_text: list[str] = []
-    for p in reader.pages:
-        pages_text.append(p.extract_text() or "")
-    return "\n\n".join(pages_text)
-
-
-def load_documents(raw_dir: Path) -> list[Doc]:
-    docs: list[Doc] = []
-    for path in sorted(raw_dir.rglob("*")):
-        if path.is_dir():
-            continue
-        ext = path.suffix.lower()
-        if ext not in {".txt", ".pdf"}:
-            continue
-        if ext == ".txt":
-            text = _read_txt(path)
-        else:
-            text = _read_pdf(path)
-        text = normalize_text(text)
-        if text:
-            docs.append(Doc(source=str(path), text=text))
-    return docs
-
-
-def build_chunks(
-    docs: Iterable[Doc],
-    *,
-    chunk_size: int = DEFAULT_CHUNK_SIZE,
-    overlap: int = DEFAULT_CHUNK_OVERLAP,
-) -> list[Chunk]:
-    all_chunks: list[Chunk] = []
-    for d in docs:
-        parts = list(chunk_text(d.text, chunk_size=chunk_size, overlap=overlap))
-        for idx, part in enumerate(parts):
-            all_chunks.append(Chunk(text=part, source=d.source, chunk_id=idx))
-    return all_chunks
-
-
-def save_metadata(paths: Paths, chunks: list[Chunk]) -> None:
-    payload = [
-        {"id": i, "source": c.source, "chunk_id": c.chunk_id, "text": c.text}
-        for i, c in enumerate(chunks)
-    ]
-    paths.data_index.mkdir(parents=True, exist_ok=True)
-    paths.meta_path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
+from __future__ import annotations
+
+import datetime as dt
+import hashlib
+import json
+import re
+import time
+from dataclasses import dataclass, field, replace
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from assistant.config import (
+    CHUNK_TOKEN_AWARE,
+    DEFAULT_CHUNK_OVERLAP,
+    DEFAULT_CHUNK_SIZE,
+    EMBED_BATCH_SIZE,
+    INGEST_WORKERS,
+    IndexFiles,
+    Paths,
+)
+from assistant.extract import iter_extracted, read_pdf_pages, read_txt
+from assistant.io_utils import FileLock, atomic_write_text
+from assistant.langid import detect_languages
+from assistant.logging_utils import JsonlLogger
+from assistant.meta_store import ChunkMeta, MetaWriter, write_meta
+from assistant.rag_store import RagStore
+from assistant.text_utils import Chunk, iter_chunk_spans, normalize_text
+
+
+@dataclass(frozen=True)
+class Doc:
+    source: str
+    text: str
+
+
+_SUPPORTED_EXTS = {".txt", ".pdf"}
+
+
+def iter_source_files(raw_dir: Path) -> list[Path]:
+    return [p for p in sorted(raw_dir.rglob("*")) if p.is_file() and p.suffix.lower() in _SUPPORTED_EXTS]
+
+
+def read_document(path: Path) -> Doc | None:
+    if path.suffix.lower() == ".txt":
+        text = read_txt(path)
+    else:
+        text = "\n\n".join(read_pdf_pages(path))
+    text = normalize_text(text)
+    return Doc(source=str(path), text=text) if text else None
+
+
+def iter_documents(raw_dir: Path, *, workers: int = INGEST_WORKERS) -> Iterator[Doc]:
+    """Yield documents as their extraction finishes (PDF pages run in a process pool)."""
+
+    for ex in iter_extracted(iter_source_files(raw_dir), workers=workers):
+        if ex.text:
+            yield Doc(source=str(ex.path), text=ex.text)
+
+
+def load_documents(raw_dir: Path) -> list[Doc]:
+    return list(iter_documents(raw_dir))
+
+
+def build_chunks(
+    docs: Iterable[Doc],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    overlap: int = DEFAULT_CHUNK_OVERLAP,
+) -> list[Chunk]:
+    all_chunks: list[Chunk] = []
+    for d in docs:
+        spans = iter_chunk_spans(d.text, chunk_size=chunk_size, overlap=overlap)
+        for idx, (start, end) in enumerate(spans):
+            all_chunks.append(Chunk(text=d.text[start:end], source=d.source, chunk_id=idx, start=start, end=end))
+    return all_chunks
+
+
+def save_metadata(paths: Paths, chunks: list[Chunk]) -> None:
+    records = (
+        ChunkMeta(id=i, source=c.source, chunk_id=c.chunk_id, text=c.text, start=c.start, end=c.end)
+        for i, c in enumerate(chunks)
+    )
+    paths.data_index.mkdir(parents=True, exist_ok=True)
+    write_meta(paths.meta_path, records)
+
+
+# Bump when chunk boundaries or per-chunk metadata change so existing indexes are rebuilt once.
+CHUNKER_VERSION = 5
+
+_FRONT_MATTER = re.compile(r"\A---\n(.*?)\n---(?:\n+|\Z)", re.S)
+_DOC_PREFIX = re.compile(r"^(?:procedure|guide|form|formulaire)_")
+_LANG_SUFFIX = re.compile(r"_(?:ar|fr|en|darija|tn)$")
+
+
+@dataclass(frozen=True)
+class DocAttributes:
+    domain: str
+    date: str  # ISO YYYY-MM-DD
+    body_start: int  # offset of the text after the front-matter
+
+
+def doc_attributes(path: Path, raw_dir: Path, text: str) -> DocAttributes:
+    """Domain and date of a document.
+
+    A leading front-matter block (`---` / `key: value` lines / `---`) wins.
+    Otherwise the domain is the sub-folder under data/raw, or the file name
+    without its type prefix and language suffix, and the date is the file's
+    modification day (also used when the front-matter date is not YYYY-MM-DD).
+    """
+
+    fields: dict[str, str] = {}
+    body_start = 0
+    m = _FRONT_MATTER.match(text)
+    if m:
+        for line in m.group(1).splitlines():
+            key, sep, value = line.partition(":")
+            if sep:
+                fields[key.strip().lower()] = value.strip()
+        body_start = m.end()
+
+    domain = fields.get("domain", "")
+    if not domain:
+        rel = path.relative_to(raw_dir) if path.is_relative_to(raw_dir) else Path(path.name)
+        domain = rel.parts[0] if len(rel.parts) > 1 else _LANG_SUFFIX.sub("", _DOC_PREFIX.sub("", path.stem.lower()))
+    try:
+        date = dt.date.fromisoformat(fields.get("date", "")[:10]).isoformat()
+    except ValueError:
+        # Missing or not YYYY-MM-DD (e.g. "12/03/2024"): use the modification day.
+        date = dt.date.fromtimestamp(path.stat().st_mtime).isoformat()
+    return DocAttributes(domain=domain, date=date, body_start=body_start)
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+@dataclass
+class Manifest:
+    """Content hashes of what is currently indexed, kept next to docs.faiss."""
+
+    embed_model: str = ""
+    index_kind: str = ""
+    index_shards: int = 1
+    shard_by: str = "hash"
+    chunk_size: int = 0
+    overlap: int = 0
+    chunker: int = 0
+    token_aware: bool = False
+    next_id: int = 0
+    # source -> {"sha256": file hash, "chunks": [{"id", "chunk_id", "sha256"}]}
+    files: dict[str, dict] = field(default_factory=dict)
+
+    @property
+    def chunk_count(self) -> int:
+        return sum(len(f["chunks"]) for f in self.files.values())
+
+
+def load_manifest(paths: Paths, files: IndexFiles) -> Manifest:
+    """Manifest published with the generation in `files`.
+
+    Generations written before the manifest moved into them still have it in
+    data/index.
+    """
+
+    for path in (files.manifest_path, paths.manifest_path):
+        if path.exists():
+            return Manifest(**json.loads(path.read_text(encoding="utf-8")))
+    return Manifest()
+
+
+def save_manifest(files: IndexFiles, manifest: Manifest) -> None:
+    # Written into the unpublished generation, so it goes live with the index it describes.
+    atomic_write_text(files.manifest_path, json.dumps(manifest.__dict__, ensure_ascii=False))
+
+
+@dataclass(frozen=True)
+class IngestResult:
+    documents: int
+    chunks: int
+    added: int
+    removed: int
+    unchanged: int
+
+
+def ingest_incremental(
+    paths: Paths,
+    rag: RagStore,
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    overlap: int = DEFAULT_CHUNK_OVERLAP,
+    full: bool = False,
+    workers: int = INGEST_WORKERS,
+    batch_size: int = EMBED_BATCH_SIZE,
+    token_aware: bool = CHUNK_TOKEN_AWARE,
+    logger: JsonlLogger | None = None,
+) -> IngestResult:
+    """Sync the index with data/raw, embedding only new or changed chunks.
+
+    Unchanged files (same byte hash) are not even re-extracted. Changed files are
+    extracted in a process pool and streamed through chunking and embedding in
+    batches of `batch_size`, so peak memory does not grow with the corpus.
+    Chunks whose text hash is already indexed keep their id and vector. A full
+    rebuild happens on `full=True`, on a settings change (including the shard
+    count or key), or when the manifest no longer matches the index on disk.
+    On a sharded index only the shards holding added or removed chunks are
+    rewritten. With `token_aware`, chunks are also cut at the embedding model's
+    max sequence length. Concurrent calls, from any process, run one at a time.
+    """
+
+    # Two ingests starting from the same generation would each publish a full
+    # index and the later one would silently drop the other's changes.
+    paths.data_index.mkdir(parents=True, exist_ok=True)
+    with FileLock(paths.ingest_lock_path):
+        return _sync(
+            paths,
+            rag,
+            chunk_size=chunk_size,
+            overlap=overlap,
+            full=full,
+            workers=workers,
+            batch_size=batch_size,
+            token_aware=token_aware,
+            logger=logger,
+        )
+
+
+def _sync(
+    paths: Paths,
+    rag: RagStore,
+    *,
+    chunk_size: int,
+    overlap: int,
+    full: bool,
+    workers: int,
+    batch_size: int,
+    token_aware: bool,
+    logger: JsonlLogger | None,
+) -> IngestResult:
+    old, old_meta, consistent = Manifest(), None, False
+    if not full:
+        # Anything unreadable (missing, corrupt, older format) just means a full rebuild.
+        try:
+            snap = rag.snapshot()
+            old, old_meta = load_manifest(paths, snap.files), snap.meta
+            consistent = rag.incremental_count() == old.chunk_count == len(old_meta)
+        except Exception as exc:
+            old_meta, consistent = None, False
+            if logger is not None and not isinstance(exc, FileNotFoundError):
+                logger.log("Ingest_Rebuild", reason=repr(exc))
+    index = rag.index_settings
+    settings = (
+        rag.embed_id,
+        index.kind,
+        index.shards,
+        index.shard_by,
+        chunk_size,
+        overlap,
+        CHUNKER_VERSION,
+        token_aware,
+    )
+    old_settings = (
+        old.embed_model,
+        old.index_kind,
+        old.index_shards,
+        old.shard_by,
+        old.chunk_size,
+        old.overlap,
+        old.chunker,
+        old.token_aware,
+    )
+    if full or not old.files or not consistent or old_settings != settings:
+        old, old_meta = Manifest(), None
+
+    new = Manifest(
+        embed_model=rag.embed_id,
+        index_kind=index.kind,
+        index_shards=index.shards,
+        shard_by=index.shard_by,
+        chunk_size=chunk_size,
+        overlap=overlap,
+        chunker=CHUNKER_VERSION,
+        token_aware=token_aware,
+        next_id=old.next_id,
+    )
+    writer = MetaWriter()
+    update = rag.begin_update(reset=not old.files)
+    pending: list[ChunkMeta] = []
+    added = unchanged = documents = 0
+
+    count_tokens = rag.count_tokens if token_aware else None
+
+    def flush() -> None:
+        update.add(
+            [m.id for m in pending],
+            [m.text for m in pending],
+            sources=[m.source for m in pending],
+            domains=[m.domain for m in pending],
+        )
+        pending.clear()
+
+    to_extract: dict[Path, str] = {}
+    for path in iter_source_files(paths.data_raw):
+        source = str(path)
+        with path.open("rb") as f:
+            file_hash = hashlib.file_digest(f, "sha256").hexdigest()
+        prev = old.files.get(source)
+        if prev is not None and prev["sha256"] == file_hash and old_meta is not None:
+            kept = [old_meta.get(c["id"]) for c in prev["chunks"]]
+            if all(m is not None for m in kept):
+                for m in kept:
+                    writer.add(m)
+                new.files[source] = prev
+                unchanged += len(kept)
+                documents += 1
+                if logger is not None:
+                    logger.log("Ingest_File", source=source, status="unchanged", chunks=len(kept))
+                continue
+        to_extract[path] = file_hash
+
+    for ex in iter_extracted(to_extract, workers=workers):
+        if not ex.text:
+            continue
+        t0 = time.perf_counter()
+        source = str(ex.path)
+        prev = old.files.get(source)
+        documents += 1
+        # Reuse ids (and vectors) of chunks whose text is already indexed for this source.
+        reusable: dict[str, list[int]] = {}
+        for c in (prev or {}).get("chunks", []):
+            reusable.setdefault(c["sha256"], []).append(c["id"])
+
+        entries = []
+        file_added = 0
+        attrs = doc_attributes(ex.path, paths.data_raw, ex.text)
+        body = ex.text[attrs.body_start :]
+        spans = list(
+            iter_chunk_spans(
+                body,
+                chunk_size=chunk_size,
+                overlap=overlap,
+                max_tokens=rag.max_tokens if token_aware else 0,
+                count_tokens=count_tokens,
+            )
+        )
+        langs = detect_languages([body[start:end] for start, end in spans])
+        for chunk_id, (start, end) in enumerate(spans):
+            part = body[start:end]
+            meta = ChunkMeta(
+                id=-1,
+                source=source,
+                chunk_id=chunk_id,
+                text=part,
+                start=attrs.body_start + start,
+                end=attrs.body_start + end,
+                lang=langs[chunk_id],
+                domain=attrs.domain,
+                date=attrs.date,
+            )
+            chunk_hash = _sha256(part.encode("utf-8"))
+            ids = reusable.get(chunk_hash)
+            if ids:
+                id_ = ids.pop(0)
+                unchanged += 1
+            else:
+                id_ = new.next_id
+                new.next_id += 1
+                pending.append(replace(meta, id=id_))
+                file_added += 1
+                if len(pending) >= batch_size:
+                    flush()
+            writer.add(replace(meta, id=id_))
+            entries.append({"id": id_, "chunk_id": chunk_id, "sha256": chunk_hash})
+        new.files[source] = {"sha256": to_extract[ex.path], "chunks": entries}
+        added += file_added
+        if logger is not None:
+            logger.log(
+                "Ingest_File",
+                source=source,
+                status="changed" if prev else "new",
+                pages=ex.pages,
+                chunks=len(entries),
+                added=file_added,
+                extract_s=round(ex.seconds, 4),
+                chunk_embed_s=round(time.perf_counter() - t0, 4),
+            )
+    flush()
+
+    live = {e["id"] for f in new.files.values() for e in f["chunks"]}
+    removed = [c["id"] for f in old.files.values() for c in f["chunks"] if c["id"] not in live]
+    update.remove(removed)
+
+    paths.data_index.mkdir(parents=True, exist_ok=True)
+    chunks = len(writer)
+    writer.finish(update.files.meta_path)
+    save_manifest(update.files, new)
+    update.publish()
+    return IngestResult(
+        documents=documents,
+        chunks=chunks,
+        added=added,
+        removed=len(removed),
+        unchanged=unchanged,
+    )
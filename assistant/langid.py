@@ -0,0 +1,197 @@
+from __future__ import annotations
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+
+from assistant.config import LANGID_CACHE_SIZE, LANGID_MAX_CHARS
+
+# Script + character-trigram language identifier for the languages this service sees:
+# Modern Standard Arabic ("ar"), French ("fr"), English ("en") and Tunisian Darija
+# ("darija", in Arabic script or Latin "Arabizi" with digits for 3/7/9...). The script
+# picks the candidates, trigram log-probabilities and a few marker words pick the
+# language. Deterministic, no third-party dependency, profiles built once on first use.
+
+LANGUAGES = ("ar", "darija", "fr", "en")
+UNKNOWN = "unknown"
+
+# Seed text per profile; "darija_lat" is Arabizi. Mostly administrative wording, like the queries.
+_SEED: dict[str, str] = {
+    "ar": """
+        ما هي الإجراءات المطلوبة لتجديد بطاقة التعريف الوطنية؟ يجب على المواطن تقديم مطلب كتابي إلى
+        البلدية مرفقا بالوثائق اللازمة. تتمثل الوثائق المطلوبة في مضمون ولادة وصورتين شمسيتين ونسخة من
+        بطاقة التعريف القديمة. يتم إيداع التصريح الجبائي المبسط قبل انقضاء الأجل القانوني. في حالة
+        التأخير يتعرض المطالب بالأداء إلى خطايا مالية. تسلم رخصة البناء من قبل رئيس البلدية بعد دراسة
+        الملف من طرف اللجنة الفنية. يمكن متابعة الملف عبر البوابة الإلكترونية للخدمات الإدارية. أريد أن
+        أعرف كيف يمكنني الحصول على شهادة إقامة. هل يمكن تقديم الطلب عن بعد؟ ما هي المدة اللازمة لمعالجة
+        الملف؟ وفقا للفصل الثالث من هذا القرار تحدد معاليم الخدمات الإدارية. الرجاء الإجابة باللغة
+        الفرنسية. أود الاستفسار عن الوثائق التي يجب إحضارها. كما يتعين على الطالب دفع المعلوم المستوجب
+        لدى القباضة المالية. وتحتسب الآجال ابتداء من تاريخ إيداع المطلب. لا يقبل أي ملف منقوص.
+    """,
+    "darija": """
+        كيفاش نجدد بطاقة التعريف متاعي؟ لازمك تمشي للمعتمدية وتجيب معاك مضمون ولادة. شنوة الأوراق اللي
+        لازمني باش نعمل رخصة بناء؟ نحب نعرف قداش ياخو وقت. برشا ناس يستناو ياسر في البلدية. توا وين
+        نمشي؟ موش فاهم علاش رفضوا المطلب متاعي. فما حل آخر؟ نجم نبعث الملف بالانترنات؟ عندي مشكلة مع
+        الباسبور ضاع مني. ما عنديش فلوس باش نخلص الخطية. قولي شنية الخطوات بالضبط. الكارطة متاعي
+        وفات شنعمل؟ يلزمني نمشي بروحي ولا نجم نبعث حد؟ بقداش الطابع الجبائي؟ باش تجدد الكارطة لازمك
+        تمشي للمركز وتجيب تصويرة جديدة. رخصة البناء تاخو وقت لازمك تحضر الأوراق الكل قبل ما تمشي
+        للبلدية. هاو جبت الأوراق الكل أما قالولي ارجع غدوة. علاه ما يقبلوش الملف؟ شكون نكلم؟
+    """,
+    "darija_lat": """
+        kifech njadded el cin mte3i? lazmek temchi lel baladiya w tjib m3ak madhmoun wleda. chnowa el
+        wra9 elli lazmni bech na3mel rokhsa bine? nheb na3ref 9adech yekhou wa9t. barcha nes yestannew
+        yesser. taw win nemchi? mouch fehem 3lech rafdhou el matlab mte3i. fama 7al ekher? najjem
+        nab3eth el dossier bel internet? 3andi mochkla m3a el passeport dhaa3 menni. ma 3andich flous
+        bech nkhalles el khtiya. 9olli chniya el khatawet bedhabt. el karta mte3i fetet chna3mel?
+        yelzemni nemchi berou7i walla najjem nab3eth 7ad? be9adech el tabe3? el cin tjaddadha fel markez
+        mta3 el police jib m3ak tsawer. haw jebt el wra9 lkol ama 9aloli arja3 ghodwa. chkoun nkallem?
+    """,
+    "fr": """
+        Quelle est la procédure pour renouveler une carte d'identité nationale ? Le citoyen doit déposer
+        une demande écrite auprès de la municipalité, accompagnée des pièces requises. Les pièces à
+        fournir sont un extrait de naissance, deux photos d'identité et une copie de l'ancienne carte. La
+        déclaration fiscale simplifiée doit être déposée avant la date limite. En cas de retard, le
+        contribuable est passible de pénalités. Le permis de bâtir est délivré par le président de la
+        commune après examen du dossier par la commission technique. Il est possible de suivre le
+        dossier en ligne sur le portail des services administratifs. Je voudrais savoir comment obtenir
+        un certificat de résidence. Est-ce que je peux faire la demande à distance ? Quels sont les
+        délais de traitement et les frais de dossier ? Conformément à l'article trois du présent arrêté,
+        les tarifs sont fixés chaque année. Merci de répondre en français. Où dois-je m'adresser ?
+        Bonjour, comment renouveler mon passeport et mon permis de conduire ? Combien coûte le timbre ?
+    """,
+    "en": """
+        What is the procedure to renew a national identity card? The citizen must submit a written
+        application to the municipality together with the required documents. The documents to provide
+        are a birth certificate, two identity photos and a copy of the old card. The simplified tax
+        return must be filed before the deadline. In case of delay, the taxpayer is liable to
+        penalties. The building permit is issued by the mayor after the file has been reviewed by the
+        technical committee. You can track your application online on the administrative services
+        portal. I would like to know how to get a certificate of residence. Can I apply remotely? How
+        long does it take to process the file and what are the fees? According to article three of this
+        decree, the fees are set every year. Please answer in English. Where should I go? How do I
+        request a birth certificate online? What are the steps for renewing my passport? Hello, how
+        much does the stamp cost and where can I check the status of my driving licence request?
+    """,
+}
+
+# Frequent short words that decide short queries; each hit adds _MARKER_BONUS to its profile.
+_MARKERS: dict[str, str] = {
+    "ar": "هل ما هي هو يجب يمكن الذي التي أريد كيف ماذا لماذا أين الى إلى عن هذا هذه ذلك أن لا قد",
+    "darija": "كيفاش شنوة شنية شنو باش متاع متاعي متاعك نحب برشا ياسر توا علاش علاه موش مش فما نجم "
+    "قداش بقداش وين لازمني لازمك شكون هاو بربي",
+    "darija_lat": "kifech kifach kifeh chnowa chnoua chniya chneya bech bach mte3i mta3 mte3 nheb n7eb "
+    "barcha yesser taw 3lech 3lach mouch moch fama famma najjem nejjem 9adech 9addech win lazmni "
+    "lazem 3andi el fel bel lel w chkoun",
+    "fr": "le la les des du de est une un pour quelle quelles quel quels comment je mon ma mes et à au "
+    "aux dans sur que qui est-ce où faut il vous",
+    "en": "the is what how for and my do i to of are can where which does should an in on with",
+}
+_MARKER_BONUS = 2.5
+
+# Log prior per profile: Darija wins on its markers and Arabizi digits, not on short
+# ambiguous inputs ("passeport", "cin") that its seed happens to share.
+_PRIOR = {"ar": 0.0, "darija": -1.0, "darija_lat": -2.0, "fr": 0.0, "en": -0.5}
+_PROFILE_LABEL = {"ar": "ar", "darija": "darija", "darija_lat": "darija", "fr": "fr", "en": "en"}
+_BY_SCRIPT = {"arabic": ("ar", "darija"), "latin": ("fr", "en", "darija_lat")}
+
+_ARABIC = re.compile("[\u0600-\u06ff\u0750-\u077f\ufb50-\ufdff\ufe70-\ufefc]")
+_LATIN = re.compile("[a-z\u00e0-\u00f6\u00f8-\u00ff]")
+_MARKS = re.compile("[\u064b-\u065f\u0670\u0640]")
+# Letters, plus digits written inside Latin words (Arabizi 3, 7, 9, 5, 2).
+_WORD = re.compile(r"[^\W\d_]+(?:\d+[^\W\d_]*)*|\d+[^\W\d_]+(?:\d+[^\W\d_]*)*")
+_PLACEHOLDER = re.compile(r"\[[A-Z]+\]")  # left by safety redaction, e.g. [CIN]
+_ARABIZI = re.compile(r"(?<=[a-z])[23579]|[23579](?=[a-z])")
+
+
+@dataclass(frozen=True)
+class _Profiles:
+    # trigram -> per-profile log p, over the trigrams seen in the seeds of one script
+    logp: dict[str, dict[str, tuple[float, ...]]]
+    markers: dict[str, dict[str, tuple[float, ...]]]
+
+
+def normalize(text: str) -> str:
+    """Memoization key: case-folded, diacritics removed, words joined by single spaces."""
+
+    text = _MARKS.sub("", unicodedata.normalize("NFC", _PLACEHOLDER.sub(" ", text).casefold()))
+    return " ".join(_WORD.findall(text))
+
+
+def _trigrams(words: str) -> Counter[str]:
+    padded = f" {words} "
+    return Counter(padded[i : i + 3] for i in range(len(padded) - 2))
+
+
+@lru_cache(maxsize=1)
+def _profiles() -> _Profiles:
+    logp: dict[str, dict[str, tuple[float, ...]]] = {}
+    markers: dict[str, dict[str, tuple[float, ...]]] = {}
+    for script, names in _BY_SCRIPT.items():
+        counts = {name: _trigrams(normalize(_SEED[name])) for name in names}
+        vocab = set().union(*counts.values())
+        # Add-half smoothing over the script's shared vocabulary. Trigrams outside it say
+        # nothing about which profile fits better and are skipped when scoring.
+        denom = {name: sum(c.values()) + 0.5 * len(vocab) for name, c in counts.items()}
+        logp[script] = {g: tuple(math.log((counts[name][g] + 0.5) / denom[name]) for name in names) for g in vocab}
+        markers[script] = {}
+        for i, name in enumerate(names):
+            for w in normalize(_MARKERS[name]).split():
+                row = list(markers[script].get(w, (0.0,) * len(names)))
+                row[i] = _MARKER_BONUS
+                markers[script][w] = tuple(row)
+    return _Profiles(logp=logp, markers=markers)
+
+
+def _identify(norm: str) -> str:
+    arabic = len(_ARABIC.findall(norm))
+    latin = len(_LATIN.findall(norm))
+    if not arabic and not latin:
+        return UNKNOWN
+    script = "arabic" if arabic >= latin else "latin"
+    names = _BY_SCRIPT[script]
+    profiles = _profiles()
+    table, marks = profiles.logp[script], profiles.markers[script]
+    scores = [_PRIOR[name] for name in names]
+    for g, n in _trigrams(norm).items():
+        row = table.get(g)
+        if row is not None:
+            for i, d in enumerate(row):
+                scores[i] += n * d
+    for w in norm.split():
+        row = marks.get(w)
+        if row is not None:
+            for i, d in enumerate(row):
+                scores[i] += d
+    if script == "latin":
+        # Digits inside words are the clearest Arabizi signal ("3andi", "9adech", "m3a").
+        scores[names.index("darija_lat")] += _MARKER_BONUS * len(_ARABIZI.findall(norm))
+    best = max(range(len(names)), key=scores.__getitem__)
+    return _PROFILE_LABEL[names[best]]
+
+
+@lru_cache(maxsize=LANGID_CACHE_SIZE)
+def _identify_cached(norm: str) -> str:
+    return _identify(norm)
+
+
+def detect_language(text: str) -> str:
+    """Language of one request: "ar", "darija", "fr", "en" or "unknown". Memoized per normalized text."""
+
+    return _identify_cached(normalize(text[:LANGID_MAX_CHARS]))
+
+
+def detect_languages(texts: list[str], *, max_chars: int = LANGID_MAX_CHARS) -> list[str]:
+    """Batch form for ingestion: each distinct text is scored once, without filling the request cache."""
+
+    seen: dict[str, str] = {}
+    out = []
+    for text in texts:
+        norm = normalize(text[:max_chars])
+        lang = seen.get(norm)
+        if lang is None:
+            lang = seen[norm] = _identify(norm)
+        out.append(lang)
+    return out
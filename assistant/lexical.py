@@ -0,0 +1,247 @@
+from __future__ import annotations
+
+import mmap
+import os
+import re
+import struct
+import unicodedata
+from array import array
+from collections import Counter
+from pathlib import Path
+from typing import Iterable
+
+import numpy as np
+
+# Layout (little endian, every section 8-byte aligned):
+#   header      magic | version u32 | n_terms u32 | n_docs u64 | n_postings u64 | total_len u64
+#   doc_ids     uint32[d]     sorted chunk ids
+#   doc_len     uint32[d]     terms per chunk
+#   term_off    uint64[t+1]   postings of term i are rows term_off[i]:term_off[i+1]
+#   post_ids    uint32[p]     chunk ids, sorted within a term
+#   post_tf     uint16[p]     term frequency (saturated)
+#   vocab       utf-8 terms joined by "\n", in term order
+_MAGIC = b"TDSABM25"
+_VERSION = 1
+_HEADER = struct.Struct("<8sIIQQQ")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_ELISION = re.compile(r"\b(?:qu|jusqu|lorsqu|puisqu|[cdjlmnst])'")
+_TOKEN = re.compile(r"\w+")
+# Arabic article with its common proclitics, kept only if a real stem remains.
+_AR_ARTICLE = re.compile(r"\b(?:و?[فبك]?ال|و?لل)(?=\w\w)")
+# Combining marks left by NFD: Latin accents, Arabic harakat, hamza above/below, dagger alef.
+_MARKS = re.compile("[\u0300-\u036f\u064b-\u065f\u0670]")
+_FOLD = (("ٱ", "ا"), ("ى", "ي"), ("ة", "ه"), ("ـ", ""), ("’", "'"), ("`", "'"))
+
+
+def _pad8(n: int) -> int:
+    return (8 - n % 8) % 8
+
+
+def analyze(text: str) -> list[str]:
+    """Index terms of `text`, folded the same way for chunks and queries.
+
+    Lowercases, drops French elisions (l', d', qu'...), strips Latin accents and
+    Arabic diacritics/hamza carriers (NFD removes both as combining marks),
+    unifies alef/yeh/teh marbuta variants and removes the Arabic article.
+    """
+
+    text = text.casefold()
+    if not text.isascii():
+        # str.replace per pair is much faster than str.translate with a dict.
+        for a, b in _FOLD:
+            if a in text:
+                text = text.replace(a, b)
+        text = _MARKS.sub("", unicodedata.normalize("NFD", text))
+        if "ل" in text:
+            text = _AR_ARTICLE.sub("", text)
+    if "'" in text:
+        text = _ELISION.sub(" ", text)
+    return _TOKEN.findall(text)
+
+
+class LexicalIndex:
+    """Read-only BM25 inverted index over chunk ids, stored as compact CSR postings."""
+
+    def __init__(self, buf: bytes | mmap.mmap) -> None:
+        magic, version, n_terms, n_docs, n_post, total_len = _HEADER.unpack_from(buf, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Unsupported lexical index format")
+        self._buf = buf
+        off = _HEADER.size
+        self.doc_ids = np.frombuffer(buf, dtype="<u4", count=n_docs, offset=off)
+        off += 4 * n_docs
+        self.doc_len = np.frombuffer(buf, dtype="<u4", count=n_docs, offset=off)
+        off += 4 * n_docs + _pad8(8 * n_docs)
+        self.term_off = np.frombuffer(buf, dtype="<u8", count=n_terms + 1, offset=off)
+        off += 8 * (n_terms + 1)
+        self.post_ids = np.frombuffer(buf, dtype="<u4", count=n_post, offset=off)
+        off += 4 * n_post
+        self.post_tf = np.frombuffer(buf, dtype="<u2", count=n_post, offset=off)
+        off += 2 * n_post + _pad8(6 * n_post)
+        vocab = bytes(buf[off:]).decode("utf-8")
+        self.terms = vocab.split("\n") if vocab else []
+        self._term_ids = {t: i for i, t in enumerate(self.terms)}
+        self._avg_len = total_len / n_docs if n_docs else 0.0
+
+    @classmethod
+    def open(cls, path: Path) -> LexicalIndex:
+        with path.open("rb") as f:
+            if os.name == "nt":
+                return cls(f.read())
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @classmethod
+    def empty(cls) -> LexicalIndex:
+        return cls(_encode([], np.zeros(0, "<u4"), np.zeros(0, "<u4"), np.zeros(1, "<u8"),
+                           np.zeros(0, "<u4"), np.zeros(0, "<u2")))
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    def search(self, query: str, k: int, allowed: np.ndarray | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Top-k `(ids, scores)` by BM25, best first.
+
+        `allowed` is a boolean mask indexed by chunk id; other chunks are skipped
+        before scoring.
+        """
+
+        rows = [self._term_ids[t] for t in set(analyze(query)) if t in self._term_ids]
+        if not rows or k <= 0:
+            return np.zeros(0, dtype="int64"), np.zeros(0, dtype="float32")
+        n = len(self.doc_ids)
+        ids_parts, score_parts = [], []
+        for r in rows:
+            a, b = int(self.term_off[r]), int(self.term_off[r + 1])
+            ids = self.post_ids[a:b]
+            tf = self.post_tf[a:b]
+            if allowed is not None:
+                keep = ids < len(allowed)
+                keep[keep] = allowed[ids[keep]]
+                ids, tf = ids[keep], tf[keep]
+            tf = tf.astype("float32")
+            dl = self.doc_len[np.searchsorted(self.doc_ids, ids)].astype("float32")
+            idf = np.log1p((n - (b - a) + 0.5) / ((b - a) + 0.5))
+            norm = BM25_K1 * (1.0 - BM25_B + BM25_B * dl / self._avg_len)
+            ids_parts.append(ids)
+            score_parts.append(idf * tf * (BM25_K1 + 1.0) / (tf + norm))
+        if len(rows) == 1:
+            uniq, scores = ids_parts[0], score_parts[0]
+        else:
+            uniq, inverse = np.unique(np.concatenate(ids_parts), return_inverse=True)
+            scores = np.bincount(inverse, weights=np.concatenate(score_parts)).astype("float32")
+        if len(uniq) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            uniq, scores = uniq[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return uniq[order].astype("int64"), scores[order].astype("float32")
+
+
+class LexicalUpdate:
+    """Applies removals and additions to a lexical index.
+
+    Chunks are analyzed as they are added and only their compact postings are
+    kept, so a streaming ingest does not have to hold the texts. Existing
+    postings are carried over as arrays and are never re-tokenized.
+    """
+
+    def __init__(self, base: LexicalIndex) -> None:
+        self._base = base
+        self._terms = list(base.terms)
+        self._term_ids = dict(base._term_ids)
+        self._drop = array("q")
+        self._post_terms = array("q")
+        self._post_ids = array("I")
+        self._post_tf = array("H")
+        self._doc_ids = array("I")
+        self._doc_len = array("I")
+
+    def remove(self, ids: Iterable[int]) -> None:
+        self._drop.extend(ids)
+
+    def add(self, ids: list[int], texts: list[str]) -> None:
+        # Ids already in the base index are replaced; ids must be distinct within one update.
+        self._drop.extend(ids)
+        for id_, text in zip(ids, texts, strict=True):
+            if not 0 <= id_ < 2**32:
+                raise ValueError(f"chunk id {id_} does not fit the lexical index")
+            tokens = analyze(text)
+            self._doc_ids.append(id_)
+            self._doc_len.append(len(tokens))
+            for term, tf in Counter(tokens).items():
+                row = self._term_ids.get(term)
+                if row is None:
+                    row = self._term_ids[term] = len(self._terms)
+                    self._terms.append(term)
+                self._post_terms.append(row)
+                self._post_ids.append(id_)
+                self._post_tf.append(min(tf, 0xFFFF))
+
+    def to_bytes(self) -> bytes:
+        base = self._base
+        drop = np.frombuffer(self._drop, dtype="int64") if self._drop else np.zeros(0, "int64")
+        keep_post = ~np.isin(base.post_ids, drop)
+        keep_doc = ~np.isin(base.doc_ids, drop)
+        counts = np.diff(base.term_off.astype("int64"))
+        old_terms = np.repeat(np.arange(len(base.terms), dtype="int64"), counts)
+
+        term_col = np.concatenate([old_terms[keep_post], np.asarray(self._post_terms, dtype="int64")])
+        post_ids = np.concatenate([base.post_ids[keep_post], np.asarray(self._post_ids, dtype="<u4")])
+        post_tf = np.concatenate([base.post_tf[keep_post], np.asarray(self._post_tf, dtype="<u2")])
+        doc_ids = np.concatenate([base.doc_ids[keep_doc], np.asarray(self._doc_ids, dtype="<u4")])
+        doc_len = np.concatenate([base.doc_len[keep_doc], np.asarray(self._doc_len, dtype="<u4")])
+
+        # Drop terms that lost all their postings, then sort postings by (term, id).
+        used, term_col = np.unique(term_col, return_inverse=True)
+        order = np.lexsort((post_ids, term_col))
+        term_off = np.zeros(len(used) + 1, dtype="<u8")
+        np.cumsum(np.bincount(term_col, minlength=len(used)), out=term_off[1:])
+        doc_order = np.argsort(doc_ids, kind="stable")
+        return _encode(
+            [self._terms[i] for i in used.tolist()],
+            doc_ids[doc_order],
+            doc_len[doc_order],
+            term_off,
+            post_ids[order],
+            post_tf[order],
+        )
+
+
+def _encode(
+    terms: list[str],
+    doc_ids: np.ndarray,
+    doc_len: np.ndarray,
+    term_off: np.ndarray,
+    post_ids: np.ndarray,
+    post_tf: np.ndarray,
+) -> bytes:
+    n_docs, n_post = len(doc_ids), len(post_ids)
+    parts = [
+        _HEADER.pack(_MAGIC, _VERSION, len(terms), n_docs, n_post, int(doc_len.sum())),
+        doc_ids.astype("<u4").tobytes(),
+        doc_len.astype("<u4").tobytes(),
+        b"\0" * _pad8(8 * n_docs),
+        term_off.astype("<u8").tobytes(),
+        post_ids.astype("<u4").tobytes(),
+        post_tf.astype("<u2").tobytes(),
+        b"\0" * _pad8(6 * n_post),
+        "\n".join(terms).encode("utf-8"),
+    ]
+    return b"".join(parts)
+
+
+def rrf_fuse(rankings: list[list[int]], k: int, *, c: int = 60) -> tuple[list[int], list[float]]:
+    """Reciprocal rank fusion of several best-first id lists (-1 entries are ignored)."""
+
+    fused: dict[int, float] = {}
+    for ranking in rankings:
+        rank = 0
+        for id_ in ranking:
+            if id_ < 0:
+                continue
+            rank += 1
+            fused[id_] = fused.get(id_, 0.0) + 1.0 / (c + rank)
+    top = sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:k]
+    return [i for i, _ in top], [sc for _, sc in top]
@@ -1,36 +1,270 @@
-from __future__ import annotations
-
-import json
-import urllib.request
-from dataclasses import dataclass
-
-
-@dataclass(frozen=True)
-class LlmResult:
-    text: str
-    model: str
-
-
-def generate_with_ollama(
-    prompt: str,
-    *,
-    model: str = "llama3.1:8b",
-    base_url: str = "http://127.0.0.1:11434",
-    timeout_s: float = 30.0,
-) -> LlmResult:
-    """Generate using local Ollama (optional). Requires Ollama running locally."""
-
-    url = f"{base_url}/api/generate"
-    body = {"model": model, "prompt": prompt, "stream": False}
-
-    req = urllib.request.Request(
-        url,
-        data=json.dumps(body).encode("utf-8"),
-        headers={"Content-Type": "application/json"},
-        method="POST",
-    )
-
-    with urllib.request.urlopen(req, timeout=timeout_s) as resp:
-        payload = json.loads(resp.read().decode("utf-8"))
-
-    return LlmResult(text=str(payload.get("response", "")), model=model)
+from __future__ import annotations
+
+import asyncio
+import json
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+
+import httpx
+
+from assistant.config import (
+    OLLAMA_BASE_URL,
+    OLLAMA_KEEP_ALIVE,
+    OLLAMA_MAX_CONCURRENT,
+    OLLAMA_MODEL,
+    OLLAMA_NUM_CTX,
+    OLLAMA_NUM_THREAD,
+    OLLAMA_QUEUE_TIMEOUT_S,
+    OLLAMA_RETRIES,
+    OLLAMA_TIMEOUT_S,
+)
+from assistant.metrics import span
+
+# Worth retrying: Ollama is busy/restarting, or a pooled connection went stale.
+_RETRY_STATUS = {429, 502, 503, 504}
+_RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError, httpx.PoolTimeout)
+# Any other HTTP error (e.g. a 500 or 404) or an unparsable body is not retried
+# but still surfaces as LlmUnavailable("error") so callers can fall back.
+
+
+@dataclass(frozen=True)
+class LlmResult:
+    text: str
+    model: str
+    prompt_tokens: int | None = None  # Ollama's prompt_eval_count, when reported
+    queue_ms: float = 0.0
+    attempts: int = 1
+
+
+class LlmUnavailable(RuntimeError):
+    """No generation: the queue wait exceeded its deadline or retries ran out."""
+
+    def __init__(self, reason: str, detail: str = "") -> None:
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason  # queue_timeout | timeout | error
+
+
+class _Retry(Exception):
+    pass
+
+
+class OllamaClient:
+    """Shared client for a local Ollama server.
+
+    One pooled keep-alive HTTP session per mode (sync for scripts, async for the
+    API). Every request carries `keep_alive`, so the model stays loaded between
+    calls, and the `num_ctx`/`num_thread` options. At most `max_concurrent`
+    generations run at once; other callers queue for up to `queue_timeout_s`
+    and then get `LlmUnavailable("queue_timeout")` so they can answer
+    extractively instead. Connection errors and busy statuses are retried with
+    exponential backoff, and streams only until the first token. Every other
+    failure is raised as `LlmUnavailable` too.
+    """
+
+    def __init__(
+        self,
+        base_url: str = OLLAMA_BASE_URL,
+        model: str = OLLAMA_MODEL,
+        *,
+        keep_alive: str = OLLAMA_KEEP_ALIVE,
+        num_ctx: int = OLLAMA_NUM_CTX,
+        num_thread: int = OLLAMA_NUM_THREAD,
+        max_concurrent: int = OLLAMA_MAX_CONCURRENT,
+        queue_timeout_s: float = OLLAMA_QUEUE_TIMEOUT_S,
+        timeout_s: float = OLLAMA_TIMEOUT_S,
+        retries: int = OLLAMA_RETRIES,
+        backoff_s: float = 0.25,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.keep_alive = keep_alive
+        self.num_ctx = num_ctx
+        self.num_thread = num_thread
+        self.max_concurrent = max(1, max_concurrent)
+        self.queue_timeout_s = queue_timeout_s
+        self.retries = retries
+        self.backoff_s = backoff_s
+        self._timeout = httpx.Timeout(timeout_s, connect=5.0)
+        self._limits = httpx.Limits(max_connections=self.max_concurrent + 2, max_keepalive_connections=self.max_concurrent)
+        self._http: httpx.Client | None = None
+        self._ahttp: httpx.AsyncClient | None = None
+        self._sem = threading.BoundedSemaphore(self.max_concurrent)
+        self._asem: asyncio.Semaphore | None = None
+        self._lock = threading.Lock()
+        self.waiting = 0  # callers currently queued for a slot
+
+    @property
+    def http(self) -> httpx.Client:
+        with self._lock:
+            if self._http is None:
+                self._http = httpx.Client(base_url=self.base_url, timeout=self._timeout, limits=self._limits)
+            return self._http
+
+    @property
+    def ahttp(self) -> httpx.AsyncClient:
+        if self._ahttp is None:
+            self._ahttp = httpx.AsyncClient(base_url=self.base_url, timeout=self._timeout, limits=self._limits)
+        return self._ahttp
+
+    def close(self) -> None:
+        if self._http is not None:
+            self._http.close()
+
+    async def aclose(self) -> None:
+        if self._ahttp is not None:
+            await self._ahttp.aclose()
+        self.close()
+
+    def _body(self, prompt: str, stream: bool) -> dict[str, Any]:
+        options: dict[str, Any] = {"num_ctx": self.num_ctx}
+        if self.num_thread > 0:
+            options["num_thread"] = self.num_thread
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "keep_alive": self.keep_alive,
+            "options": options,
+        }
+
+    def _delay(self, attempt: int) -> float:
+        return self.backoff_s * (2**attempt) * (0.5 + random.random())
+
+    def _result(self, payload: dict[str, Any], queue_ms: float, attempts: int) -> LlmResult:
+        return LlmResult(
+            text=str(payload.get("response", "")),
+            model=self.model,
+            prompt_tokens=payload.get("prompt_eval_count"),
+            queue_ms=queue_ms,
+            attempts=attempts,
+        )
+
+    @staticmethod
+    def _check(resp: httpx.Response) -> None:
+        if resp.status_code in _RETRY_STATUS:
+            raise _Retry(f"HTTP {resp.status_code}")
+        resp.raise_for_status()
+
+    # -- sync ---------------------------------------------------------------
+
+    def _acquire(self) -> float:
+        t0 = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+        try:
+            with span("llm_queue"):
+                ok = self._sem.acquire(timeout=self.queue_timeout_s)
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        if not ok:
+            raise LlmUnavailable("queue_timeout", f"no slot within {self.queue_timeout_s:.1f}s")
+        return (time.perf_counter() - t0) * 1000
+
+    def generate(self, prompt: str) -> LlmResult:
+        queue_ms = self._acquire()
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    with span("ollama_http"):
+                        resp = self.http.post("/api/generate", json=self._body(prompt, False))
+                    self._check(resp)
+                    return self._result(resp.json(), queue_ms, attempt + 1)
+                except (_Retry, *_RETRY_ERRORS) as exc:
+                    if attempt == self.retries:
+                        raise LlmUnavailable("error", repr(exc)) from exc
+                    time.sleep(self._delay(attempt))
+                except httpx.ReadTimeout as exc:
+                    raise LlmUnavailable("timeout", repr(exc)) from exc
+                except (httpx.HTTPError, ValueError) as exc:
+                    raise LlmUnavailable("error", repr(exc)) from exc
+            raise AssertionError("unreachable")
+        finally:
+            self._sem.release()
+
+    # -- async --------------------------------------------------------------
+
+    async def _aacquire(self) -> float:
+        if self._asem is None:
+            self._asem = asyncio.Semaphore(self.max_concurrent)
+        t0 = time.perf_counter()
+        with self._lock:
+            self.waiting += 1
+        try:
+            with span("llm_queue"):
+                await asyncio.wait_for(self._asem.acquire(), timeout=self.queue_timeout_s)
+        except asyncio.TimeoutError:
+            raise LlmUnavailable("queue_timeout", f"no slot within {self.queue_timeout_s:.1f}s") from None
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        return (time.perf_counter() - t0) * 1000
+
+    async def agenerate(self, prompt: str) -> LlmResult:
+        queue_ms = await self._aacquire()
+        try:
+            for attempt in range(self.retries + 1):
+                try:
+                    with span("ollama_http"):
+                        resp = await self.ahttp.post("/api/generate", json=self._body(prompt, False))
+                    self._check(resp)
+                    return self._result(resp.json(), queue_ms, attempt + 1)
+                except (_Retry, *_RETRY_ERRORS) as exc:
+                    if attempt == self.retries:
+                        raise LlmUnavailable("error", repr(exc)) from exc
+                    await asyncio.sleep(self._delay(attempt))
+                except httpx.ReadTimeout as exc:
+                    raise LlmUnavailable("timeout", repr(exc)) from exc
+                except (httpx.HTTPError, ValueError) as exc:
+                    raise LlmUnavailable("error", repr(exc)) from exc
+            raise AssertionError("unreachable")
+        finally:
+            self._asem.release()
+
+    async def astream(self, prompt: str) -> AsyncIterator[str]:
+        """Yield response tokens as Ollama produces them (its NDJSON streaming mode)."""
+
+        await self._aacquire()
+        try:
+            for attempt in range(self.retries + 1):
+                started = False
+                try:
+                    async with self.ahttp.stream("POST", "/api/generate", json=self._body(prompt, True)) as resp:
+                        self._check(resp)
+                        async for line in resp.aiter_lines():
+                            if not line.strip():
+                                continue
+                            item = json.loads(line)
+                            if item.get("response"):
+                                started = True
+                                yield str(item["response"])
+                            if item.get("done"):
+                                return
+                    return
+                except (_Retry, *_RETRY_ERRORS) as exc:
+                    if started or attempt == self.retries:
+                        raise LlmUnavailable("error", repr(exc)) from exc
+                    await asyncio.sleep(self._delay(attempt))
+                except httpx.ReadTimeout as exc:
+                    raise LlmUnavailable("timeout", repr(exc)) from exc
+                except (httpx.HTTPError, ValueError) as exc:
+                    raise LlmUnavailable("error", repr(exc)) from exc
+        finally:
+            self._asem.release()
+
+
+_default: OllamaClient | None = None
+_default_lock = threading.Lock()
+
+
+def default_client() -> OllamaClient:
+    """Process-wide client for callers that do not manage their own (scripts)."""
+
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = OllamaClient()
+        return _default
@@ -1,25 +1,215 @@
-from __future__ import annotations
-
-import json
-import time
-from dataclasses import dataclass
-from pathlib import Path
-from typing import Any
-
-
-@dataclass(frozen=True)
-class LogEvent:
-    ts: float
-    event: str
-    payload: dict[str, Any]
-
-
-class JsonlLogger:
-    def __init__(self, path: Path) -> None:
-        self.path = path
-        self.path.parent.mkdir(parents=True, exist_ok=True)
-
-    def log(self, event: str, **payload: Any) -> None:
-        item = LogEvent(ts=time.time(), event=event, payload=payload)
-        with self.path.open("a", encoding="utf-8") as f:
-            f.write(json.dumps(item.__dict__, ensure_ascii=False) + "\n")
+from __future__ import annotations
+
+import atexit
+import contextlib
+import gzip
+import itertools
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from assistant.io_utils import FileLock
+
+
+@dataclass(frozen=True)
+class LogEvent:
+    ts: float
+    event: str
+    payload: dict[str, Any]
+
+
+@dataclass(frozen=True)
+class LogSettings:
+    queue_size: int = 10_000
+    batch_size: int = 256
+    flush_interval_s: float = 0.5
+    max_bytes: int = 50 * 1024 * 1024  # 0 disables size-based rotation
+    rotate_interval_s: float = 0.0  # 0 disables time-based rotation
+    backup_count: int = 5
+    compress: bool = True
+    overflow: str = "drop"  # drop | block
+    per_process: bool = False  # write to <name>.<pid><suffix> instead of a shared file
+
+
+DEFAULT_LOG_SETTINGS = LogSettings(
+    max_bytes=int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024))),
+    rotate_interval_s=float(os.getenv("LOG_ROTATE_INTERVAL_S", "0")),
+    backup_count=int(os.getenv("LOG_BACKUPS", "5")),
+    compress=os.getenv("LOG_COMPRESS", "1") == "1",
+    overflow=os.getenv("LOG_OVERFLOW", "drop"),
+    per_process=os.getenv("LOG_PER_PROCESS", "0") == "1",
+)
+
+_STOP = object()
+
+
+class JsonlLogger:
+    """JSONL event log written by a background thread.
+
+    `log` only enqueues; the writer serializes events and appends them in
+    batches (on `batch_size`, every `flush_interval_s`, or at once on `flush`).
+    A shared file is appended to and rotated under a lock file next to it, so
+    batches from several workers never interleave and none is lost to another
+    worker's rotation. Files are rotated by size/age and optionally
+    gzip-compressed. When the queue is full events are dropped (and counted)
+    or the caller blocks, depending on `overflow`. Pending events are flushed
+    at interpreter exit. A forked child starts its own writer (events queued
+    before the fork are left to the parent).
+    """
+
+    def __init__(self, path: Path, *, settings: LogSettings = DEFAULT_LOG_SETTINGS) -> None:
+        self._base_path = path
+        self.settings = settings
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._fd: int | None = None
+        self._closed = False
+        self._start()
+        atexit.register(self.close)
+        if hasattr(os, "register_at_fork"):
+            ref = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: (lg := ref()) is not None and lg._after_fork())
+
+    def _start(self) -> None:
+        path = self._base_path
+        if self.settings.per_process:
+            path = path.with_name(f"{path.stem}.{os.getpid()}{path.suffix}")
+        self.path = path
+        # Only a file shared between processes needs one (e.g. reports/run.lock).
+        self._file_lock = None if self.settings.per_process else FileLock(path.with_suffix(".lock"))
+        self.dropped = 0
+        self._queue: queue.Queue[Any] = queue.Queue(maxsize=self.settings.queue_size)
+        self._opened_at = 0.0
+        self._thread = threading.Thread(target=self._run, name="jsonl-logger", daemon=True)
+        self._thread.start()
+
+    def _after_fork(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if not self._closed:
+            self._start()
+
+    def log(self, event: str, **payload: Any) -> None:
+        item = LogEvent(ts=time.time(), event=event, payload=payload)
+        if self.settings.overflow == "block":
+            self._queue.put(item)
+            return
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout_s: float = 5.0) -> None:
+        """Block until everything logged so far is on disk."""
+
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout_s)
+        except queue.Full:
+            return
+        done.wait(timeout_s)
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join(timeout=10.0)
+
+    # --- writer thread -------------------------------------------------
+
+    def _run(self) -> None:
+        s = self.settings
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + s.flush_interval_s
+            # A flush() or close() marker ends the batch: its caller is waiting.
+            while len(batch) < s.batch_size and isinstance(batch[-1], LogEvent):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            lines: list[str] = []
+            waiters: list[threading.Event] = []
+            stop = False
+            for item in batch:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    lines.append(json.dumps(item.__dict__, ensure_ascii=False, default=str) + "\n")
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                lines.append(json.dumps(LogEvent(time.time(), "Log_Dropped", {"count": dropped}).__dict__) + "\n")
+            if lines:
+                try:
+                    self._write("".join(lines).encode("utf-8"))
+                except OSError:
+                    pass  # logging must never take the service down
+            for w in waiters:
+                w.set()
+            if stop:
+                if self._fd is not None:
+                    os.close(self._fd)
+                    self._fd = None
+                return
+
+    def _open(self) -> int:
+        # Reopen when another process rotated the file away under us.
+        if self._fd is not None:
+            try:
+                if os.stat(self.path).st_ino == os.fstat(self._fd).st_ino:
+                    return self._fd
+            except FileNotFoundError:
+                pass
+            os.close(self._fd)
+        self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._opened_at = time.time()
+        return self._fd
+
+    def _write(self, data: bytes) -> None:
+        with self._file_lock or contextlib.nullcontext():
+            fd = self._open()
+            view = memoryview(data)
+            while view:  # os.write may write less than asked (signals, full disk, pipes)
+                view = view[os.write(fd, view) :]
+            s = self.settings
+            too_big = s.max_bytes and os.fstat(fd).st_size >= s.max_bytes
+            too_old = s.rotate_interval_s and time.time() - self._opened_at >= s.rotate_interval_s
+            if too_big or too_old:
+                self._rotate()
+
+    def _rotate(self) -> None:
+        # Called with the file lock held: no other worker appends or rotates meanwhile.
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        for n in itertools.count():
+            # Unique even for several rotations within one second.
+            target = self.path.with_name(f"{self.path.name}.{stamp}-{os.getpid()}" + (f"-{n}" if n else ""))
+            if not target.exists() and not target.with_name(f"{target.name}.gz").exists():
+                break
+        try:
+            os.replace(self.path, target)
+        except FileNotFoundError:
+            return
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        if self.settings.compress:
+            with target.open("rb") as src, gzip.open(f"{target}.gz", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            target.unlink()
+        backups = sorted(self.path.parent.glob(f"{self.path.name}.*"), key=lambda p: p.stat().st_mtime)
+        for old in backups[: max(0, len(backups) - self.settings.backup_count)]:
+            old.unlink(missing_ok=True)
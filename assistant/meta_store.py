@@ -0,0 +1,310 @@
+from __future__ import annotations
+
+import datetime as dt
+import io
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import BinaryIO, Iterable
+
+import numpy as np
+
+# Layout (little endian, every section 8-byte aligned):
+#   header      magic | version u32 | n_strings u32 | n_chunks u64
+#   ids         int64[n]      sorted, so lookups are a binary search (or direct)
+#   text_off    uint64[n]     offset of each chunk's text in the text blob
+#   text_len    uint32[n]
+#   chunk_ids   uint32[n]
+#   source_idx  uint32[n]     index into the interned string table
+#   span_start  int32[n]      character span of the chunk in its normalized
+#   span_end    int32[n]      document (v3+; -1 when unknown)
+#   lang_idx    uint32[n]     interned attributes (v4+)
+#   domain_idx  uint32[n]
+#   date        int32[n]      YYYYMMDD, 0 when unknown (v4+)
+#   str_off     uint64[s+1]   offsets into the string blob
+#   str_blob    utf-8 (sources, languages and domains)
+#   text_blob   utf-8, in write order (rows are sorted by id, texts are not)
+_MAGIC = b"TDSAMETA"
+_VERSION = 4
+_READABLE = (2, 3, 4)
+_HEADER = struct.Struct("<8sIIQ")
+
+
+@dataclass(frozen=True)
+class ChunkMeta:
+    id: int
+    source: str
+    chunk_id: int
+    text: str
+    start: int = -1
+    end: int = -1
+    lang: str = ""
+    domain: str = ""
+    date: str = ""  # ISO YYYY-MM-DD
+
+
+@dataclass(frozen=True)
+class ChunkFilter:
+    """Restricts a search to chunks matching every non-empty field.
+
+    `source` matches the full path or the file name. Dates are ISO strings and
+    the range is inclusive; chunks without a date never match a date range.
+    """
+
+    lang: tuple[str, ...] = ()
+    domain: tuple[str, ...] = ()
+    source: tuple[str, ...] = ()
+    date_from: str | None = None
+    date_to: str | None = None
+
+    def __bool__(self) -> bool:
+        return bool(self.lang or self.domain or self.source or self.date_from or self.date_to)
+
+
+def _date_int(iso: str) -> int:
+    # YYYYMMDD; 0 (no date) for an empty or malformed value rather than an error.
+    try:
+        day = dt.date.fromisoformat(iso[:10])
+    except ValueError:
+        return 0
+    return day.year * 10000 + day.month * 100 + day.day
+
+
+def _date_iso(value: int) -> str:
+    return f"{value // 10000:04d}-{value // 100 % 100:02d}-{value % 100:02d}" if value else ""
+
+
+def _pad8(n: int) -> int:
+    return (8 - n % 8) % 8
+
+
+class MetaWriter:
+    """Streams chunk records to a metadata file without holding the texts in memory.
+
+    Texts are spooled to a temporary blob as they arrive; only the fixed-size
+    columns are kept until `finish` sorts them by id and writes the file.
+    """
+
+    def __init__(self) -> None:
+        self._blob = tempfile.TemporaryFile()
+        self._blob_len = 0
+        self._ids: list[int] = []
+        self._text_off: list[int] = []
+        self._text_len: list[int] = []
+        self._chunk_ids: list[int] = []
+        self._src_idx: list[int] = []
+        self._strings: dict[str, int] = {}
+        self._starts: list[int] = []
+        self._ends: list[int] = []
+        self._langs: list[int] = []
+        self._domains: list[int] = []
+        self._dates: list[int] = []
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, record: ChunkMeta) -> None:
+        data = record.text.encode("utf-8")
+        self._blob.write(data)
+        self._ids.append(record.id)
+        self._text_off.append(self._blob_len)
+        self._text_len.append(len(data))
+        self._chunk_ids.append(record.chunk_id)
+        self._src_idx.append(self._intern(record.source))
+        self._starts.append(record.start)
+        self._ends.append(record.end)
+        self._langs.append(self._intern(record.lang))
+        self._domains.append(self._intern(record.domain))
+        self._dates.append(_date_int(record.date))
+        self._blob_len += len(data)
+
+    def _intern(self, value: str) -> int:
+        return self._strings.setdefault(value, len(self._strings))
+
+    def _write(self, out: BinaryIO) -> None:
+        order = np.argsort(np.asarray(self._ids, dtype="<i8"), kind="stable")
+        src_bytes = [s.encode("utf-8") for s in self._strings]
+        src_off = np.zeros(len(src_bytes) + 1, dtype="<u8")
+        np.cumsum([len(b) for b in src_bytes], out=src_off[1:])
+        src_blob = b"".join(src_bytes)
+
+        out.write(_HEADER.pack(_MAGIC, _VERSION, len(src_bytes), len(self._ids)))
+        out.write(np.asarray(self._ids, dtype="<i8")[order].tobytes())
+        out.write(np.asarray(self._text_off, dtype="<u8")[order].tobytes())
+        out.write(np.asarray(self._text_len, dtype="<u4")[order].tobytes())
+        out.write(np.asarray(self._chunk_ids, dtype="<u4")[order].tobytes())
+        out.write(np.asarray(self._src_idx, dtype="<u4")[order].tobytes())
+        out.write(np.asarray(self._starts, dtype="<i4")[order].tobytes())
+        out.write(np.asarray(self._ends, dtype="<i4")[order].tobytes())
+        out.write(np.asarray(self._langs, dtype="<u4")[order].tobytes())
+        out.write(np.asarray(self._domains, dtype="<u4")[order].tobytes())
+        out.write(np.asarray(self._dates, dtype="<i4")[order].tobytes())
+        out.write(b"\0" * _pad8(4 * len(self._ids)))
+        out.write(src_off.tobytes())
+        out.write(src_blob + b"\0" * _pad8(len(src_blob)))
+        self._blob.seek(0)
+        shutil.copyfileobj(self._blob, out)
+
+    def to_bytes(self) -> bytes:
+        out = io.BytesIO()
+        self._write(out)
+        self._blob.close()
+        return out.getvalue()
+
+    def finish(self, path: Path) -> None:
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        with tmp.open("wb") as f:
+            self._write(f)
+        self._blob.close()
+        os.replace(tmp, path)
+
+
+def encode_meta(records: Iterable[ChunkMeta]) -> bytes:
+    writer = MetaWriter()
+    for r in records:
+        writer.add(r)
+    return writer.to_bytes()
+
+
+def write_meta(path: Path, records: Iterable[ChunkMeta]) -> None:
+    writer = MetaWriter()
+    for r in records:
+        writer.add(r)
+    writer.finish(path)
+
+
+class MetaStore:
+    """Read-only chunk metadata resolved by id without decoding the whole corpus.
+
+    When opened from disk the file is mmap'd, so every worker on the host shares
+    the same pages through the OS page cache.
+    """
+
+    def __init__(self, buf: bytes | mmap.mmap) -> None:
+        magic, version, n_strings, n = _HEADER.unpack_from(buf, 0)
+        if magic != _MAGIC or version not in _READABLE:
+            raise ValueError("Unsupported metadata file format")
+        self._buf = buf
+        off = _HEADER.size
+        self._ids = np.frombuffer(buf, dtype="<i8", count=n, offset=off)
+        off += 8 * n
+        self._text_off = np.frombuffer(buf, dtype="<u8", count=n, offset=off)
+        off += 8 * n
+        self._text_len = np.frombuffer(buf, dtype="<u4", count=n, offset=off)
+        off += 4 * n
+        self._chunk_ids = np.frombuffer(buf, dtype="<u4", count=n, offset=off)
+        off += 4 * n
+        self._src_idx = np.frombuffer(buf, dtype="<u4", count=n, offset=off)
+        off += 4 * n
+        if version >= 3:
+            self._starts = np.frombuffer(buf, dtype="<i4", count=n, offset=off)
+            self._ends = np.frombuffer(buf, dtype="<i4", count=n, offset=off + 4 * n)
+            off += 8 * n
+        else:
+            self._starts = self._ends = np.full(n, -1, dtype="<i4")
+        if version >= 4:
+            self._lang_idx = np.frombuffer(buf, dtype="<u4", count=n, offset=off)
+            self._domain_idx = np.frombuffer(buf, dtype="<u4", count=n, offset=off + 4 * n)
+            self._dates = np.frombuffer(buf, dtype="<i4", count=n, offset=off + 8 * n)
+            off += 12 * n
+        else:
+            # Older files have no attributes: point them at an empty string.
+            self._lang_idx = self._domain_idx = np.full(n, n_strings, dtype="<u4")
+            self._dates = np.zeros(n, dtype="<i4")
+        off += _pad8(4 * n)
+        str_off = np.frombuffer(buf, dtype="<u8", count=n_strings + 1, offset=off)
+        off += 8 * (n_strings + 1)
+        str_len = int(str_off[-1])
+        # The string table (sources, languages, domains) is tiny; decode it once.
+        self._strings = [
+            bytes(buf[off + int(a) : off + int(b)]).decode("utf-8")
+            for a, b in zip(str_off[:-1], str_off[1:])
+        ]
+        if version < 4:
+            self._strings.append("")
+        self._text_base = off + str_len + _pad8(str_len)
+        self._dense = n == 0 or (int(self._ids[0]) == 0 and int(self._ids[-1]) == n - 1)
+
+    @classmethod
+    def open(cls, path: Path) -> MetaStore:
+        with path.open("rb") as f:
+            if os.name == "nt":
+                # A live mapping would block os.replace of the file on Windows.
+                return cls(f.read())
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @classmethod
+    def from_json(cls, path: Path) -> MetaStore:
+        return cls(encode_meta(_iter_json_records(path)))
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _row(self, id_: int) -> int | None:
+        if self._dense:
+            return id_ if 0 <= id_ < len(self._ids) else None
+        row = int(np.searchsorted(self._ids, id_))
+        if row < len(self._ids) and int(self._ids[row]) == id_:
+            return row
+        return None
+
+    def get(self, id_: int) -> ChunkMeta | None:
+        row = self._row(id_)
+        if row is None:
+            return None
+        a = self._text_base + int(self._text_off[row])
+        b = a + int(self._text_len[row])
+        return ChunkMeta(
+            id=id_,
+            source=self._strings[int(self._src_idx[row])],
+            chunk_id=int(self._chunk_ids[row]),
+            text=bytes(self._buf[a:b]).decode("utf-8"),
+            start=int(self._starts[row]),
+            end=int(self._ends[row]),
+            lang=self._strings[int(self._lang_idx[row])],
+            domain=self._strings[int(self._domain_idx[row])],
+            date=_date_iso(int(self._dates[row])),
+        )
+
+    def select(self, flt: ChunkFilter) -> np.ndarray:
+        """Sorted ids of the chunks matching `flt`, computed on the columns only."""
+
+        mask = np.ones(len(self._ids), dtype=bool)
+        for values, col in ((flt.lang, self._lang_idx), (flt.domain, self._domain_idx)):
+            if values:
+                wanted = set(values)
+                mask &= np.isin(col, [i for i, s in enumerate(self._strings) if s in wanted])
+        if flt.source:
+            wanted = set(flt.source)
+            codes = [i for i, s in enumerate(self._strings) if s in wanted or Path(s).name in wanted]
+            mask &= np.isin(self._src_idx, codes)
+        # Undated chunks (0) never match a date bound; a malformed bound (also 0) matches nothing.
+        if flt.date_from:
+            day = _date_int(flt.date_from)
+            mask &= (self._dates > 0) & (self._dates >= day) & (day > 0)
+        if flt.date_to:
+            day = _date_int(flt.date_to)
+            mask &= (self._dates > 0) & (self._dates <= day)
+        return self._ids[mask]
+
+    def __iter__(self):
+        for id_ in self._ids.tolist():
+            yield self.get(id_)
+
+
+def _iter_json_records(path: Path) -> Iterable[ChunkMeta]:
+    for m in json.loads(path.read_text(encoding="utf-8")):
+        yield ChunkMeta(id=int(m["id"]), source=str(m["source"]), chunk_id=int(m["chunk_id"]), text=str(m["text"]))
+
+
+def convert_json_meta(json_path: Path, out_path: Path) -> int:
+    """One-shot conversion of a legacy docs_meta.json file. Returns the chunk count."""
+
+    records = list(_iter_json_records(json_path))
+    write_meta(out_path, records)
+    return len(records)
@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+# Latency buckets in seconds: 0.5 ms .. 60 s (covers language detection up to CPU LLM calls).
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+
+class Histogram:
+    """Cumulative-bucket histogram; `observe` is a bisect plus a few adds under a lock."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._hists: dict[tuple[str, str], Histogram] = {}
+        self._counters: dict[tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name: str, stage: str) -> Histogram:
+        key = (name, stage)
+        h = self._hists.get(key)
+        if h is None:
+            with self._lock:
+                h = self._hists.setdefault(key, Histogram())
+        return h
+
+    def inc(self, name: str, label: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[(name, label)] = self._counters.get((name, label), 0) + value
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+
+        lines: list[str] = []
+        by_name: dict[str, list[tuple[str, Histogram]]] = {}
+        for (name, stage), h in sorted(self._hists.items()):
+            by_name.setdefault(name, []).append((stage, h))
+        for name, items in by_name.items():
+            lines.append(f"# TYPE {name} histogram")
+            for stage, h in items:
+                with h._lock:
+                    counts, total, count = list(h.counts), h.sum, h.count
+                cumulative = 0
+                for bound, c in zip(h.buckets, counts):
+                    cumulative += c
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {total:.6f}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {count}')
+        counters: dict[str, list[tuple[str, int]]] = {}
+        for (name, label), v in sorted(self._counters.items()):
+            counters.setdefault(name, []).append((label, v))
+        for name, items in counters.items():
+            lines.append(f"# TYPE {name} counter")
+            for label, v in items:
+                lines.append(f'{name}{{kind="{label}"}} {v}')
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_METRIC = "assistant_stage_seconds"
+
+
+class Span:
+    __slots__ = ("seconds",)
+
+    def __init__(self) -> None:
+        self.seconds = 0.0
+
+    @property
+    def ms(self) -> float:
+        return round(self.seconds * 1000, 3)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[Span]:
+    """Time a pipeline stage into the `assistant_stage_seconds` histogram.
+
+    The yielded Span holds the duration after the block, for log events.
+    """
+
+    s = Span()
+    t0 = time.perf_counter()
+    try:
+        yield s
+    finally:
+        s.seconds = time.perf_counter() - t0
+        REGISTRY.histogram(STAGE_METRIC, stage).observe(s.seconds)
@@ -1,79 +1,945 @@
-from __future__ import annotations
-
-import json
-from dataclasses import dataclass
-from pathlib import Path
-from typing import Any
-
-import faiss
-import numpy as np
-from sentence_transformers import SentenceTransformer
-
-from assistant.config import DEFAULT_EMBED_MODEL, DEFAULT_TOP_K, Paths
-
-
-@dataclass(frozen=True)
-class Retrieved:
-    id: int
-    source: str
-    chunk_id: int
-    text: str
-    score: float
-
-
-class RagStore:
-    def __init__(self, paths: Paths, *, embed_model: str = DEFAULT_EMBED_MODEL) -> None:
-        self.paths = paths
-        self.embed_model_name = embed_model
-        self._model: SentenceTransformer | None = None
-
-    @property
-    def model(self) -> SentenceTransformer:
-        if self._model is None:
-            self.paths.hf_cache_dir.mkdir(parents=True, exist_ok=True)
-            # cache_folder makes the environment reproducible and reduces repeated downloads.
-            self._model = SentenceTransformer(
-                self.embed_model_name,
-                cache_folder=str(self.paths.hf_cache_dir),
-            )
-        return self._model
-
-    def _load_meta(self) -> list[dict[str, Any]]:
-        if not self.paths.meta_path.exists():
-            raise FileNotFoundError(f"Missing metadata: {self.paths.meta_path}")
-        return json.loads(self.paths.meta_path.read_text(encoding="utf-8"))
-
-    def build_and_save(self, texts: list[str]) -> None:
-        self.paths.data_index.mkdir(parents=True, exist_ok=True)
-        embeddings = self.model.encode(texts, normalize_embeddings=True)
-        emb = np.asarray(embeddings, dtype="float32")
-        index = faiss.IndexFlatIP(emb.shape[1])
-        index.add(emb)
-        faiss.write_index(index, str(self.paths.faiss_index_path))
-
-    def retrieve(self, query: str, *, top_k: int = DEFAULT_TOP_K) -> list[Retrieved]:
-        if not self.paths.faiss_index_path.exists():
-            raise FileNotFoundError(f"Missing FAISS index: {self.paths.faiss_index_path}")
-
-        index = faiss.read_index(str(self.paths.faiss_index_path))
-        meta = self._load_meta()
-
-        q = self.model.encode([query], normalize_embeddings=True)
-        q = np.asarray(q, dtype="float32")
-
-        scores, ids = index.search(q, top_k)
-        results: list[Retrieved] = []
-        for idx, score in zip(ids[0].tolist(), scores[0].tolist(), strict=True):
-            if idx < 0:
-                continue
-            m = meta[idx]
-            results.append(
-                Retrieved(
-                    id=int(m["id"]),
-                    source=str(m["source"]),
-                    chunk_id=int(m["chunk_id"]),
-                    text=str(m["text"]),
-                    score=float(score),
-                )
-            )
-        return results
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field, fields, replace
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from assistant.batching import MicroBatcher
+from assistant.config import (
+    DEFAULT_EMBED_MODEL,
+    EMBED_BACKEND,
+    EMBED_ONNX_THREADS,
+    DEFAULT_INDEX_SETTINGS,
+    DEFAULT_TOP_K,
+    EMBED_CACHE_MAX_BYTES,
+    FILTER_CACHE_SIZE,
+    FILTER_EXACT_MAX,
+    HYBRID_CANDIDATES,
+    INDEX_MMAP,
+    RERANK_CANDIDATES,
+    RETRIEVAL_MODE,
+    RRF_K,
+    SHARD_WORKERS,
+    WARMUP_BATCH_SIZES,
+    IndexFiles,
+    IndexSettings,
+    Paths,
+)
+from assistant.embed_cache import CacheStats, EmbeddingCache, text_sha256
+from assistant.embedders import Embedder, embedder_id, make_embedder
+from assistant.index_factory import (
+    MIN_IVF_VECTORS,
+    SearchTuning,
+    all_vectors,
+    make_index,
+    search_params,
+    supports_remove,
+    vectors_for_ids,
+)
+from assistant.io_utils import atomic_write_bytes, atomic_write_text
+from assistant.lexical import LexicalIndex, LexicalUpdate, rrf_fuse
+from assistant.logging_utils import JsonlLogger
+from assistant.meta_store import ChunkFilter, MetaStore, write_meta
+from assistant.metrics import span
+from assistant.reranker import Reranker
+from assistant.shards import ShardedIndex, shard_list, shard_of, stable_ids
+
+
+@dataclass(frozen=True)
+class Retrieved:
+    id: int
+    source: str
+    chunk_id: int
+    text: str
+    score: float
+    start: int = -1
+    end: int = -1
+
+
+@dataclass(frozen=True)
+class _Query:
+    text: str
+    top_k: int
+    tuning: SearchTuning | None
+    vector: np.ndarray | None = None  # precomputed query embedding, if any
+    filters: ChunkFilter | None = None
+    timings: dict | None = field(default=None, compare=False)  # filled with search timings if given
+
+
+@dataclass(frozen=True)
+class _Selection:
+    """Chunks matching one filter, resolved once per index generation."""
+
+    ids: np.ndarray
+    mask: np.ndarray  # bool by chunk id, for the lexical index
+    bitmap: np.ndarray  # backing store of `selector`; must outlive it
+    selector: faiss.IDSelector | None
+    vectors: np.ndarray | None  # small selections are searched exactly on these
+
+
+@dataclass(frozen=True)
+class _Snapshot:
+    # Index and metadata are always swapped together through one reference.
+    signature: tuple[int, ...]
+    files: IndexFiles
+    index: faiss.Index | ShardedIndex
+    meta: MetaStore
+    settings: IndexSettings
+    lexical: LexicalIndex | None  # None for indexes built before BM25 existed
+    selections: dict[ChunkFilter, _Selection] = field(default_factory=dict, compare=False, repr=False)
+
+
+# Representative citizen questions (French, Arabic, Darija) used to warm the encoder.
+_WARMUP_QUERIES = [
+    "Quelle est la procédure pour renouveler une carte d'identité nationale ?",
+    "ما هي الوثائق المطلوبة للحصول على رخصة بناء؟",
+    "كيفاش نجدد الباسبور متاعي؟",
+    "Comment déclarer mes revenus au régime forfaitaire ?",
+    "extrait de naissance en ligne",
+]
+
+
+def index_signature(paths: Paths) -> tuple[int, ...]:
+    """Identifies the published index generation from file stats alone (any process)."""
+
+    # The generation marker is replaced last by every publish (in any process).
+    # Older trees without it fall back to the data files' mtimes.
+    try:
+        st = os.stat(paths.generation_path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        pass
+    sig: list[int] = []
+    for p in (paths.faiss_index_path, paths.meta_path):
+        try:
+            st = os.stat(p)
+        except FileNotFoundError:
+            continue
+        sig.extend((st.st_mtime_ns, st.st_size))
+    return tuple(sig)
+
+
+def published_files(paths: Paths) -> IndexFiles:
+    """Files of the published generation; older trees keep them directly in data/index."""
+
+    try:
+        gen = json.loads(paths.generation_path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return paths.legacy_files
+    seq = int(gen.get("seq", 0))
+    return paths.generation_files(seq) if seq else paths.legacy_files
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    # Unchanged files are shared between generations; a hard link costs nothing.
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class RagStore:
+    def __init__(
+        self,
+        paths: Paths,
+        *,
+        embed_model: str = DEFAULT_EMBED_MODEL,
+        embed_backend: str = EMBED_BACKEND,
+        logger: JsonlLogger | None = None,
+        embed_cache: EmbeddingCache | None = None,
+        index_settings: IndexSettings = DEFAULT_INDEX_SETTINGS,
+        batch_window_ms: float = 0.0,
+        batch_max: int = 32,
+        reranker: Reranker | None = None,
+        rerank_candidates: int = RERANK_CANDIDATES,
+        mmap_index: bool = INDEX_MMAP,
+    ) -> None:
+        self.paths = paths
+        self.embed_model_name = embed_model
+        self.embed_backend = embed_backend
+        # Identifies the vectors (model + backend) for the embedding cache and the manifest.
+        self.embed_id = embedder_id(embed_model, embed_backend)
+        self.index_settings = index_settings
+        self.logger = logger
+        self._embed_cache = embed_cache
+        self.reranker = reranker
+        self.rerank_candidates = rerank_candidates
+        self.mmap_index = mmap_index
+        self._embedder: Embedder | None = None
+        self._embedder_lock = threading.Lock()
+        self._snapshot: _Snapshot | None = None
+        self._reload_lock = threading.Lock()
+        self._fanout: ThreadPoolExecutor | None = None
+        self._fanout_lock = threading.Lock()
+        # With a window, concurrent retrieve() calls share one encode + one search.
+        self._batcher: MicroBatcher[_Query, list[Retrieved]] | None = None
+        self._encoder: MicroBatcher[str, np.ndarray] | None = None
+        if batch_window_ms > 0:
+            self._batcher = MicroBatcher(self._retrieve_batch, max_batch=batch_max, max_wait_ms=batch_window_ms)
+            self._encoder = MicroBatcher(self._encode_queries, max_batch=batch_max, max_wait_ms=batch_window_ms)
+        if hasattr(os, "register_at_fork"):
+            # Pool threads do not survive fork; a forked worker starts its own on first search.
+            ref = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: (s := ref()) is not None and setattr(s, "_fanout", None))
+
+    @property
+    def embedder(self) -> Embedder:
+        """Query/chunk encoder for `embed_backend`, loaded on first use."""
+
+        if self._embedder is None:
+            with self._embedder_lock:
+                if self._embedder is None:
+                    self._embedder = make_embedder(
+                        self.embed_model_name,
+                        self.embed_backend,
+                        cache_dir=self.paths.hf_cache_dir,
+                        onnx_root=self.paths.onnx_dir,
+                        threads=EMBED_ONNX_THREADS,
+                    )
+        return self._embedder
+
+    def _load_meta(self, files: IndexFiles) -> MetaStore:
+        if files.meta_path.exists():
+            return MetaStore.open(files.meta_path)
+        if files == self.paths.legacy_files and self.paths.legacy_meta_path.exists():
+            # Not converted yet: decode the JSON once into the same compact layout.
+            return MetaStore.from_json(self.paths.legacy_meta_path)
+        raise FileNotFoundError(f"Missing metadata: {files.meta_path}")
+
+    @staticmethod
+    def _load_index_settings(files: IndexFiles) -> IndexSettings:
+        # Indexes written before index kinds existed are exhaustive Flat indexes.
+        if not files.index_settings_path.exists():
+            return IndexSettings()
+        data = json.loads(files.index_settings_path.read_text(encoding="utf-8"))
+        known = {f.name for f in fields(IndexSettings)}
+        return IndexSettings(**{k: v for k, v in data.items() if k in known})
+
+    @staticmethod
+    def _load_lexical(files: IndexFiles) -> LexicalIndex | None:
+        if not files.lexical_index_path.exists():
+            return None
+        return LexicalIndex.open(files.lexical_index_path)
+
+    def _signature(self) -> tuple[int, ...]:
+        return index_signature(self.paths)
+
+    @staticmethod
+    def _index_files(files: IndexFiles, settings: IndexSettings) -> list[Path]:
+        if settings.shards <= 1:
+            return [files.faiss_index_path]
+        return [files.shard_path(i) for i in range(settings.shards)]
+
+    def _read_index(self, path: Path) -> faiss.Index:
+        if not self.mmap_index:
+            return faiss.read_index(str(path))
+        # Vectors stay in the page cache, shared by every process mapping the file. Publishing
+        # replaces the file, so a mapped generation stays valid until its snapshot is dropped.
+        flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+        return faiss.read_index(str(path), flag | faiss.IO_FLAG_READ_ONLY)
+
+    def _load_snapshot(self) -> _Snapshot:
+        # Retry if a writer bumped the generation while we were reading, so the
+        # index/metadata pair we keep always belongs to the same generation.
+        for _ in range(5):
+            before = self._signature()
+            files = published_files(self.paths)
+            try:
+                settings = self._load_index_settings(files)
+                index_paths = self._index_files(files, settings)
+                for path in index_paths:
+                    if not path.exists():
+                        raise FileNotFoundError(f"Missing FAISS index: {path}")
+                with span("index_load"):
+                    shards = [self._read_index(path) for path in index_paths]
+                    index = shards[0] if len(shards) == 1 else ShardedIndex(tuple(shards))
+                    meta = self._load_meta(files)
+                    lexical = self._load_lexical(files)
+            except FileNotFoundError:
+                # A generation published meanwhile may have collected the one we were reading.
+                if self._signature() == before:
+                    raise
+                continue
+            if self._signature() == before:
+                return _Snapshot(
+                    signature=before, files=files, index=index, meta=meta, settings=settings, lexical=lexical
+                )
+            time.sleep(0.05)
+        raise RuntimeError("Index kept changing while loading; retry later.")
+
+    def snapshot(self) -> _Snapshot:
+        """Current in-memory index/metadata pair, reloaded if the files changed."""
+
+        snap = self._snapshot
+        if snap is not None and snap.signature == self._signature():
+            return snap
+        with self._reload_lock:
+            snap = self._snapshot
+            if snap is None or snap.signature != self._signature():
+                snap = self._load_snapshot()
+                self._snapshot = snap
+        return snap
+
+    def _claim_generation(self) -> IndexFiles:
+        """Private directory for the next generation; invisible to readers until committed."""
+
+        gen_root = self.paths.generation_files(0).root.parent
+        gen_root.mkdir(parents=True, exist_ok=True)
+        seq = max((int(p.name) for p in gen_root.iterdir() if p.name.isdigit()), default=0) + 1
+        while True:
+            files = self.paths.generation_files(seq)
+            try:
+                files.root.mkdir()
+                return files
+            except FileExistsError:
+                seq += 1  # claimed by a concurrent writer
+
+    def _commit_generation(self, files: IndexFiles, previous: IndexFiles) -> None:
+        # Replacing the marker switches every reader to `files` at once.
+        seq = int(files.root.name)
+        gen = {"seq": seq, "ts": time.time(), "pid": os.getpid()}
+        atomic_write_text(self.paths.generation_path, json.dumps(gen))
+        # Keep the previous generation for readers still loading it; drop older ones, and
+        # abandoned directories of failed publishes once a newer generation exists.
+        for path in files.root.parent.iterdir():
+            if path.name.isdigit() and int(path.name) < seq and path != previous.root:
+                shutil.rmtree(path, ignore_errors=True)
+        legacy = self.paths.legacy_files
+        if previous != legacy:
+            for path in (
+                legacy.faiss_index_path,
+                legacy.meta_path,
+                legacy.index_settings_path,
+                legacy.lexical_index_path,
+                legacy.manifest_path,
+            ):
+                path.unlink(missing_ok=True)
+            shutil.rmtree(legacy.shard_path(0).parent, ignore_errors=True)
+
+    @property
+    def embed_cache(self) -> EmbeddingCache:
+        if self._embed_cache is None:
+            self._embed_cache = EmbeddingCache(self.paths.embed_cache_path, max_bytes=EMBED_CACHE_MAX_BYTES)
+        return self._embed_cache
+
+    @property
+    def max_tokens(self) -> int:
+        return self.embedder.max_seq_length
+
+    def count_tokens(self, text: str) -> int:
+        return self.embedder.count_tokens(text)
+
+    def _embed(self, texts: list[str]) -> np.ndarray:
+        """Embed corpus chunks, reusing cached vectors and batch-encoding only the misses."""
+
+        if not texts:
+            return np.zeros((0, self.embedder.dim), dtype="float32")
+        cache = self.embed_cache
+        keys = [text_sha256(t) for t in texts]
+        cached = cache.get_many(self.embed_id, True, keys)
+
+        miss_rows = [i for i, k in enumerate(keys) if k not in cached]
+        evicted = 0
+        if miss_rows:
+            miss_texts = [texts[i] for i in miss_rows]
+            encoded = self.embedder.encode(miss_texts)
+            evicted = cache.put_many(self.embed_id, True, [keys[i] for i in miss_rows], encoded)
+            for i, vec in zip(miss_rows, encoded):
+                cached[keys[i]] = vec
+
+        if self.logger is not None:
+            stats = CacheStats(
+                hits=len(texts) - len(miss_rows),
+                misses=len(miss_rows),
+                bytes=cache.size_bytes(),
+                evicted=evicted,
+            )
+            self.logger.log("Embed_Cache", model=self.embed_id, **stats.__dict__)
+        return np.stack([cached[k] for k in keys]).astype("float32", copy=False)
+
+    def _publish(
+        self,
+        files: IndexFiles,
+        changed: dict[int, faiss.Index],
+        settings: IndexSettings,
+        lexical: bytes,
+        base: _Snapshot | None,
+    ) -> int:
+        """Complete generation `files` and commit it.
+
+        The `changed` shards (all of them after a reset) are written; the others are linked
+        from `base`, as is the metadata when the update wrote none. Nothing is visible to
+        readers until the generation marker is replaced, so a failure leaves the live
+        generation untouched. Returns the number of vectors in the published index.
+        """
+
+        atomic_write_text(files.index_settings_path, json.dumps(asdict(settings)))
+        atomic_write_bytes(files.lexical_index_path, lexical)
+        index_paths = self._index_files(files, settings)
+        base_paths = self._index_files(base.files, base.settings) if base is not None else []
+        for i, path in enumerate(index_paths):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if i in changed:
+                faiss.write_index(changed[i], str(path))
+            else:
+                _link_or_copy(base_paths[i], path)
+        if not files.meta_path.exists():
+            if base is None:
+                # Full build after save_metadata(), which writes the flat-layout file.
+                _link_or_copy(self.paths.meta_path, files.meta_path)
+            elif base.files.meta_path.exists():
+                _link_or_copy(base.files.meta_path, files.meta_path)
+            else:
+                write_meta(files.meta_path, iter(base.meta))  # legacy JSON metadata
+        meta = MetaStore.open(files.meta_path)
+        lex = self._load_lexical(files)
+        self._commit_generation(files, base.files if base is not None else published_files(self.paths))
+
+        kept = shard_list(base.index) if base is not None else ()
+        shards = [changed[i] if i in changed else kept[i] for i in range(len(index_paths))]
+        snap = _Snapshot(
+            signature=self._signature(),
+            files=files,
+            index=shards[0] if len(shards) == 1 else ShardedIndex(tuple(shards)),
+            meta=meta,
+            settings=settings,
+            lexical=lex,
+        )
+        with self._reload_lock:
+            self._snapshot = snap
+        return int(snap.index.ntotal)
+
+    def _updatable(self) -> _Snapshot | None:
+        """Live snapshot if its index can take id-based updates, else None (rebuild)."""
+
+        try:
+            snap = self.snapshot()
+        except FileNotFoundError:
+            return None
+        return snap if stable_ids(snap.index) else None
+
+    def _read_private(self, base: _Snapshot, shard: int) -> faiss.Index:
+        # Mutate a private copy: the live snapshot may be searched concurrently.
+        return faiss.read_index(str(self._index_files(base.files, base.settings)[shard]))
+
+    def _current_lexical(self, base: _Snapshot) -> LexicalIndex:
+        lexical = self._load_lexical(base.files)
+        if lexical is not None:
+            return lexical
+        # Index built before BM25 existed: index what the metadata holds once.
+        update = LexicalUpdate(LexicalIndex.empty())
+        for m in base.meta:
+            update.add([m.id], [m.text])
+        return LexicalIndex(update.to_bytes())
+
+    def incremental_count(self) -> int | None:
+        """Vectors in the live index if it supports id-based updates, else None."""
+
+        index = self.snapshot().index
+        return int(index.ntotal) if stable_ids(index) else None
+
+    def build_and_save(self, texts: list[str]) -> None:
+        self.update_index(add_ids=list(range(len(texts))), add_texts=texts, remove_ids=[], reset=True)
+
+    def begin_update(self, *, reset: bool = False) -> IndexUpdate:
+        """Start an update on a private copy of the index; call `publish` when done."""
+
+        self.paths.data_index.mkdir(parents=True, exist_ok=True)
+        base = None if reset else self._updatable()
+        files = self._claim_generation()
+        if base is None:
+            return IndexUpdate(self, files, self.index_settings, LexicalIndex.empty(), base=None)
+        return IndexUpdate(self, files, base.settings, self._current_lexical(base), base=base)
+
+    def update_index(
+        self,
+        *,
+        add_ids: list[int],
+        add_texts: list[str],
+        remove_ids: list[int],
+        reset: bool = False,
+    ) -> int:
+        """Apply an incremental change set to the on-disk index and publish it.
+
+        A reset takes the metadata written by `save_metadata`; an incremental
+        update keeps the current metadata. Returns the number of vectors in the
+        published index.
+        """
+
+        update = self.begin_update(reset=reset)
+        update.remove(remove_ids)
+        update.add(add_ids, add_texts)
+        return update.publish()
+
+    def retrieve(
+        self,
+        query: str,
+        *,
+        top_k: int = DEFAULT_TOP_K,
+        tuning: SearchTuning | None = None,
+        vector: np.ndarray | None = None,
+        filters: ChunkFilter | None = None,
+        timings: dict | None = None,
+    ) -> list[Retrieved]:
+        """Top-k search. `tuning` overrides nprobe/efSearch and the mode for this call only.
+
+        In `hybrid` mode the dense and BM25 rankings are fused by reciprocal rank,
+        and `score` is the fused score. Pass `vector` (from `embed_query`) to skip
+        encoding the query again. `filters` restrict the search itself to matching
+        chunks (language, domain, source, date), so no results are lost to post-filtering.
+        With a reranker, `rerank_candidates` are fetched and rescored by the
+        cross-encoder (`score` is then its score) unless `tuning.rerank` is False.
+        A `timings` dict receives the index search time (`search_ms`) and, on a
+        sharded index, the time of each shard (`shard_ms`).
+        """
+
+        rerank = self._use_rerank(tuning)
+        fetch = max(top_k, self.rerank_candidates) if rerank else top_k
+        q = _Query(text=query, top_k=fetch, tuning=tuning, vector=vector, filters=filters or None, timings=timings)
+        results = self._batcher.run(q) if self._batcher is not None else self._retrieve_batch([q])[0]
+        return self._rerank(query, results, top_k) if rerank else results
+
+    def retrieve_many(
+        self,
+        queries: list[str],
+        *,
+        top_k: int = DEFAULT_TOP_K,
+        tuning: SearchTuning | None = None,
+        filters: ChunkFilter | None = None,
+        vectors: list[np.ndarray] | None = None,
+    ) -> list[list[Retrieved]]:
+        """Bulk retrieval: one encode call and one index search for all queries.
+
+        `vectors` (from `embed_queries`) skips encoding the queries again.
+        """
+
+        rerank = self._use_rerank(tuning)
+        fetch = max(top_k, self.rerank_candidates) if rerank else top_k
+        vecs = vectors if vectors is not None else [None] * len(queries)
+        batch = [
+            _Query(text=q, top_k=fetch, tuning=tuning, vector=v, filters=filters or None) for q, v in zip(queries, vecs)
+        ]
+        results = self._retrieve_batch(batch)
+        if rerank:
+            results = [self._rerank(q, r, top_k) for q, r in zip(queries, results)]
+        return results
+
+    def _use_rerank(self, tuning: SearchTuning | None) -> bool:
+        if self.reranker is None:
+            return False
+        return tuning is None or tuning.rerank is None or tuning.rerank
+
+    def _rerank(self, query: str, candidates: list[Retrieved], top_k: int) -> list[Retrieved]:
+        """Cross-encoder reorder of `candidates`; first-stage order if over budget."""
+
+        if len(candidates) <= 1:
+            return candidates[:top_k]
+        with span("rerank"):
+            out = self.reranker.score(query, [c.id for c in candidates], [c.text for c in candidates])
+        if self.logger is not None:
+            self.logger.log(
+                "Rerank",
+                candidates=len(candidates),
+                cached=out.cached,
+                fallback=out.fallback,
+                duration_ms=round(out.ms, 3),
+            )
+        if out.scores is None:
+            return candidates[:top_k]
+        order = np.argsort(-out.scores, kind="stable")[:top_k]
+        return [replace(candidates[i], score=float(out.scores[i])) for i in order.tolist()]
+
+    def preload(self) -> bool:
+        """Load the embedding model, the reranker and the published index, without inference.
+
+        Safe to call before forking workers: weights and index pages are then
+        shared copy-on-write. Returns False when no index has been built yet.
+        """
+
+        self.embedder
+        if self.reranker is not None:
+            self.reranker.model
+        try:
+            self.snapshot()
+        except FileNotFoundError:
+            return False
+        return True
+
+    def warmup(self, batch_sizes: tuple[int, ...] = WARMUP_BATCH_SIZES) -> dict[str, float]:
+        """Preload, then encode and search once per batch size; returns ms per step.
+
+        The first forward passes allocate buffers and pick kernels, so real
+        queries after this run at steady-state latency. Bypasses the
+        micro-batcher and the reranker thread so it can run before serving.
+        """
+
+        timings: dict[str, float] = {}
+        t0 = time.perf_counter()
+        has_index = self.preload()
+        timings["load_ms"] = (time.perf_counter() - t0) * 1000
+        for bs in batch_sizes:
+            texts = [_WARMUP_QUERIES[i % len(_WARMUP_QUERIES)] for i in range(bs)]
+            t0 = time.perf_counter()
+            if has_index:
+                self._retrieve_batch([_Query(text=t, top_k=DEFAULT_TOP_K, tuning=None) for t in texts])
+            else:
+                self._encode_queries(texts)
+            timings[f"batch_{bs}_ms"] = (time.perf_counter() - t0) * 1000
+        if self.reranker is not None:
+            t0 = time.perf_counter()
+            self.reranker.warmup(_WARMUP_QUERIES[0], _WARMUP_QUERIES[1:])
+            timings["rerank_ms"] = (time.perf_counter() - t0) * 1000
+        if self.logger is not None:
+            self.logger.log("Warmup", index=has_index, **{k: round(v, 1) for k, v in timings.items()})
+        return timings
+
+    @property
+    def generation(self) -> tuple[int, ...]:
+        """Identifies the published index version; changes after every ingest."""
+
+        return self.snapshot().signature
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Normalized float32 embedding of one query (micro-batched when enabled)."""
+
+        if self._encoder is not None:
+            return self._encoder.run(query)
+        return self._encode_queries([query])[0]
+
+    def embed_queries(self, queries: list[str]) -> list[np.ndarray]:
+        """Embeddings of many queries in one encode call."""
+
+        return self._encode_queries(queries) if queries else []
+
+    def _encode_queries(self, texts: list[str]) -> list[np.ndarray]:
+        with span("encode"):
+            q = self.embedder.encode(texts)
+        return list(q)
+
+    @staticmethod
+    def _mode(snap: _Snapshot, tuning: SearchTuning | None) -> str:
+        mode = (tuning.mode if tuning is not None else None) or RETRIEVAL_MODE
+        if mode not in ("dense", "hybrid", "lexical"):
+            raise ValueError(f"Unknown retrieval mode {mode!r}")
+        # Indexes without BM25 postings can only answer densely.
+        return "dense" if snap.lexical is None else mode
+
+    @staticmethod
+    def _selection(snap: _Snapshot, filters: ChunkFilter) -> _Selection:
+        sel = snap.selections.get(filters)
+        if sel is not None:
+            return sel
+        ids = snap.meta.select(filters)
+        mask = np.zeros(int(ids[-1]) + 1 if len(ids) else 0, dtype=bool)
+        mask[ids] = True
+        bitmap = np.packbits(mask, bitorder="little")
+        selector = faiss.IDSelectorBitmap(len(bitmap), faiss.swig_ptr(bitmap)) if len(bitmap) else None
+        vectors = None
+        if 0 < len(ids) <= FILTER_EXACT_MAX:
+            index = snap.index
+            vectors = index.vectors_for_ids(ids) if isinstance(index, ShardedIndex) else vectors_for_ids(index, ids)
+        sel = _Selection(ids=ids, mask=mask, bitmap=bitmap, selector=selector, vectors=vectors)
+        if len(snap.selections) >= FILTER_CACHE_SIZE:
+            snap.selections.clear()
+        snap.selections[filters] = sel
+        return sel
+
+    @staticmethod
+    def _exact_search(sel: _Selection, q: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        """Inner-product top-k over a small selection; same output shape as `index.search`."""
+
+        sims = q @ sel.vectors.T
+        k_eff = min(k, sims.shape[1])
+        top = np.argpartition(-sims, k_eff - 1, axis=1)[:, :k_eff]
+        top_sims = np.take_along_axis(sims, top, axis=1)
+        order = np.argsort(-top_sims, axis=1, kind="stable")
+        top, top_sims = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_sims, order, axis=1)
+        ids = np.full((len(q), k), -1, dtype="int64")
+        scores = np.full((len(q), k), -np.inf, dtype="float32")
+        ids[:, :k_eff] = sel.ids[top]
+        scores[:, :k_eff] = top_sims
+        return scores, ids
+
+    def _retrieve_batch(self, queries: list[_Query]) -> list[list[Retrieved]]:
+        snap = self.snapshot()
+        modes = [self._mode(snap, x.tuning) for x in queries]
+
+        todo = [i for i, x in enumerate(queries) if x.vector is None and modes[i] != "lexical"]
+        vectors = [x.vector for x in queries]
+        if todo:
+            for i, v in zip(todo, self._encode_queries([queries[i].text for i in todo])):
+                vectors[i] = v
+
+        out: list[list[Retrieved]] = [[] for _ in queries]
+        # One search per distinct tuning/mode/filter (normally just one), at the largest k.
+        groups: dict[tuple[SearchTuning | None, str, ChunkFilter | None], list[int]] = {}
+        for i, x in enumerate(queries):
+            groups.setdefault((x.tuning, modes[i], x.filters), []).append(i)
+        for (tuning, mode, filters), rows in groups.items():
+            sel = self._selection(snap, filters) if filters else None
+            if sel is not None and not len(sel.ids):
+                continue
+            allowed = sel.mask if sel is not None else None
+            if mode == "lexical":
+                for row in rows:
+                    with span("lexical_search"):
+                        ids, scores = snap.lexical.search(queries[row].text, queries[row].top_k, allowed)
+                    out[row] = self._resolve(snap, ids.tolist(), scores.tolist())
+                continue
+            k = max(queries[i].top_k for i in rows)
+            if mode == "hybrid":
+                k = max(k, HYBRID_CANDIDATES)
+            q = np.stack([vectors[i] for i in rows]).astype("float32", copy=False)
+            shard_ms = None
+            with span("index_search") as t:
+                if sel is not None and sel.vectors is not None:
+                    scores, ids = self._exact_search(sel, q, k)
+                else:
+                    scores, ids, shard_ms = self._search(snap, q, k, tuning, sel.selector if sel else None)
+            for row in rows:
+                if queries[row].timings is not None:
+                    queries[row].timings["search_ms"] = t.ms
+                    if shard_ms is not None:
+                        queries[row].timings.update(shard_ms=[round(ms, 3) for ms in shard_ms], batch=len(rows))
+            for row, row_ids, row_scores in zip(rows, ids.tolist(), scores.tolist(), strict=True):
+                top_k = queries[row].top_k
+                if mode == "hybrid":
+                    with span("lexical_search"):
+                        lex_ids, _ = snap.lexical.search(queries[row].text, k, allowed)
+                    row_ids, row_scores = rrf_fuse([row_ids, lex_ids.tolist()], top_k, c=RRF_K)
+                out[row] = self._resolve(snap, row_ids[:top_k], row_scores)
+        return out
+
+    def _search(
+        self,
+        snap: _Snapshot,
+        q: np.ndarray,
+        k: int,
+        tuning: SearchTuning | None,
+        selector: faiss.IDSelector | None,
+    ) -> tuple[np.ndarray, np.ndarray, list[float] | None]:
+        index = snap.index
+        if not isinstance(index, ShardedIndex):
+            scores, ids = index.search(q, k, params=search_params(index, snap.settings, tuning, selector))
+            return scores, ids, None
+        params = [search_params(s, snap.settings, tuning, selector) for s in index.shards]
+        return index.search(q, k, params, self._fanout_pool())
+
+    def _fanout_pool(self) -> ThreadPoolExecutor:
+        if self._fanout is None:
+            with self._fanout_lock:
+                if self._fanout is None:
+                    self._fanout = ThreadPoolExecutor(max_workers=SHARD_WORKERS, thread_name_prefix="shard-search")
+        return self._fanout
+
+    @staticmethod
+    def _resolve(snap: _Snapshot, ids: list[int], scores: list[float]) -> list[Retrieved]:
+        results: list[Retrieved] = []
+        for idx, score in zip(ids, scores):
+            if idx < 0:
+                continue
+            m = snap.meta.get(idx)
+            if m is None:
+                continue
+            results.append(
+                Retrieved(
+                    id=m.id,
+                    source=m.source,
+                    chunk_id=m.chunk_id,
+                    text=m.text,
+                    score=float(score),
+                    start=m.start,
+                    end=m.end,
+                )
+            )
+        return results
+
+
+class _ShardUpdate:
+    """Pending changes to one FAISS file (the whole index when unsharded).
+
+    Indexes that need training (IVF) buffer vectors until `train_sample` of them
+    are available (or until publish), then train once and add everything.
+    """
+
+    def __init__(self, rag: RagStore, index: faiss.Index | None, settings: IndexSettings) -> None:
+        self._rag = rag
+        self._index = index
+        self.settings = settings
+        self._buf_ids: list[np.ndarray] = []
+        self._buf_vecs: list[np.ndarray] = []
+        self._buffered = 0
+
+    def finish(self) -> faiss.Index:
+        if self._index is not None:
+            return self._index
+        if self._buf_vecs:
+            vecs = np.concatenate(self._buf_vecs)
+            ids = np.concatenate(self._buf_ids)
+        else:
+            dim = self._rag.embedder.dim
+            vecs, ids = np.zeros((0, dim), dtype="float32"), np.zeros(0, dtype="int64")
+        self._index, self.settings = make_index(self.settings, vecs.shape[1], vecs)
+        if len(ids):
+            self._index.add_with_ids(vecs, ids)
+        self._buf_ids.clear()
+        self._buf_vecs.clear()
+        self._buffered = 0
+        return self._index
+
+    def upgrade(self, target: IndexSettings) -> bool:
+        """Retrain a Flat fallback into the configured IVF kind once it holds enough vectors."""
+
+        index = self.finish()
+        if not target.kind.startswith("IVF") or index.ntotal < MIN_IVF_VECTORS:
+            return False
+        if not isinstance(index, faiss.IndexIDMap2):
+            return False  # already IVF
+        if not isinstance(faiss.downcast_index(index.index), faiss.IndexFlat):
+            return False
+        # The stored vectors are exact, so nothing has to be embedded again.
+        ids, vecs = all_vectors(index)
+        self._index, self.settings = make_index(target, index.d, vecs[: target.train_sample])
+        self._index.add_with_ids(vecs, ids)
+        return True
+
+    def remove(self, ids: np.ndarray) -> None:
+        index = self.finish()
+        if supports_remove(index):
+            index.remove_ids(ids)
+            return
+        # HNSW cannot delete nodes: rebuild the graph from the stored vectors.
+        all_ids, vecs = all_vectors(index)
+        keep = ~np.isin(all_ids, ids)
+        self._index, self.settings = make_index(self.settings, index.d, vecs[keep])
+        self._index.add_with_ids(vecs[keep], all_ids[keep])
+
+    def add(self, ids: np.ndarray, emb: np.ndarray) -> None:
+        if self._index is not None:
+            self._index.add_with_ids(emb, ids)
+            return
+        self._buf_ids.append(ids)
+        self._buf_vecs.append(emb)
+        self._buffered += len(ids)
+        if not self.settings.kind.startswith("IVF") or self._buffered >= self.settings.train_sample:
+            self.finish()
+
+
+class IndexUpdate:
+    """Accumulates removals and embedded additions in bounded batches.
+
+    On a sharded index each change goes to the shard owning the chunk, and only
+    the shards that changed are loaded and rewritten. A reset rebuilds them all.
+    The BM25 postings are updated alongside and published with the index.
+    Everything is written to the private generation directory `files`; write the
+    new metadata to `files.meta_path` before `publish` (otherwise it is kept).
+    """
+
+    def __init__(
+        self,
+        rag: RagStore,
+        files: IndexFiles,
+        settings: IndexSettings,
+        lexical: LexicalIndex,
+        *,
+        base: _Snapshot | None,
+    ) -> None:
+        self._rag = rag
+        self.files = files
+        self._settings = settings
+        self._base = base
+        self._lexical = LexicalUpdate(lexical)
+        self._parts: dict[int, _ShardUpdate] = {}
+        if base is None:
+            for i in range(max(1, settings.shards)):
+                self._parts[i] = _ShardUpdate(rag, None, settings)
+
+    def _part(self, shard: int) -> _ShardUpdate:
+        part = self._parts.get(shard)
+        if part is None:
+            index = self._rag._read_private(self._base, shard)
+            part = self._parts[shard] = _ShardUpdate(self._rag, index, self._settings)
+        return part
+
+    def _route(self, ids: list[int], sources: list[str] | None, domains: list[str] | None) -> np.ndarray:
+        """Shard of each id. Without explicit keys, the new generation's metadata gives them."""
+
+        if self._settings.shards <= 1 or self._settings.shard_by == "hash":
+            return np.asarray([shard_of(self._settings, id_) for id_ in ids], dtype="int64")
+        if sources is None or domains is None:
+            if self.files.meta_path.exists():
+                meta = MetaStore.open(self.files.meta_path)
+            elif self._base is not None:
+                meta = self._base.meta
+            else:
+                meta = MetaStore.open(self._rag.paths.meta_path)
+            found = [meta.get(id_) for id_ in ids]
+            sources = [m.source if m is not None else "" for m in found]
+            domains = [m.domain if m is not None else "" for m in found]
+        return np.asarray(
+            [shard_of(self._settings, id_, src, dom) for id_, src, dom in zip(ids, sources, domains)], dtype="int64"
+        )
+
+    def _owners(self, ids: list[int]) -> list[int | None]:
+        # Removed chunks are looked up in the generation being replaced; None if unknown.
+        if self._settings.shards <= 1 or self._settings.shard_by == "hash":
+            return [shard_of(self._settings, id_) for id_ in ids]
+        meta = self._base.meta if self._base is not None else None
+        owners: list[int | None] = []
+        for id_ in ids:
+            m = meta.get(id_) if meta is not None else None
+            owners.append(shard_of(self._settings, id_, m.source, m.domain) if m is not None else None)
+        return owners
+
+    def remove(self, ids: list[int]) -> None:
+        if not ids:
+            return
+        self._lexical.remove(ids)
+        by_shard: dict[int, list[int]] = {}
+        for id_, owner in zip(ids, self._owners(ids)):
+            targets = range(max(1, self._settings.shards)) if owner is None else (owner,)
+            for shard in targets:
+                by_shard.setdefault(shard, []).append(id_)
+        for shard, shard_ids in sorted(by_shard.items()):
+            self._part(shard).remove(np.asarray(shard_ids, dtype="int64"))
+
+    def add(
+        self,
+        ids: list[int],
+        texts: list[str],
+        *,
+        sources: list[str] | None = None,
+        domains: list[str] | None = None,
+    ) -> None:
+        """Embed and add chunks. `sources`/`domains` route them when sharding by those keys."""
+
+        if not ids:
+            return
+        self._lexical.add(ids, texts)
+        emb = self._rag._embed(texts)
+        id_arr = np.asarray(ids, dtype="int64")
+        shards = self._route(ids, sources, domains)
+        for shard in np.unique(shards).tolist():
+            rows = shards == shard
+            self._part(shard).add(id_arr[rows], emb[rows])
+
+    def publish(self) -> int:
+        # Small corpora fall back to Flat; switch to the configured IVF kind once they grew.
+        target = replace(self._settings, kind=self._rag.index_settings.kind)
+        upgraded = [i for i, part in sorted(self._parts.items()) if part.upgrade(target)]
+        changed = {i: part.finish() for i, part in self._parts.items()}
+        settings = self._settings
+        if self._base is None or self._settings.shards <= 1 or upgraded:
+            # Applied settings (kind fallback, resolved nlist) of the first rebuilt shard.
+            first = upgraded[0] if upgraded else min(self._parts, default=None)
+            settings = self._parts[first].settings if first is not None else settings
+        return self._rag._publish(self.files, changed, settings, self._lexical.to_bytes(), self._base)
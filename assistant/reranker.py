@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from assistant.config import RERANK_BUDGET_MS, RERANK_CACHE_SIZE, RERANK_MODEL, RERANK_PROBE_S
+from assistant.embed_cache import text_sha256
+
+if TYPE_CHECKING:
+    from sentence_transformers import CrossEncoder
+
+
+@dataclass(frozen=True)
+class RerankOutcome:
+    scores: np.ndarray | None  # None: budget exceeded, keep the first-stage order
+    ms: float
+    cached: int
+    fallback: str | None = None  # estimate | busy | timeout
+
+
+class Reranker:
+    """Cross-encoder second stage with a hard latency budget.
+
+    Scores are cached per (query hash, chunk id); chunk ids are only reused for
+    identical text, so cached scores stay valid across ingests. Pairs are scored
+    in one batched forward pass on a dedicated thread. If that pass cannot finish
+    within `budget_ms`, the caller gets no scores and keeps the dense order. The
+    pass still completes in the background and fills the cache. Passes the
+    per-pair cost estimate says cannot fit are skipped, except for one probe
+    every `probe_s` seconds that refreshes the estimate.
+    """
+
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL,
+        *,
+        cache_dir: Path | None = None,
+        budget_ms: float = RERANK_BUDGET_MS,
+        cache_size: int = RERANK_CACHE_SIZE,
+        probe_s: float = RERANK_PROBE_S,
+    ) -> None:
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.budget_ms = budget_ms
+        self.cache_size = cache_size
+        self.probe_s = probe_s
+        self._model: CrossEncoder | None = None
+        self._model_lock = threading.Lock()
+        self._cache: OrderedDict[tuple[str, int], float] = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        self._inflight = 0
+        self._ms_per_pair = 0.0  # moving average, 0 until the first pass
+        self._last_pass = 0.0  # time.monotonic() of the last measured pass
+
+    @property
+    def model(self) -> CrossEncoder:
+        with self._model_lock:
+            if self._model is None:
+                from huggingface_hub import snapshot_download
+                from sentence_transformers import CrossEncoder
+
+                local = snapshot_download(self.model_name, cache_dir=str(self.cache_dir) if self.cache_dir else None)
+                self._model = CrossEncoder(local, max_length=512)
+            return self._model
+
+    def _predict(self, qkey: str, query: str, ids: list[int], texts: list[str]) -> np.ndarray:
+        try:
+            model = self.model  # a first-use load is not scoring time: keep it out of the estimate
+            t0 = time.perf_counter()
+            scores = np.asarray(
+                model.predict([(query, t) for t in texts], batch_size=len(texts), show_progress_bar=False),
+                dtype="float32",
+            )
+            per_pair = (time.perf_counter() - t0) * 1000 / len(texts)
+            with self._lock:
+                self._ms_per_pair = per_pair if not self._ms_per_pair else 0.8 * self._ms_per_pair + 0.2 * per_pair
+                for id_, s in zip(ids, scores.tolist()):
+                    self._cache[(qkey, id_)] = s
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            return scores
+        finally:
+            with self._lock:
+                self._inflight -= 1
+
+    def warmup(self, query: str, texts: list[str]) -> None:
+        """Load the model and seed the cost estimate, on the calling thread.
+
+        Runs two uncached passes: the first one pays for buffer allocation and
+        kernel selection, the second is timed as the per-pair estimate.
+        """
+
+        pairs = [(query, t) for t in texts]
+        model = self.model
+        model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        t0 = time.perf_counter()
+        model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+        with self._lock:
+            self._ms_per_pair = (time.perf_counter() - t0) * 1000 / len(pairs)
+            self._last_pass = time.monotonic()
+
+    def score(self, query: str, ids: list[int], texts: list[str]) -> RerankOutcome:
+        t0 = time.perf_counter()
+
+        def elapsed() -> float:
+            return (time.perf_counter() - t0) * 1000
+
+        qkey = text_sha256(query)
+        scores = np.empty(len(ids), dtype="float32")
+        misses: list[int] = []
+        with self._lock:
+            for i, id_ in enumerate(ids):
+                s = self._cache.get((qkey, id_))
+                if s is None:
+                    misses.append(i)
+                else:
+                    self._cache.move_to_end((qkey, id_))
+                    scores[i] = s
+            cached = len(ids) - len(misses)
+            if misses:
+                # Don't start a pass that cannot fit (but probe now and then), or queue behind a backlog.
+                now = time.monotonic()
+                if self._ms_per_pair * len(misses) > self.budget_ms and now - self._last_pass < self.probe_s:
+                    return RerankOutcome(scores=None, ms=elapsed(), cached=cached, fallback="estimate")
+                if self._inflight >= 2:
+                    return RerankOutcome(scores=None, ms=elapsed(), cached=cached, fallback="busy")
+                self._inflight += 1
+                self._last_pass = now
+        if misses:
+            fut = self._pool.submit(self._predict, qkey, query, [ids[i] for i in misses], [texts[i] for i in misses])
+            try:
+                fresh = fut.result(timeout=max(0.0, self.budget_ms - elapsed()) / 1000)
+            except FutureTimeout:
+                return RerankOutcome(scores=None, ms=elapsed(), cached=cached, fallback="timeout")
+            scores[misses] = fresh
+        return RerankOutcome(scores=scores, ms=elapsed(), cached=cached)
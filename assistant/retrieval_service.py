@@ -0,0 +1,421 @@
+from __future__ import annotations
+
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+
+import numpy as np
+
+from assistant.batching import MicroBatcher
+from assistant.config import (
+    DEFAULT_TOP_K,
+    QUERY_BATCH_MAX,
+    RETRIEVAL_SERVICE_TIMEOUT_S,
+    WARMUP_BATCH_SIZES,
+    Paths,
+)
+from assistant.index_factory import SearchTuning
+from assistant.meta_store import ChunkFilter
+from assistant.rag_store import RagStore, Retrieved, index_signature
+
+# One retrieval process owns the embedding model, the index and the reranker; API
+# workers talk to it over a Unix socket (or loopback TCP) with length-prefixed frames:
+#
+#   header   magic "RAGS", version u8, op u8, reserved u16, body length u32 (little endian)
+#   INFO     -> utf-8 JSON {"index": bool, "embed_id": ..., "pid": ...}
+#   EMBED    JSON {"texts": [...]} -> u32 rows, u32 dim, float32[rows * dim]
+#   RETRIEVE u32 n, JSON [{"text", "top_k", "tuning", "filters", "vector"}] * n,
+#            then float32 vectors for the queries with "vector": true
+#            -> per query: u32 count, then per result
+#               i64 id, i32 chunk_id, i32 start, i32 end, f32 score,
+#               u32 len + utf-8 source, u32 len + utf-8 text,
+#               then u32 len + utf-8 JSON search timings {"search_ms", "shard_ms"}
+#   ERROR    utf-8 message, sent instead of the reply
+#
+# A connection carries any number of request/reply pairs, one at a time.
+
+_MAGIC = b"RAGS"
+_VERSION = 2
+_HEADER = struct.Struct("<4sBBHI")
+_U32 = struct.Struct("<I")
+_RESULT = struct.Struct("<qiiifII")
+
+OP_INFO = 1
+OP_EMBED = 2
+OP_RETRIEVE = 3
+OP_ERROR = 255
+
+
+class RetrievalServiceError(RuntimeError):
+    """The retrieval service is unreachable or failed the request."""
+
+
+def parse_address(address: str) -> tuple[int, str | tuple[str, int]]:
+    """`unix:/path.sock` or `host:port` -> (socket family, address)."""
+
+    if address.startswith("unix:"):
+        return socket.AF_UNIX, address[len("unix:") :]
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Bad retrieval service address {address!r} (expected unix:/path or host:port)")
+    return socket.AF_INET, (host, int(port))
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        r = sock.recv_into(view[got:])
+        if r == 0:
+            raise ConnectionError("retrieval service connection closed")
+        got += r
+    return bytes(buf)
+
+
+def _send_frame(sock: socket.socket, op: int, body: bytes) -> None:
+    sock.sendall(_HEADER.pack(_MAGIC, _VERSION, op, 0, len(body)) + body)
+
+
+def _recv_frame(sock: socket.socket) -> tuple[int, bytes]:
+    magic, version, op, _, size = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if magic != _MAGIC or version != _VERSION:
+        raise ConnectionError(f"not a retrieval service frame ({magic!r} v{version})")
+    return op, _recv_exact(sock, size) if size else b""
+
+
+def _encode_results(results: list[tuple[list[Retrieved], dict]]) -> bytes:
+    parts: list[bytes] = []
+    for rows, timings in results:
+        parts.append(_U32.pack(len(rows)))
+        for r in rows:
+            source, text = r.source.encode("utf-8"), r.text.encode("utf-8")
+            parts.append(_RESULT.pack(r.id, r.chunk_id, r.start, r.end, r.score, len(source), len(text)))
+            parts.append(source)
+            parts.append(text)
+        head = json.dumps(timings).encode("utf-8")
+        parts.append(_U32.pack(len(head)))
+        parts.append(head)
+    return b"".join(parts)
+
+
+def _decode_results(body: bytes, n: int) -> list[tuple[list[Retrieved], dict]]:
+    out: list[tuple[list[Retrieved], dict]] = []
+    off = 0
+    for _ in range(n):
+        (count,) = _U32.unpack_from(body, off)
+        off += _U32.size
+        rows = []
+        for _ in range(count):
+            id_, chunk_id, start, end, score, n_source, n_text = _RESULT.unpack_from(body, off)
+            off += _RESULT.size
+            source = body[off : off + n_source].decode("utf-8")
+            off += n_source
+            text = body[off : off + n_text].decode("utf-8")
+            off += n_text
+            rows.append(
+                Retrieved(id=id_, source=source, chunk_id=chunk_id, text=text, score=score, start=start, end=end)
+            )
+        (n_head,) = _U32.unpack_from(body, off)
+        off += _U32.size
+        timings = json.loads(body[off : off + n_head])
+        off += n_head
+        out.append((rows, timings))
+    return out
+
+
+@dataclass(frozen=True)
+class _Request:
+    text: str
+    top_k: int
+    tuning: SearchTuning | None
+    filters: ChunkFilter | None
+    vector: np.ndarray | None = None
+    timings: dict | None = field(default=None, compare=False)  # client side only, filled from the reply
+
+
+def _encode_requests(requests: list[_Request]) -> bytes:
+    specs = [
+        {
+            "text": r.text,
+            "top_k": r.top_k,
+            "tuning": asdict(r.tuning) if r.tuning is not None else None,
+            "filters": asdict(r.filters) if r.filters else None,
+            "vector": r.vector is not None,
+        }
+        for r in requests
+    ]
+    head = json.dumps(specs, ensure_ascii=False).encode("utf-8")
+    vectors = [np.asarray(r.vector, dtype="<f4").tobytes() for r in requests if r.vector is not None]
+    return _U32.pack(len(head)) + head + b"".join(vectors)
+
+
+def _decode_requests(body: bytes) -> list[_Request]:
+    (n_head,) = _U32.unpack_from(body, 0)
+    specs = json.loads(body[_U32.size : _U32.size + n_head])
+    n_vec = sum(1 for s in specs if s["vector"])
+    vectors = np.frombuffer(body, dtype="<f4", offset=_U32.size + n_head)
+    vectors = vectors.reshape(n_vec, -1) if n_vec else vectors
+    out, v = [], 0
+    for s in specs:
+        vector = None
+        if s["vector"]:
+            vector, v = vectors[v], v + 1
+        flt = {k: tuple(x) if isinstance(x, list) else x for k, x in (s["filters"] or {}).items()}
+        out.append(
+            _Request(
+                text=s["text"],
+                top_k=int(s["top_k"]),
+                tuning=SearchTuning(**s["tuning"]) if s["tuning"] is not None else None,
+                filters=ChunkFilter(**flt) if flt else None,
+                vector=vector,
+            )
+        )
+    return out
+
+
+class RetrievalServer:
+    """Serves a RagStore to other processes on one socket.
+
+    Each connection gets a thread. Queries from all connections go through the
+    store's micro-batcher (`batch_window_ms` on the store), so concurrent workers
+    share encoder forward passes and index searches.
+    """
+
+    def __init__(self, rag: RagStore, address: str, *, max_parallel: int = 64) -> None:
+        self.rag = rag
+        self.address = address
+        self._pool = ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="retrieval-service")
+        family, addr = parse_address(address)
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.unlink(addr)  # stale socket from a previous run
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self) -> None:
+                sock: socket.socket = self.request
+                while True:
+                    try:
+                        op, body = _recv_frame(sock)
+                    except (ConnectionError, OSError):
+                        return
+                    try:
+                        reply_op, reply = op, server.dispatch(op, body)
+                    except Exception as exc:  # reported to the caller, connection stays usable
+                        reply_op, reply = OP_ERROR, repr(exc).encode("utf-8")
+                    try:
+                        _send_frame(sock, reply_op, reply)
+                    except OSError:
+                        return
+
+        base = socketserver.UnixStreamServer if family == socket.AF_UNIX else socketserver.TCPServer
+
+        class Server(socketserver.ThreadingMixIn, base):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self._server = Server(addr, Handler)
+
+    def dispatch(self, op: int, body: bytes) -> bytes:
+        if op == OP_INFO:
+            info = {"index": self.rag.preload(), "embed_id": self.rag.embed_id, "pid": os.getpid()}
+            return json.dumps(info).encode("utf-8")
+        if op == OP_EMBED:
+            vecs = np.stack(self._map(self.rag.embed_query, json.loads(body)["texts"]))
+            return struct.pack("<II", *vecs.shape) + vecs.astype("<f4", copy=False).tobytes()
+        if op == OP_RETRIEVE:
+            return _encode_results(self._map(self._retrieve, _decode_requests(body)))
+        raise ValueError(f"Unknown op {op}")
+
+    def _map(self, fn, items: list) -> list:
+        # Items of one frame are submitted side by side so the store batches them together.
+        if len(items) == 1:
+            return [fn(items[0])]
+        return list(self._pool.map(fn, items))
+
+    def _retrieve(self, r: _Request) -> tuple[list[Retrieved], dict]:
+        timings: dict = {}
+        rows = self.rag.retrieve(
+            r.text, top_k=r.top_k, tuning=r.tuning, vector=r.vector, filters=r.filters, timings=timings
+        )
+        return rows, timings
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def shutdown(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        family, addr = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(addr):
+            os.unlink(addr)
+
+
+class RetrievalClient:
+    """Query side of RagStore (retrieve, embed_query, generation) backed by the service.
+
+    Used by API workers in place of a local store, so no worker loads the
+    embedding model or the index. Concurrent calls from one worker are
+    coalesced into one frame when `batch_window_ms` > 0. Each thread keeps
+    its own connection, reopened after a failure or a fork.
+    """
+
+    def __init__(
+        self,
+        address: str,
+        paths: Paths,
+        *,
+        timeout_s: float = RETRIEVAL_SERVICE_TIMEOUT_S,
+        batch_window_ms: float = 0.0,
+        batch_max: int = QUERY_BATCH_MAX,
+    ) -> None:
+        self.address = address
+        self.paths = paths
+        self.timeout_s = timeout_s
+        self._family, self._addr = parse_address(address)
+        self._local = threading.local()
+        self._batcher: MicroBatcher[_Request, list[Retrieved]] | None = None
+        self._encoder: MicroBatcher[str, np.ndarray] | None = None
+        if batch_window_ms > 0:
+            self._batcher = MicroBatcher(self._retrieve_frame, max_batch=batch_max, max_wait_ms=batch_window_ms)
+            self._encoder = MicroBatcher(self._embed_frame, max_batch=batch_max, max_wait_ms=batch_window_ms)
+        if hasattr(os, "register_at_fork"):
+            # Sockets opened by the parent must not be shared with forked workers.
+            ref = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: (c := ref()) is not None and c._reset())
+
+    def _reset(self) -> None:
+        self._local = threading.local()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(self._family, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout_s)
+        try:
+            sock.connect(self._addr)
+        except OSError:
+            sock.close()
+            raise
+        if self._family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _call(self, op: int, body: bytes) -> bytes:
+        # Every op is read-only, so a request lost with a dead connection is resent once.
+        for attempt in (0, 1):
+            sock = getattr(self._local, "sock", None)
+            try:
+                if sock is None:
+                    sock = self._local.sock = self._connect()
+                _send_frame(sock, op, body)
+                reply_op, reply = _recv_frame(sock)
+            except OSError as exc:
+                if sock is not None:
+                    sock.close()
+                self._local.sock = None
+                if attempt:
+                    raise RetrievalServiceError(f"retrieval service {self.address}: {exc!r}") from exc
+                continue
+            if reply_op == OP_ERROR:
+                raise RetrievalServiceError(reply.decode("utf-8", "replace"))
+            return reply
+        raise AssertionError("unreachable")
+
+    def info(self) -> dict:
+        return json.loads(self._call(OP_INFO, b""))
+
+    def close(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    @property
+    def generation(self) -> tuple[int, ...]:
+        # Same files, same host: no round trip needed.
+        return index_signature(self.paths)
+
+    def _embed_frame(self, texts: list[str]) -> list[np.ndarray]:
+        body = self._call(OP_EMBED, json.dumps({"texts": texts}, ensure_ascii=False).encode("utf-8"))
+        rows, dim = struct.unpack_from("<II", body, 0)
+        return list(np.frombuffer(body, dtype="<f4", offset=8).reshape(rows, dim).astype("float32"))
+
+    def embed_query(self, query: str) -> np.ndarray:
+        if self._encoder is not None:
+            return self._encoder.run(query)
+        return self._embed_frame([query])[0]
+
+    def embed_queries(self, queries: list[str]) -> list[np.ndarray]:
+        return self._embed_frame(queries) if queries else []
+
+    def _retrieve_frame(self, requests: list[_Request]) -> list[list[Retrieved]]:
+        replies = _decode_results(self._call(OP_RETRIEVE, _encode_requests(requests)), len(requests))
+        for req, (_, timings) in zip(requests, replies):
+            if req.timings is not None:
+                req.timings.update(timings)
+        return [rows for rows, _ in replies]
+
+    def retrieve(
+        self,
+        query: str,
+        *,
+        top_k: int = DEFAULT_TOP_K,
+        tuning: SearchTuning | None = None,
+        vector: np.ndarray | None = None,
+        filters: ChunkFilter | None = None,
+        timings: dict | None = None,
+    ) -> list[Retrieved]:
+        req = _Request(text=query, top_k=top_k, tuning=tuning, filters=filters or None, vector=vector, timings=timings)
+        if self._batcher is not None:
+            return self._batcher.run(req)
+        return self._retrieve_frame([req])[0]
+
+    def retrieve_many(
+        self,
+        queries: list[str],
+        *,
+        top_k: int = DEFAULT_TOP_K,
+        tuning: SearchTuning | None = None,
+        filters: ChunkFilter | None = None,
+        vectors: list[np.ndarray] | None = None,
+    ) -> list[list[Retrieved]]:
+        vecs = vectors if vectors is not None else [None] * len(queries)
+        requests = [
+            _Request(text=q, top_k=top_k, tuning=tuning, filters=filters or None, vector=v) for q, v in zip(queries, vecs)
+        ]
+        return self._retrieve_frame(requests)
+
+    def preload(self) -> bool:
+        """Wait for the service to accept connections; True once it has an index."""
+
+        deadline = time.monotonic() + self.timeout_s
+        while True:
+            try:
+                return bool(self.info()["index"])
+            except RetrievalServiceError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.2)
+
+    def warmup(self, batch_sizes: tuple[int, ...] = WARMUP_BATCH_SIZES) -> dict[str, float]:
+        """Connect and run one round trip per batch size (the service warms its own model)."""
+
+        timings: dict[str, float] = {}
+        t0 = time.perf_counter()
+        has_index = self.preload()
+        timings["connect_ms"] = (time.perf_counter() - t0) * 1000
+        for bs in batch_sizes:
+            texts = ["Quelle est la procédure pour renouveler une carte d'identité nationale ?"] * bs
+            t0 = time.perf_counter()
+            if has_index:
+                self.retrieve_many(texts)
+            else:
+                self._embed_frame(texts)
+            timings[f"batch_{bs}_ms"] = (time.perf_counter() - t0) * 1000
+        return timings
@@ -1,34 +1,184 @@
-from __future__ import annotations
-
-import re
-from dataclasses import dataclass
-
-
-@dataclass(frozen=True)
-class SafetyDecision:
-    action: str  # allow | refuse | escalate
-    reason: str
-
-
-_SENSITIVE_PATTERNS = [
-    # Tunisian CIN is often 8 digits; keep it conservative to reduce false positives.
-    ("cin_like", re.compile(r"\b\d{8}\b")),
-    ("phone_like", re.compile(r"\b(\+?216)?\s?\d{2}\s?\d{3}\s?\d{3}\b")),
-    ("email_like", re.compile(r"\b[\w.+-]+@[\w-]+\.[\w.-]+\b")),
-]
-
-
-def check_safety(user_text: str) -> SafetyDecision:
-    text = user_text.strip()
-    for name, pat in _SENSITIVE_PATTERNS:
-        if pat.search(text):
-            return SafetyDecision(
-                action="refuse",
-                reason=f"Detected sensitive citizen-identifiable data ({name}).",
-            )
-
-    # Add a light escalation trigger for complaints/threats.
-    if any(w in text.lower() for w in ["plainte", "réclamation", "tribunal", "menace"]):
-        return SafetyDecision(action="escalate", reason="User requests legal/complaint handling.")
-
-    return SafetyDecision(action="allow", reason="No sensitive data detected.")
+from __future__ import annotations
+
+import re
+import unicodedata
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True)
+class SafetySpan:
+    kind: str  # cin | phone | email | iban | rib, or an escalation label (complaint, legal, ...)
+    category: str  # pii | escalation
+    start: int
+    end: int
+
+
+@dataclass(frozen=True)
+class SafetyDecision:
+    action: str  # allow | redact | refuse | escalate
+    reason: str
+    spans: tuple[SafetySpan, ...] = ()
+    text: str = ""  # the request with PII spans replaced by placeholders
+
+    @property
+    def redacted(self) -> list[str]:
+        return sorted({s.kind for s in self.spans if s.category == "pii"})
+
+
+# Identifiers a citizen may paste into a question. Numbers must not touch other digits,
+# so the alternation order only matters for overlaps starting at the same offset.
+PII_RULES: list[tuple[str, str]] = [
+    ("email", r"[\w.+-]+@[\w-]+\.[\w.-]*\w"),
+    ("iban", r"TN\d{2}(?:[ ]?\d){20}(?!\d)"),
+    ("phone", r"(?<!\d)(?:(?:\+|00)216[\s.-]?)?\d{2}[\s.-]\d{3}[\s.-]?\d{3}(?!\d)|(?<!\d)(?:\+|00)?216[\s.-]?\d{8}(?!\d)"),
+    ("rib", r"(?<!\d)\d{20}(?!\d)"),
+    # Tunisian CIN is often 8 digits; keep it conservative to reduce false positives.
+    ("cin", r"(?<!\d)\d{8}(?!\d)"),
+]
+
+PLACEHOLDERS = {"cin": "[CIN]", "phone": "[TEL]", "email": "[EMAIL]", "iban": "[IBAN]", "rib": "[RIB]"}
+
+# Complaint / legal / threat vocabulary in French, Arabic, Darija (Arabic and Latin script)
+# and English. Matching ignores case and Latin accents; Arabic words may carry the usual
+# proclitics (و، ف، ب، ل، ال).
+ESCALATION_LEXICON: dict[str, list[str]] = {
+    "complaint": [
+        "plainte", "réclamation", "complaint",
+        "شكوى", "شكاية", "تظلم", "نشكي", "نشتكي", "شكايه", "chekwa", "chkeya", "nechki",
+    ],
+    "legal": [
+        # Not "procès" (procès-verbal) or "justice" (ministère de la justice): too common in procedures.
+        "tribunal", "avocat", "lawsuit", "lawyer",
+        "محكمة", "محكمه", "محامي", "دعوى", "mahkma", "avoka",
+    ],
+    "threat": [
+        "menace", "menacé", "harcèlement", "violence", "threat",
+        "تهديد", "تهدد", "نهدد", "عنف", "تحرش", "nhadded",
+    ],
+    "corruption": [
+        "corruption", "pot-de-vin", "bakchich", "bribe",
+        "رشوة", "فساد", "رشوه", "rachwa", "rachoua",
+    ],
+}
+
+_ACCENT_CLASSES = {"e": "[eéèêë]", "a": "[aàâä]", "i": "[iîï]", "o": "[oôö]", "u": "[uùûü]", "c": "[cç]"}
+_AR_PROCLITICS = r"(?:و?[فبل]?(?:ال)?)"
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFD", text.casefold())
+    return "".join(ch for ch in text if not unicodedata.combining(ch))
+
+
+def _trie_regex(words: list[str]) -> str:
+    """Alternation factored into a trie, so matching cost follows the text, not the word count."""
+
+    trie: dict = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def emit(node: dict) -> str:
+        ends = "" in node
+        branches = []
+        for ch in sorted(k for k in node if k):
+            atom = _ACCENT_CLASSES.get(ch, re.escape(ch))
+            branches.append(atom + emit(node[ch]))
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if ends else body
+
+    return emit(trie)
+
+
+class SafetyEngine:
+    """All PII patterns and escalation lexicons compiled into one regex, scanned once.
+
+    `scan` returns typed spans; `check` turns them into a decision. Adding rules
+    or words grows the automaton, not the number of passes over the text.
+    """
+
+    def __init__(
+        self,
+        pii_rules: list[tuple[str, str]] = PII_RULES,
+        lexicon: dict[str, list[str]] = ESCALATION_LEXICON,
+    ) -> None:
+        self._labels: dict[str, str] = {}
+        for label, words in lexicon.items():
+            for w in words:
+                self._labels[_fold(w)] = label
+        groups = [f"(?P<{name}>{pattern})" for name, pattern in pii_rules]
+        if self._labels:
+            words = _trie_regex(sorted(self._labels))
+            groups.append(rf"(?<!\w){_AR_PROCLITICS}(?P<esc>{words})(?!\w)")
+        self._pattern = re.compile("|".join(groups), re.IGNORECASE)
+
+    def scan(self, text: str) -> list[SafetySpan]:
+        spans = []
+        for m in self._pattern.finditer(text):
+            kind = m.lastgroup
+            if kind == "esc":
+                start, end = m.span("esc")
+                label = self._labels.get(_fold(m.group("esc")), "complaint")
+                spans.append(SafetySpan(kind=label, category="escalation", start=start, end=end))
+            else:
+                spans.append(SafetySpan(kind=kind, category="pii", start=m.start(), end=m.end()))
+        return spans
+
+    def check(self, user_text: str) -> SafetyDecision:
+        text = user_text.strip()
+        spans = tuple(self.scan(text))
+        escalations = sorted({s.kind for s in spans if s.category == "escalation"})
+        redacted = _redact(text, spans)
+        if escalations:
+            return SafetyDecision(
+                action="escalate",
+                reason=f"User requests legal/complaint handling ({', '.join(escalations)}).",
+                spans=spans,
+                text=redacted,
+            )
+        pii = sorted({s.kind for s in spans if s.category == "pii"})
+        if not pii:
+            return SafetyDecision(action="allow", reason="No sensitive data detected.", text=text)
+        # Nothing left to answer once the identifiers are removed.
+        if len(re.findall(r"\w{2,}", _strip_placeholders(redacted))) < 2:
+            return SafetyDecision(
+                action="refuse",
+                reason=f"Detected sensitive citizen-identifiable data ({', '.join(pii)}).",
+                spans=spans,
+                text=redacted,
+            )
+        return SafetyDecision(
+            action="redact",
+            reason=f"Redacted sensitive citizen-identifiable data ({', '.join(pii)}).",
+            spans=spans,
+            text=redacted,
+        )
+
+
+def _redact(text: str, spans: tuple[SafetySpan, ...]) -> str:
+    parts, pos = [], 0
+    for s in spans:
+        if s.category != "pii":
+            continue
+        parts.append(text[pos : s.start])
+        parts.append(PLACEHOLDERS.get(s.kind, "[REDACTED]"))
+        pos = s.end
+    parts.append(text[pos:])
+    return "".join(parts)
+
+
+def _strip_placeholders(text: str) -> str:
+    for p in PLACEHOLDERS.values():
+        text = text.replace(p, " ")
+    return text
+
+
+DEFAULT_ENGINE = SafetyEngine()
+
+
+def check_safety(user_text: str) -> SafetyDecision:
+    return DEFAULT_ENGINE.check(user_text)
@@ -0,0 +1,93 @@
+from __future__ import annotations
+
+import time
+import zlib
+from concurrent.futures import Executor
+from dataclasses import dataclass, field
+
+import faiss
+import numpy as np
+
+from assistant.config import IndexSettings
+from assistant.index_factory import has_stable_ids
+
+# A sharded index is N independent FAISS files searched side by side. Chunks are
+# assigned by id ("hash": spreads vectors evenly), by source file or by domain (an
+# ingest touching one document or one domain then rewrites only that shard).
+
+SHARD_KEYS = ("hash", "source", "domain")
+
+
+def shard_of(settings: IndexSettings, id_: int, source: str = "", domain: str = "") -> int:
+    """Shard holding chunk `id_` under `settings.shard_by`."""
+
+    n = max(1, settings.shards)
+    if n == 1:
+        return 0
+    if settings.shard_by == "hash":
+        return id_ % n
+    if settings.shard_by == "source":
+        return zlib.crc32(source.encode("utf-8")) % n
+    if settings.shard_by == "domain":
+        return zlib.crc32(domain.encode("utf-8")) % n
+    raise ValueError(f"Unknown shard key {settings.shard_by!r}; expected one of {SHARD_KEYS}")
+
+
+def shard_list(index: faiss.Index | ShardedIndex) -> tuple[faiss.Index, ...]:
+    return index.shards if isinstance(index, ShardedIndex) else (index,)
+
+
+@dataclass(frozen=True)
+class ShardedIndex:
+    """Read side of a sharded index: fan-out search and a k-way merge of the shard top-k."""
+
+    shards: tuple[faiss.Index, ...]
+    _id_maps: dict[int, np.ndarray] = field(default_factory=dict, compare=False, repr=False)
+
+    @property
+    def ntotal(self) -> int:
+        return sum(int(s.ntotal) for s in self.shards)
+
+    @property
+    def d(self) -> int:
+        return self.shards[0].d
+
+    def search(
+        self,
+        q: np.ndarray,
+        k: int,
+        params: list[faiss.SearchParameters | None],
+        pool: Executor,
+    ) -> tuple[np.ndarray, np.ndarray, list[float]]:
+        """Search every shard in `pool` (FAISS releases the GIL); returns scores, ids and ms per shard."""
+
+        def one(i: int) -> tuple[np.ndarray, np.ndarray, float]:
+            t0 = time.perf_counter()
+            scores, ids = self.shards[i].search(q, k, params=params[i])
+            return scores, ids, (time.perf_counter() - t0) * 1000
+
+        parts = list(pool.map(one, range(len(self.shards))))
+        scores, ids = faiss.merge_knn_results(
+            np.stack([p[0] for p in parts]), np.stack([p[1] for p in parts]), keep_max=True
+        )
+        return scores, ids, [p[2] for p in parts]
+
+    def vectors_for_ids(self, ids: np.ndarray) -> np.ndarray | None:
+        """Exact stored vectors of `ids` gathered from their shards, or None for IVF shards."""
+
+        if not all(isinstance(s, faiss.IndexIDMap2) for s in self.shards):
+            return None
+        ids = np.asarray(ids, dtype="int64")
+        out = np.zeros((len(ids), self.d), dtype="float32")
+        for i, shard in enumerate(self.shards):
+            owned = self._id_maps.get(i)
+            if owned is None:
+                owned = self._id_maps[i] = faiss.vector_to_array(shard.id_map).astype("int64")
+            rows = np.isin(ids, owned)
+            if rows.any():
+                out[rows] = shard.reconstruct_batch(ids[rows])
+        return out
+
+
+def stable_ids(index: faiss.Index | ShardedIndex) -> bool:
+    return all(has_stable_ids(s) for s in shard_list(index))
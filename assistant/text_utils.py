@@ -1,81 +1,109 @@
-from __future__ import annotations
-
-import re
-from dataclasses import dataclass
-from typing import Iterable
-
-from langdetect import detect
-
-
-@dataclass(frozen=True)
-class Chunk:
-    text: str
-    source: str
-    chunk_id: int
-
-
-def detect_language(text: str) -> str:
-    try:
-        return detect(text)
-    except Exception:
-        return "unknown"
-
-
-def normalize_text(text: str) -> str:
-    # Basic whitespace normalization; keep Arabic/French characters intact.
-    text = text.replace("\u00a0", " ")
-    text = re.sub(r"[ \t]+", " ", text)
-    text = re.sub(r"\n{3,}", "\n\n", text)
-    return text.strip()
-
-
-def chunk_text(text: str, *, chunk_size: int, overlap: int) -> Iterable[str]:
-    if chunk_size <= 0:
-        raise ValueError("chunk_size must be > 0")
-    if overlap < 0:
-        raise ValueError("overlap must be >= 0")
-    if overlap >= chunk_size:
-        raise ValueError("overlap must be < chunk_size")
-
-    text = normalize_text(text)
-    if not text:
-        return []
-
-    # Split on paragraph boundaries first.
-    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
-
-    chunks: list[str] = []
-    current = ""
-    for p in paragraphs:
-        candidate = (current + "\n\n" + p).strip() if current else p
-        if len(candidate) <= chunk_size:
-            current = candidate
-            continue
-
-        if current:
-            chunks.append(current)
-            current = ""
-
-        # Paragraph too large; hard-split.
-        start = 0
-        while start < len(p):
-            end = min(len(p), start + chunk_size)
-            chunks.append(p[start:end])
-            start = end - overlap if end < len(p) else end
-
-    if current:
-        chunks.append(current)
-
-    # Add overlap between chunks by character window.
-    if overlap == 0 or len(chunks) <= 1:
-        return chunks
-
-    overlapped: list[str] = []
-    for i, c in enumerate(chunks):
-        if i == 0:
-            overlapped.append(c)
-            continue
-        prev = overlapped[-1]
-        tail = prev[-overlap:]
-        overlapped.append((tail + c).strip())
-    return overlapped
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass
+from typing import Callable, Iterator
+
+
+@dataclass(frozen=True)
+class Chunk:
+    text: str
+    source: str
+    chunk_id: int
+    start: int = -1
+    end: int = -1
+
+
+def normalize_text(text: str) -> str:
+    # Basic whitespace normalization; keep Arabic/French characters intact.
+    text = text.replace("\u00a0", " ")
+    text = re.sub(r"[ \t]+", " ", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+_SENTENCE_END = re.compile(r"[.!?؟…][\"'»”)\]]*\s")
+_WS = re.compile(r"\s")
+_LEADING_WS = re.compile(r"\s*")
+
+
+def _cut(text: str, lo: int, hi: int) -> int:
+    """Best chunk end in (lo, hi]: a paragraph break, else a sentence end, else a space."""
+
+    if hi >= len(text):
+        return len(text)
+    i = text.rfind("\n\n", lo, hi)
+    if i > lo:
+        return i
+    best = -1
+    for m in _SENTENCE_END.finditer(text, lo, hi + 1):
+        best = m.end() - 1
+    if best > lo:
+        return best
+    i = max(text.rfind(" ", lo, hi + 1), text.rfind("\n", lo, hi + 1))
+    return i if i > lo else hi
+
+
+def iter_chunk_spans(
+    text: str,
+    *,
+    chunk_size: int,
+    overlap: int,
+    max_tokens: int = 0,
+    count_tokens: Callable[[str], int] | None = None,
+) -> Iterator[tuple[int, int]]:
+    """Yield `(start, end)` offsets of chunks of `text`, in one pass.
+
+    Every span, overlap included, is at most `chunk_size` characters and ends on
+    the best boundary available (paragraph, sentence, word). The next span
+    starts up to `overlap` characters before the previous end, on a word
+    boundary. With `count_tokens`, spans longer than `max_tokens` tokens are cut
+    further so the embedding model does not truncate them. The text is expected
+    to be normalized already.
+    """
+
+    if chunk_size <= 0:
+        raise ValueError("chunk_size must be > 0")
+    if overlap < 0:
+        raise ValueError("overlap must be >= 0")
+    if overlap >= chunk_size:
+        raise ValueError("overlap must be < chunk_size")
+
+    n = len(text)
+    start = _LEADING_WS.match(text, 0).end()
+    prev_end = start
+    last_stop = start
+    while start < n:
+        lo = max(prev_end, start)
+        end = _cut(text, lo, min(n, start + chunk_size))
+        if count_tokens is not None and max_tokens > 0:
+            tokens = count_tokens(text[start:end])
+            while tokens > max_tokens and end > lo + 1:
+                hi = start + int((end - start) * max_tokens / tokens * 0.9)
+                end = _cut(text, lo, max(hi, lo + 1))
+                tokens = count_tokens(text[start:end])
+        stop = end
+        while stop > start and text[stop - 1].isspace():
+            stop -= 1
+        # After a paragraph break the cut can land on the whitespace right past
+        # the previous chunk, leaving only the overlap: skip that repeat.
+        if stop > max(start, last_stop):
+            yield start, stop
+            last_stop = stop
+        if end >= n:
+            return
+
+        nxt = end - overlap
+        if overlap and nxt > start:
+            m = _WS.search(text, nxt, end)
+            if m is not None:
+                nxt = m.end()
+        else:
+            nxt = end
+        prev_end = end
+        start = _LEADING_WS.match(text, nxt).end()
+
+
+def chunk_text(text: str, *, chunk_size: int, overlap: int) -> Iterator[str]:
+    for start, end in iter_chunk_spans(text, chunk_size=chunk_size, overlap=overlap):
+        yield text[start:end]
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from assistant.config import QUERY_BATCH_MAX, QUERY_BATCH_WINDOW_MS, Paths
+from assistant.ingestion import ingest_incremental
+from assistant.rag_store import RagStore
+from assistant.retrieval_service import RetrievalClient, RetrievalServer
+from benchmark import DEFAULT_QUERIES, generate_corpus, run_load
+
+# Memory and latency of N API workers under three layouts:
+#   per-worker  every worker loads the model and reads the index into its own memory
+#   mmap        every worker loads the model; the index is mapped read-only (INDEX_MMAP=1)
+#   sidecar     one retrieval service owns model + index; workers are RetrievalClients
+# Workers are separate processes started from scratch (no fork sharing). Memory is the
+# summed PSS (proportional set size) of all processes once warm, so shared pages count once.
+#   python scripts/bench_layouts.py --workers 4 --docs 500
+
+LAYOUTS = ("per-worker", "mmap", "sidecar")
+
+
+def pss_mb(pid: int) -> float | None:
+    """Proportional set size (Linux), else None."""
+
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("Pss:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+    return None
+
+
+def _child(args: argparse.Namespace) -> None:
+    """Worker or service process; talks to the parent over stdin/stdout lines."""
+
+    paths = Paths(base_dir=args.base_dir)
+    if args.role == "service":
+        rag = RagStore(paths, batch_window_ms=QUERY_BATCH_WINDOW_MS, batch_max=QUERY_BATCH_MAX)
+        rag.warmup()
+        server = RetrievalServer(rag, args.address)
+        print("ready", flush=True)
+        server.serve_forever()
+        return
+
+    if args.role == "sidecar":
+        store = RetrievalClient(
+            args.address, paths, batch_window_ms=QUERY_BATCH_WINDOW_MS, batch_max=QUERY_BATCH_MAX
+        )
+    else:
+        store = RagStore(
+            paths,
+            batch_window_ms=QUERY_BATCH_WINDOW_MS,
+            batch_max=QUERY_BATCH_MAX,
+            mmap_index=args.role == "mmap",
+        )
+    store.warmup()
+    print("ready", flush=True)
+    sys.stdin.readline()  # "go": every worker starts its load at the same time
+
+    def call(text: str) -> object:
+        return store.retrieve(text, top_k=4)
+
+    result = run_load(call, DEFAULT_QUERIES, concurrency=args.concurrency, requests=args.requests)
+    print(json.dumps(result), flush=True)
+
+
+def _spawn(role: str, args: argparse.Namespace, address: str) -> subprocess.Popen:
+    cmd = [
+        sys.executable, __file__, "--child", role,
+        "--base-dir", str(args.base_dir), "--address", address,
+        "--concurrency", str(args.concurrency), "--requests", str(args.requests),
+    ]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+    line = proc.stdout.readline().strip()
+    if line != "ready":
+        proc.kill()
+        raise SystemExit(f"{role} process failed to start ({line!r})")
+    return proc
+
+
+def run_layout(layout: str, args: argparse.Namespace) -> dict:
+    address = f"unix:{args.base_dir / 'bench-retrieval.sock'}"
+    service = _spawn("service", args, address) if layout == "sidecar" else None
+    workers = [_spawn(layout, args, address) for _ in range(args.workers)]
+    try:
+        time.sleep(1.0)  # let allocators settle before measuring
+        procs = workers + ([service] if service is not None else [])
+        sizes = [pss_mb(p.pid) for p in procs]
+        t0 = time.perf_counter()
+        for w in workers:
+            w.stdin.write("go\n")
+            w.stdin.flush()
+        rows = [json.loads(w.stdout.readline()) for w in workers]
+        wall = time.perf_counter() - t0
+    finally:
+        for p in workers + ([service] if service is not None else []):
+            p.kill()
+            p.wait()
+    total = args.workers * args.requests
+    return {
+        "layout": layout,
+        "workers": args.workers,
+        "pss_mb": sum(sizes) if all(s is not None for s in sizes) else None,
+        "service_pss_mb": sizes[-1] if service is not None else None,
+        "qps": total / wall if wall else 0.0,
+        "p50_ms": sum(r["p50_ms"] for r in rows) / len(rows),
+        "p99_ms": max(r["p99_ms"] for r in rows),
+        "errors": sum(r["errors"] for r in rows),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Compare per-worker, mmap and sidecar retrieval layouts.")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--concurrency", type=int, default=4, help="client threads per worker")
+    ap.add_argument("--requests", type=int, default=200, help="queries per worker")
+    ap.add_argument("--layouts", default=",".join(LAYOUTS))
+    ap.add_argument("--base-dir", type=Path, help="existing tree with data/raw (default: synthetic corpus)")
+    ap.add_argument("--docs", type=int, default=200, help="synthetic documents when no --base-dir")
+    ap.add_argument("--paragraphs", type=int, default=20)
+    ap.add_argument("--out", type=Path, help="result file (default reports/bench_layouts.json)")
+    ap.add_argument("--child", choices=(*LAYOUTS, "service"), dest="role", help=argparse.SUPPRESS)
+    ap.add_argument("--address", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.role:
+        _child(args)
+        return
+
+    base = Path(__file__).resolve().parents[1]
+    out = args.out or base / "reports" / "bench_layouts.json"
+    work = None
+    if args.base_dir is None:
+        work = args.base_dir = Path(tempfile.mkdtemp(prefix="tdsa-layouts-"))
+        generate_corpus(Paths(base_dir=work).data_raw, docs=args.docs, paragraphs=args.paragraphs)
+    try:
+        paths = Paths(base_dir=args.base_dir)
+        if not paths.generation_path.exists():
+            ingest_incremental(paths, RagStore(paths))
+        results = [run_layout(layout, args) for layout in args.layouts.split(",")]
+    finally:
+        if work is not None:
+            shutil.rmtree(work, ignore_errors=True)
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps({"cpus": os.cpu_count(), "results": results}, indent=2), encoding="utf-8")
+    print(f"Wrote {out}")
+    print("| Layout | Workers | Total PSS MB | Service MB | QPS | p50 ms | p99 ms | Errors |")
+    print("|---|---|---|---|---|---|---|---|")
+    for r in results:
+        mem = f"{r['pss_mb']:.0f}" if r["pss_mb"] is not None else "n/a"
+        svc = f"{r['service_pss_mb']:.0f}" if r["service_pss_mb"] is not None else "-"
+        print(f"| {r['layout']} | {r['workers']} | {mem} | {svc} | {r['qps']:.1f} | {r['p50_ms']:.1f} | "
+              f"{r['p99_ms']:.1f} | {r['errors']} |")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from assistant.agent import handle_query
+from assistant.config import Paths
+from assistant.ingestion import ingest_incremental
+from assistant.logging_utils import JsonlLogger
+from assistant.rag_store import RagStore
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Sentence templates per language; {n} varies so chunks are not identical.
+_TEMPLATES = {
+    "fr": [
+        "Étape {n}: déposer le formulaire {n} au bureau régional avec une copie de la CIN.",
+        "Les frais de dossier pour la procédure {n} sont payables au guichet unique.",
+        "Article {n}: la déclaration fiscale simplifiée doit être déposée avant la date limite.",
+        "Pièces requises pour la demande {n}: photo récente, justificatif de domicile, ancien document.",
+    ],
+    "ar": [
+        "الخطوة {n}: تقديم المطلب عدد {n} لدى البلدية مع نسخة من بطاقة التعريف الوطنية.",
+        "الفصل {n}: يجب إيداع التصريح الجبائي المبسط قبل الأجل القانوني.",
+        "الوثائق المطلوبة لرخصة البناء {n}: مثال هندسي، شهادة ملكية، وصل خلاص.",
+    ],
+    "darija": [
+        "باش تجدد الكارطة {n} لازمك تمشي للمركز وتجيب تصويرة جديدة.",
+        "رخصة البناء {n} تاخو وقت، لازمك تحضر الأوراق الكل قبل ما تمشي للبلدية.",
+        "el CIN {n} tjaddadha fel markez mta3 el police, jib m3ak tsawer.",
+    ],
+}
+
+DEFAULT_QUERIES = [
+    "Quelles sont les étapes pour renouveler la CIN ?",
+    "Quelles pièces faut-il pour une déclaration fiscale simplifiée ?",
+    "كيفاش نعمل مطلب رخصة بناء؟",
+    "أريد شرح الإجراءات لتجديد بطاقة التعريف الوطنية.",
+    "kifech njadded el CIN mte3i ?",
+]
+
+
+def generate_corpus(raw_dir: Path, *, docs: int, paragraphs: int, seed: int = 0) -> None:
+    """Write `docs` synthetic procedure files mixing Arabic, French and Darija."""
+
+    rng = random.Random(seed)
+    raw_dir.mkdir(parents=True, exist_ok=True)
+    langs = list(_TEMPLATES)
+    for d in range(docs):
+        lang = langs[d % len(langs)]
+        paras = []
+        for p in range(paragraphs):
+            sentences = [rng.choice(_TEMPLATES[lang]).format(n=rng.randint(1, 10_000)) for _ in range(rng.randint(2, 6))]
+            paras.append(" ".join(sentences))
+        (raw_dir / f"synthetic_{lang}_{d:05d}.txt").write_text("\n\n".join(paras), encoding="utf-8")
+
+
+def load_replay(path: Path) -> tuple[list[str], list[float]]:
+    """Texts and inter-arrival gaps (s) from a JSONL traffic file.
+
+    Accepts plain request lines (`text`/`query`/`title` [+ `ts`]) and our own
+    `reports/run.log` (its `Log_Interaction` events carry the user text and time).
+    """
+
+    texts: list[str] = []
+    stamps: list[float | None] = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        if "event" in item:
+            if item["event"] != "Log_Interaction":
+                continue
+            text, ts = item["payload"].get("user_text"), item.get("ts")
+        else:
+            text, ts = item.get("text") or item.get("query") or item.get("title"), item.get("ts")
+        if text:
+            texts.append(str(text))
+            stamps.append(ts)
+    gaps = [0.0] * len(texts)
+    if texts and all(s is not None for s in stamps):
+        gaps = [0.0] + [max(0.0, b - a) for a, b in zip(stamps, stamps[1:])]
+    return texts, gaps
+
+
+def run_load(
+    call: Callable[[str], object],
+    texts: list[str],
+    *,
+    concurrency: int,
+    requests: int,
+    gaps: list[float] | None = None,
+    speed: float = 1.0,
+) -> dict[str, float]:
+    """Fire `requests` calls with `concurrency` workers; latency percentiles and QPS."""
+
+    latencies: list[float] = []
+    errors = 0
+
+    def one(text: str) -> None:
+        nonlocal errors
+        t0 = time.perf_counter()
+        try:
+            call(text)
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - t0)
+
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for i in range(requests):
+            if gaps and speed > 0:
+                # Keep the recorded arrival pattern (time-compressed by `speed`).
+                time.sleep(gaps[i % len(gaps)] / speed)
+            pool.submit(one, texts[i % len(texts)])
+    wall = time.perf_counter() - t_start
+
+    lat_ms = np.asarray(latencies) * 1000
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": errors,
+        "qps": requests / wall if wall else 0.0,
+        "p50_ms": float(np.percentile(lat_ms, 50)),
+        "p95_ms": float(np.percentile(lat_ms, 95)),
+        "p99_ms": float(np.percentile(lat_ms, 99)),
+    }
+
+
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == "darwin" else rss / 1024
+
+
+# metric -> True when higher is better
+_DIRECTIONS = {"qps": True, "p50_ms": False, "p95_ms": False, "p99_ms": False,
+               "ingest_s": False, "rebuild_s": False, "peak_rss_mb": False}
+
+
+def compare(current: dict, baseline: dict, *, tolerance: float) -> list[str]:
+    """Human-readable regressions of `current` against `baseline` beyond `tolerance`."""
+
+    def flat(d: dict, prefix: str = "") -> dict[str, float]:
+        out: dict[str, float] = {}
+        for k, v in d.items():
+            if isinstance(v, dict):
+                out.update(flat(v, f"{prefix}{k}."))
+            elif isinstance(v, list):
+                for item in v:
+                    out.update(flat(item, f"{prefix}{k}[c={item.get('concurrency')}]."))
+            elif isinstance(v, (int, float)) and v is not None:
+                out[prefix + k] = float(v)
+        return out
+
+    cur, base = flat(current), flat(baseline)
+    regressions = []
+    for key, b in base.items():
+        metric = key.rsplit(".", 1)[-1]
+        if metric not in _DIRECTIONS or key not in cur or b == 0:
+            continue
+        change = (cur[key] - b) / b
+        worse = -change if _DIRECTIONS[metric] else change
+        if worse > tolerance:
+            regressions.append(f"{key}: {b:.3f} -> {cur[key]:.3f} ({change:+.1%})")
+    return regressions
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Ingest/query throughput and latency benchmark.")
+    ap.add_argument("--docs", type=int, default=200, help="synthetic documents to generate")
+    ap.add_argument("--paragraphs", type=int, default=20, help="paragraphs per document")
+    ap.add_argument("--concurrency", default="1,4,16", help="comma-separated client concurrency levels")
+    ap.add_argument("--requests", type=int, default=200, help="queries per concurrency level")
+    ap.add_argument("--url", help="also benchmark a running API, e.g. http://127.0.0.1:8000")
+    ap.add_argument("--replay", type=Path, help="JSONL traffic to replay (requests file or reports/run.log)")
+    ap.add_argument("--speed", type=float, default=0.0, help="replay arrival gaps at this speed-up (0 = back to back)")
+    ap.add_argument("--out", type=Path, help="result file (default reports/benchmark.json)")
+    ap.add_argument("--compare", type=Path, help="baseline result file to check for regressions")
+    ap.add_argument("--tolerance", type=float, default=0.15, help="allowed relative slowdown")
+    args = ap.parse_args()
+
+    base = Path(__file__).resolve().parents[1]
+    out = args.out or base / "reports" / "benchmark.json"
+    levels = [int(c) for c in args.concurrency.split(",")]
+    texts, gaps = (DEFAULT_QUERIES, None)
+    if args.replay:
+        texts, gaps = load_replay(args.replay)
+        if not texts:
+            raise SystemExit(f"No queries found in {args.replay}")
+
+    work = Path(tempfile.mkdtemp(prefix="tdsa-bench-"))
+    try:
+        paths = Paths(base_dir=work)
+        generate_corpus(paths.data_raw, docs=args.docs, paragraphs=args.paragraphs)
+        logger = JsonlLogger(paths.run_log_path)
+        rag = RagStore(paths, logger=logger)
+        _ = rag.embedder  # keep model load time out of the ingest figure
+
+        t0 = time.perf_counter()
+        ing = ingest_incremental(paths, rag, logger=logger)
+        ingest_s = time.perf_counter() - t0
+        # Second full rebuild hits the embedding cache: mostly chunking + index build.
+        t0 = time.perf_counter()
+        ingest_incremental(paths, rag, logger=logger, full=True)
+        rebuild_s = time.perf_counter() - t0
+
+        def in_process(text: str) -> object:
+            return handle_query(user_text=text, rag=rag, logger=logger, top_k=4)
+
+        result: dict = {
+            "config": {"docs": args.docs, "paragraphs": args.paragraphs, "chunks": ing.chunks,
+                       "replay": str(args.replay) if args.replay else None},
+            "ingest": {"ingest_s": ingest_s, "rebuild_s": rebuild_s},
+            "in_process": [run_load(in_process, texts, concurrency=c, requests=args.requests,
+                                    gaps=gaps, speed=args.speed) for c in levels],
+        }
+        if args.url:
+            import httpx
+
+            client = httpx.Client(base_url=args.url, timeout=60.0)
+
+            def over_http(text: str) -> object:
+                return client.post("/query", json={"text": text, "top_k": 4}).raise_for_status()
+
+            result["http"] = [run_load(over_http, texts, concurrency=c, requests=args.requests,
+                                       gaps=gaps, speed=args.speed) for c in levels]
+        result["memory"] = {"peak_rss_mb": peak_rss_mb()}
+        logger.close()
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2), encoding="utf-8")
+    print(f"Wrote {out}")
+    for row in result["in_process"]:
+        print(f"in-process c={row['concurrency']}: {row['qps']:.1f} qps, p50 {row['p50_ms']:.1f} ms, p99 {row['p99_ms']:.1f} ms")
+
+    if args.compare:
+        regressions = compare(result, json.loads(args.compare.read_text(encoding="utf-8")), tolerance=args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r}")
+        if regressions:
+            raise SystemExit(1)
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from assistant.config import Paths
+from assistant.meta_store import convert_json_meta
+
+
+def main() -> None:
+    base = Path(__file__).resolve().parents[1]
+    paths = Paths(base_dir=base)
+
+    if not paths.legacy_meta_path.exists():
+        print(f"Nothing to convert: {paths.legacy_meta_path} not found")
+        raise SystemExit(1)
+
+    n = convert_json_meta(paths.legacy_meta_path, paths.meta_path)
+    print(f"Converted {n} chunks")
+    print(f"Metadata: {paths.meta_path}")
+    print(f"You can now delete {paths.legacy_meta_path}")
+
+
+if __name__ == "__main__":
+    main()
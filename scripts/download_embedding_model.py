@@ -1,27 +1,177 @@
-from __future__ import annotations
-
-import sys
-from pathlib import Path
-
-sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
-
-from assistant.config import DEFAULT_EMBED_MODEL, Paths
-from assistant.rag_store import RagStore
-
-
-def main() -> None:
-    base = Path(__file__).resolve().parents[1]
-    paths = Paths(base_dir=base)
-
-    rag = RagStore(paths, embed_model=DEFAULT_EMBED_MODEL)
-
-    # This forces download into data/index/hf_cache and verifies inference works.
-    _ = rag.model.encode(["test"], normalize_embeddings=True)
-
-    print("Embedding model ready")
-    print(f"Model: {DEFAULT_EMBED_MODEL}")
-    print(f"Cache: {paths.hf_cache_dir}")
-
-
-if __name__ == "__main__":
-    main()
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from assistant.config import DEFAULT_EMBED_MODEL, EMBED_ONNX_THREADS, Paths
+from assistant.embedders import (
+    ONNX_FILE,
+    ONNX_INT8_FILE,
+    ExportConfig,
+    SentenceTransformerEmbedder,
+    make_embedder,
+    onnx_dir,
+)
+from assistant.meta_store import MetaStore
+from assistant.rag_store import published_files
+
+SAMPLE_TEXTS = [
+    "Quelle est la procédure pour renouveler une carte d'identité nationale ?",
+    "Les pièces à fournir : extrait de naissance, deux photos d'identité et l'ancienne carte.",
+    "ما هي الوثائق المطلوبة للحصول على رخصة بناء من البلدية؟",
+    "كيفاش نجدد الباسبور متاعي؟",
+    "Déclaration fiscale au régime forfaitaire : délais et pénalités de retard.",
+    "How do I request a birth certificate online?",
+]
+
+
+def export_onnx(st_embedder: SentenceTransformerEmbedder, model_name: str, out: Path) -> None:
+    """Export the transformer (without pooling) to ONNX, plus tokenizer and pooling config."""
+
+    import torch
+    from sentence_transformers.models import Normalize, Pooling
+
+    st = st_embedder.model
+    modules = list(st)
+    pooling = next((m for m in modules if isinstance(m, Pooling)), None)
+    extra = [m for m in modules[1:] if not isinstance(m, (Pooling, Normalize))]
+    if pooling is None or extra:
+        raise SystemExit(f"{model_name}: only transformer + pooling (+ normalize) models can be exported")
+    mode = pooling.get_pooling_mode_str()
+    if mode not in ("mean", "cls"):
+        raise SystemExit(f"{model_name}: pooling mode {mode!r} is not supported by the ONNX backend")
+
+    tokenizer = st.tokenizer
+    transformer = modules[0].auto_model.eval()
+    sample = tokenizer(["export sample", "عينة"], padding=True, return_tensors="pt")
+    names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+
+    class LastHidden(torch.nn.Module):
+        def __init__(self) -> None:
+            super().__init__()
+            self.model = transformer
+
+        def forward(self, *inputs: torch.Tensor) -> torch.Tensor:
+            return self.model(**dict(zip(names, inputs))).last_hidden_state
+
+    out.mkdir(parents=True, exist_ok=True)
+    axes = {n: {0: "batch", 1: "seq"} for n in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+    with torch.no_grad():
+        torch.onnx.export(
+            LastHidden(),
+            tuple(sample[n] for n in names),
+            str(out / ONNX_FILE),
+            input_names=names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=axes,
+            opset_version=14,
+        )
+    tokenizer.save_pretrained(str(out))
+    if not (out / "tokenizer.json").exists():
+        raise SystemExit(f"{model_name}: no fast tokenizer (tokenizer.json) to export")
+    ExportConfig(
+        source_model=model_name,
+        dim=st_embedder.dim,
+        max_seq_length=st_embedder.max_seq_length,
+        pooling=mode,
+        pad_id=int(tokenizer.pad_token_id),
+        pad_token=str(tokenizer.pad_token),
+    ).save(out)
+
+
+def quantize(out: Path) -> None:
+    """Dynamic int8 quantization of the exported weights (activations stay float)."""
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    quantize_dynamic(str(out / ONNX_FILE), str(out / ONNX_INT8_FILE), weight_type=QuantType.QInt8)
+
+
+def _sample_texts(paths: Paths, n: int) -> list[str]:
+    # Real chunks when an index exists, so the check covers the actual corpus.
+    texts = list(SAMPLE_TEXTS)
+    meta_path = published_files(paths).meta_path
+    if meta_path.exists():
+        meta = list(MetaStore.open(meta_path))
+        rng = np.random.default_rng(0)
+        for i in rng.choice(len(meta), size=min(n, len(meta)), replace=False):
+            texts.append(meta[int(i)].text)
+    return texts
+
+
+def _timed(encode, texts: list[str]) -> tuple[np.ndarray, float]:
+    encode(texts[:4])  # first call allocates buffers
+    t0 = time.perf_counter()
+    vecs = encode(texts)
+    return vecs, (time.perf_counter() - t0) * 1000 / len(texts)
+
+
+def parity(paths: Paths, model_name: str, reference: SentenceTransformerEmbedder, sample: int, min_cosine: float) -> bool:
+    """Cosine agreement of each exported backend with the float PyTorch model on a sample."""
+
+    texts = _sample_texts(paths, sample)
+    ref, ref_ms = _timed(reference.encode, texts)
+    print(f"\nParity on {len(texts)} texts (reference: sentence-transformers, {ref_ms:.2f} ms/text)")
+    print("| Backend | min cos | mean cos | ms/text | speedup | model MB |")
+    print("|---|---|---|---|---|---|")
+    ok = True
+    for backend, filename, threshold in (("onnx", ONNX_FILE, 0.999), ("onnx-int8", ONNX_INT8_FILE, min_cosine)):
+        path = onnx_dir(paths.onnx_dir, model_name) / filename
+        if not path.exists():
+            continue
+        emb = make_embedder(
+            model_name, backend, cache_dir=paths.hf_cache_dir, onnx_root=paths.onnx_dir, threads=EMBED_ONNX_THREADS
+        )
+        vecs, ms = _timed(emb.encode, texts)
+        cos = (ref * vecs).sum(axis=1)
+        passed = float(cos.min()) >= threshold
+        ok &= passed
+        mb = path.stat().st_size / 1e6
+        print(
+            f"| {backend} | {cos.min():.4f} | {cos.mean():.4f} | {ms:.2f} | {ref_ms / ms:.1f}x | {mb:.0f} |"
+            + ("" if passed else f" FAIL (< {threshold})")
+        )
+    return ok
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Download the embedding model; optionally export it to ONNX.")
+    ap.add_argument("--export-onnx", action="store_true", help="export to data/index/onnx/ for EMBED_BACKEND=onnx")
+    ap.add_argument("--quantize", action="store_true", help="also write an int8 model for EMBED_BACKEND=onnx-int8")
+    ap.add_argument("--parity", action="store_true", help="compare exported models with the float model")
+    ap.add_argument("--sample", type=int, default=200, help="indexed chunks added to the parity sample")
+    ap.add_argument("--min-cosine", type=float, default=0.98, help="lowest cosine accepted for int8")
+    args = ap.parse_args()
+
+    base = Path(__file__).resolve().parents[1]
+    paths = Paths(base_dir=base)
+
+    # This forces download into data/index/hf_cache and verifies inference works.
+    reference = SentenceTransformerEmbedder(DEFAULT_EMBED_MODEL, cache_dir=paths.hf_cache_dir)
+    _ = reference.encode(["test"])
+
+    print("Embedding model ready")
+    print(f"Model: {DEFAULT_EMBED_MODEL}")
+    print(f"Cache: {paths.hf_cache_dir}")
+
+    out = onnx_dir(paths.onnx_dir, DEFAULT_EMBED_MODEL)
+    if args.export_onnx:
+        export_onnx(reference, DEFAULT_EMBED_MODEL, out)
+        print(f"ONNX export: {out / ONNX_FILE}")
+    if args.quantize:
+        quantize(out)
+        print(f"int8 model: {out / ONNX_INT8_FILE}")
+    if args.export_onnx or args.quantize or args.parity:
+        if not parity(paths, DEFAULT_EMBED_MODEL, reference, args.sample, args.min_cosine):
+            raise SystemExit("Parity check failed: keep EMBED_BACKEND=sentence-transformers")
+
+
+if __name__ == "__main__":
+    main()
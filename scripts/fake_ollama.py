@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stand-in for a local Ollama server (/api/generate, /api/tags) with tunable latency,
+# CPU-like contention and failures, for exercising the client without a real model:
+#   python scripts/fake_ollama.py --port 11435 --parallel 1 --first-token-ms 800
+#   OLLAMA_BASE_URL=http://127.0.0.1:11435 python -m uvicorn app.main:app
+# GET /_fake/stats reports requests, connections, peak concurrency and the last
+# keep_alive/options received.
+
+
+class FakeOllama:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.slots = threading.Semaphore(args.parallel)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.failed = 0
+        self.active = 0
+        self.peak = 0
+        self.connections: set[tuple[str, int]] = set()
+        self.last: dict = {}
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "failed": self.failed,
+                "connections": len(self.connections),
+                "peak_concurrency": self.peak,
+                "last": self.last,
+            }
+
+    def tokens(self, prompt: str) -> list[str]:
+        words = f"Réponse simulée à partir de {len(prompt)} caractères de contexte .".split()
+        return [words[i % len(words)] + " " for i in range(self.args.tokens)]
+
+
+def make_handler(fake: FakeOllama) -> type[BaseHTTPRequestHandler]:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real server
+
+        def log_message(self, fmt: str, *args) -> None:
+            if fake.args.verbose:
+                super().log_message(fmt, *args)
+
+        def _json(self, status: int, payload: dict) -> None:
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _chunk(self, payload: dict) -> None:
+            data = (json.dumps(payload) + "\n").encode("utf-8")
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        def do_GET(self) -> None:
+            if self.path == "/api/tags":
+                self._json(200, {"models": [{"name": fake.args.model}]})
+            elif self.path == "/_fake/stats":
+                self._json(200, fake.stats())
+            else:
+                self._json(200, {"status": "Ollama is running"})
+
+        def do_POST(self) -> None:
+            if self.path != "/api/generate":
+                self._json(404, {"error": "not found"})
+                return
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))) or b"{}")
+            with fake.lock:
+                fake.requests += 1
+                fake.connections.add(self.client_address)
+                fake.last = {"keep_alive": body.get("keep_alive"), "options": body.get("options")}
+                fail = random.random() < fake.args.fail_rate
+                if fail:
+                    fake.failed += 1
+            if fail:
+                self._json(503, {"error": "server busy"})
+                return
+
+            prompt = str(body.get("prompt", ""))
+            args = fake.args
+            with fake.slots:
+                with fake.lock:
+                    fake.active += 1
+                    fake.peak = max(fake.peak, fake.active)
+                try:
+                    time.sleep(args.first_token_ms / 1000)
+                    tokens = fake.tokens(prompt)
+                    final = {
+                        "model": body.get("model", args.model),
+                        "done": True,
+                        "prompt_eval_count": max(1, len(prompt) // 4),
+                        "eval_count": len(tokens),
+                    }
+                    if not body.get("stream", True):
+                        time.sleep(args.token_ms * len(tokens) / 1000)
+                        self._json(200, {**final, "response": "".join(tokens)})
+                        return
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    for tok in tokens:
+                        self._chunk({"model": final["model"], "response": tok, "done": False})
+                        time.sleep(args.token_ms / 1000)
+                    self._chunk({**final, "response": ""})
+                    self.wfile.write(b"0\r\n\r\n")
+                finally:
+                    with fake.lock:
+                        fake.active -= 1
+
+    return Handler
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Fake Ollama server for local testing.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=11435)
+    ap.add_argument("--model", default="llama3.1:8b")
+    ap.add_argument("--parallel", type=int, default=1, help="generations served at once; others wait")
+    ap.add_argument("--first-token-ms", type=float, default=300.0, help="simulated prompt evaluation")
+    ap.add_argument("--token-ms", type=float, default=20.0)
+    ap.add_argument("--tokens", type=int, default=24)
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered 503")
+    ap.add_argument("--verbose", action="store_true")
+    args = ap.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(FakeOllama(args)))
+    print(f"Fake Ollama on http://{args.host}:{args.port} (model {args.model})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import argparse
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from assistant.config import (
+    QUERY_BATCH_MAX,
+    QUERY_BATCH_WINDOW_MS,
+    RERANK_ENABLED,
+    RETRIEVAL_SERVICE,
+    Paths,
+)
+from assistant.logging_utils import JsonlLogger
+from assistant.rag_store import RagStore
+from assistant.reranker import Reranker
+from assistant.retrieval_service import RetrievalServer
+
+# The one process holding the embedding model, index and reranker. Start it first, then
+# the API workers with the same RETRIEVAL_SERVICE address:
+#   python scripts/retrieval_service.py --address unix:/tmp/tdsa-retrieval.sock
+#   RETRIEVAL_SERVICE=unix:/tmp/tdsa-retrieval.sock python scripts/serve.py --workers 8
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Serve embedding + retrieval to API workers over a local socket.")
+    ap.add_argument("--address", default=RETRIEVAL_SERVICE or "unix:/tmp/tdsa-retrieval.sock",
+                    help="unix:/path.sock or host:port (default: RETRIEVAL_SERVICE)")
+    ap.add_argument("--batch-window-ms", type=float, default=QUERY_BATCH_WINDOW_MS,
+                    help="coalesce queries from all workers arriving within this window")
+    ap.add_argument("--batch-max", type=int, default=QUERY_BATCH_MAX)
+    ap.add_argument("--rerank", action="store_true", default=RERANK_ENABLED)
+    args = ap.parse_args()
+
+    base = Path(__file__).resolve().parents[1]
+    paths = Paths(base_dir=base)
+    logger = JsonlLogger(paths.base_dir / "reports" / "retrieval_service.log")
+    rag = RagStore(
+        paths,
+        logger=logger,
+        batch_window_ms=args.batch_window_ms,
+        batch_max=args.batch_max,
+        reranker=Reranker(cache_dir=paths.hf_cache_dir) if args.rerank else None,
+    )
+    t0 = time.perf_counter()
+    rag.warmup()
+    has_index = rag.preload()
+    print(f"Model{' and index' if has_index else ' (no index yet)'} warm in {time.perf_counter() - t0:.1f}s")
+
+    server = RetrievalServer(rag, args.address)
+
+    def stop(signum, frame) -> None:
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    print(f"Retrieval service on {args.address}")
+    server.serve_forever()
+    logger.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,80 +1,110 @@
-from __future__ import annotations
-
-import sys
-from dataclasses import dataclass
-from pathlib import Path
-
-sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
-
-from assistant.agent import handle_query
-from assistant.config import Paths
-from assistant.logging_utils import JsonlLogger
-from assistant.rag_store import RagStore
-
-
-@dataclass(frozen=True)
-class EvalCase:
-    name: str
-    query: str
-    expected_action: str
-
-
-def main() -> None:
-    base = Path(__file__).resolve().parents[1]
-    paths = Paths(base_dir=base)
-    logger = JsonlLogger(paths.run_log_path)
-    rag = RagStore(paths)
-
-    cases = [
-        EvalCase(
-            name="Standard procedural query",
-            query="What are the steps for renewing an ID card (CIN) in Tunisia?",
-            expected_action="retrieve_document",
-        ),
-        EvalCase(
-            name="Bilingual request",
-            query="أريد شرح الإجراءات لتجديد بطاقة التعريف الوطنية. Please answer in French.",
-            expected_action="retrieve_document",
-        ),
-        EvalCase(
-            name="Refusal/redirection (sensitive data)",
-            query="Mon CIN est 01234567, peux-tu vérifier mon statut ?",
-            expected_action="refuse",
-        ),
-        # Additional 2 evaluation queries across domains
-        EvalCase(
-            name="Taxation domain",
-            query="Quelles pièces faut-il pour une déclaration fiscale simplifiée ?",
-            expected_action="retrieve_document",
-        ),
-        EvalCase(
-            name="Local administration domain",
-            query="كيفاش نعمل مطلب رخصة بناء؟",
-            expected_action="retrieve_document",
-        ),
-    ]
-
-    rows = []
-    for c in cases:
-        res = handle_query(user_text=c.query, rag=rag, logger=logger, top_k=4, allow_generation=False)
-        rows.append((c.name, c.expected_action, res.action, res.language, "OK" if res.action == c.expected_action else "CHECK"))
-
-    report = [
-        "# Evaluation Report\n",
-        "This report provides 5 test queries across administrative domains and checks basic behavior.\n",
-        "## Results\n",
-        "| Case | Expected | Got | Lang | Status |\n",
-        "|---|---|---|---|---|\n",
-    ]
-    for name, expected, got, lang, status in rows:
-        report.append(f"| {name} | {expected} | {got} | {lang} | {status} |\n")
-
-    report.append("\n## Scoring rubric (manual)\n")
-    report.append("Rate each query on: relevance/correctness, ethical+sovereignty adherence, multilingual handling.\n")
-
-    paths.eval_report_path.write_text("".join(report), encoding="utf-8")
-    print(f"Wrote {paths.eval_report_path}")
-
-
-if __name__ == "__main__":
-    main()
+from __future__ import annotations
+
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from assistant.agent import handle_query
+from assistant.config import RERANK_BUDGET_MS, RERANK_ENABLED, Paths
+from assistant.logging_utils import JsonlLogger
+from assistant.metrics import REGISTRY, STAGE_METRIC
+from assistant.rag_store import RagStore
+from assistant.reranker import Reranker
+
+
+@dataclass(frozen=True)
+class EvalCase:
+    name: str
+    query: str
+    expected_action: str
+
+
+def _stage_ms(stage: str) -> float:
+    return REGISTRY.histogram(STAGE_METRIC, stage).sum * 1000
+
+
+def main() -> None:
+    base = Path(__file__).resolve().parents[1]
+    paths = Paths(base_dir=base)
+    logger = JsonlLogger(paths.run_log_path)
+    # --rerank (or RERANK=1) adds the cross-encoder stage so its cost shows in the report.
+    reranker = Reranker(cache_dir=paths.hf_cache_dir) if RERANK_ENABLED or "--rerank" in sys.argv[1:] else None
+    rag = RagStore(paths, logger=logger, reranker=reranker)
+    # Load the models and run a first pass now, so the first case is not timed with
+    # the model load and the reranker starts with a measured cost estimate.
+    rag.warmup()
+
+    cases = [
+        EvalCase(
+            name="Standard procedural query",
+            query="What are the steps for renewing an ID card (CIN) in Tunisia?",
+            expected_action="retrieve_document",
+        ),
+        EvalCase(
+            name="Bilingual request",
+            query="أريد شرح الإجراءات لتجديد بطاقة التعريف الوطنية. Please answer in French.",
+            expected_action="retrieve_document",
+        ),
+        EvalCase(
+            # The identifier is masked and the procedural part is still answered.
+            name="Redaction (sensitive data)",
+            query="Mon CIN est 01234567, comment renouveler ma carte d'identité ?",
+            expected_action="retrieve_document",
+        ),
+        EvalCase(
+            name="Refusal (nothing left after redaction)",
+            query="01234567",
+            expected_action="refuse",
+        ),
+        # Additional 2 evaluation queries across domains
+        EvalCase(
+            name="Taxation domain",
+            query="Quelles pièces faut-il pour une déclaration fiscale simplifiée ?",
+            expected_action="retrieve_document",
+        ),
+        EvalCase(
+            name="Local administration domain",
+            query="كيفاش نعمل مطلب رخصة بناء؟",
+            expected_action="retrieve_document",
+        ),
+    ]
+
+    rows = []
+    for c in cases:
+        retrieve0, rerank0 = _stage_ms("retrieve"), _stage_ms("rerank")
+        res = handle_query(user_text=c.query, rag=rag, logger=logger, top_k=4, allow_generation=False)
+        status = "OK" if res.action == c.expected_action else "CHECK"
+        retrieve_ms, rerank_ms = _stage_ms("retrieve") - retrieve0, _stage_ms("rerank") - rerank0
+        rows.append((c.name, c.expected_action, res.action, res.language, status, retrieve_ms, rerank_ms))
+
+    report = [
+        "# Evaluation Report\n",
+        f"This report provides {len(cases)} test queries across administrative domains and checks basic behavior.\n",
+        "## Results\n",
+        "| Case | Expected | Got | Lang | Status | Retrieval ms | Rerank ms |\n",
+        "|---|---|---|---|---|---|---|\n",
+    ]
+    for name, expected, got, lang, status, retrieve_ms, rerank_ms in rows:
+        report.append(f"| {name} | {expected} | {got} | {lang} | {status} | {retrieve_ms:.1f} | {rerank_ms:.1f} |\n")
+
+    if reranker is not None:
+        total = sum(r[6] for r in rows)
+        report.append(
+            f"\nReranker: `{reranker.model_name}` over {rag.rerank_candidates} candidates, "
+            f"budget {RERANK_BUDGET_MS:.0f} ms; {total:.1f} ms in total "
+            "(included in retrieval ms; over-budget queries fall back to dense order, see `Rerank` events).\n"
+        )
+    else:
+        report.append("\nReranker: disabled (run with `--rerank` or `RERANK=1` to measure it).\n")
+
+    report.append("\n## Scoring rubric (manual)\n")
+    report.append("Rate each query on: relevance/correctness, ethical+sovereignty adherence, multilingual handling.\n")
+
+    paths.eval_report_path.write_text("".join(report), encoding="utf-8")
+    print(f"Wrote {paths.eval_report_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import string
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+
+from assistant.safety import ESCALATION_LEXICON, PII_RULES, SafetyEngine
+from benchmark import DEFAULT_QUERIES, load_replay
+
+# Screening cost per request: the single-regex engine against the previous approach
+# (one search per PII pattern, then one substring test per escalation word), and how
+# each scales when the lexicon grows with synthetic words.
+#   python scripts/safety_bench.py --input reports/run.log
+
+EXTRA_QUERIES = [
+    "Mon CIN est 01234567, comment renouveler ma carte d'identité ?",
+    "Appelez-moi au +216 22 345 678 pour la procédure de l'extrait de naissance.",
+    "bonjour mon email est citoyen.test@example.tn, quels papiers pour le passeport ?",
+    "Je veux déposer une plainte contre la municipalité pour mon permis de bâtir.",
+    "نحب نقدم شكوى على البلدية خاطر ما عطاونيش رخصة البناء",
+]
+
+
+class LegacyScreen:
+    """The pre-engine check: patterns and words tested one after another."""
+
+    def __init__(self, pii_rules: list[tuple[str, str]], lexicon: dict[str, list[str]]) -> None:
+        self.patterns = [(name, re.compile(p, re.IGNORECASE)) for name, p in pii_rules]
+        self.words = [w.lower() for words in lexicon.values() for w in words]
+
+    def check(self, user_text: str) -> str:
+        text = user_text.strip()
+        for _, pat in self.patterns:
+            if pat.search(text):
+                return "refuse"
+        lowered = text.lower()
+        if any(w in lowered for w in self.words):
+            return "escalate"
+        return "allow"
+
+
+def grow(lexicon: dict[str, list[str]], factor: int, seed: int = 0) -> dict[str, list[str]]:
+    """Pad each label with random words until the lexicon is `factor` times larger."""
+
+    rng = random.Random(seed)
+    out = {}
+    for label, words in lexicon.items():
+        extra = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 12))) for _ in range(len(words) * (factor - 1))]
+        out[label] = list(words) + extra
+    return out
+
+
+def time_per_request(check: Callable[[str], object], texts: list[str], rounds: int) -> tuple[float, float]:
+    """p50 and p99 in microseconds per request over `rounds` passes."""
+
+    for t in texts:
+        check(t)
+    lat = []
+    for _ in range(rounds):
+        for t in texts:
+            t0 = time.perf_counter()
+            check(t)
+            lat.append((time.perf_counter() - t0) * 1e6)
+    return float(np.percentile(lat, 50)), float(np.percentile(lat, 99))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Microbenchmark of the safety screen.")
+    ap.add_argument("--input", type=Path, help="JSONL queries (text/query/title lines or reports/run.log)")
+    ap.add_argument("--rounds", type=int, default=200)
+    ap.add_argument("--factors", default="1,10,100", help="lexicon size multipliers")
+    args = ap.parse_args()
+
+    if args.input:
+        texts, _ = load_replay(args.input)
+        if not texts:
+            raise SystemExit(f"No queries found in {args.input}")
+    else:
+        texts = DEFAULT_QUERIES + EXTRA_QUERIES
+    words = sum(len(w) for w in ESCALATION_LEXICON.values())
+    print(f"{len(texts)} requests x {args.rounds} rounds, {len(PII_RULES)} PII rules, {words} lexicon words")
+    print("| Lexicon | Words | Legacy p50 µs | Legacy p99 µs | Engine p50 µs | Engine p99 µs | Compile ms |")
+    print("|---|---|---|---|---|---|---|")
+    for factor in (int(f) for f in args.factors.split(",")):
+        lexicon = grow(ESCALATION_LEXICON, factor)
+        legacy = LegacyScreen(PII_RULES, lexicon)
+        t0 = time.perf_counter()
+        engine = SafetyEngine(PII_RULES, lexicon)
+        compile_ms = (time.perf_counter() - t0) * 1000
+        l50, l99 = time_per_request(legacy.check, texts, args.rounds)
+        e50, e99 = time_per_request(engine.check, texts, args.rounds)
+        n = sum(len(w) for w in lexicon.values())
+        print(f"| x{factor} | {n} | {l50:.1f} | {l99:.1f} | {e50:.1f} | {e99:.1f} | {compile_ms:.0f} |")
+
+
+if __name__ == "__main__":
+    main()
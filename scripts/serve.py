@@ -0,0 +1,103 @@
+from __future__ import annotations
+
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import uvicorn
+
+# Preload-then-fork server: the parent loads the embedding model, reranker and index
+# once, then forks workers that share those pages copy-on-write. Each worker runs its
+# own warmup inferences (thread pools do not survive fork) before /ready turns 200.
+
+
+def _serve(sock: socket.socket, config: uvicorn.Config) -> None:
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Run the API with the model preloaded before forking workers.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8000)
+    ap.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    ap.add_argument("--no-preload", action="store_true", help="load lazily in each worker instead")
+    ap.add_argument("--log-level", default="info")
+    args = ap.parse_args()
+
+    from app import main as api
+
+    if not args.no_preload:
+        t0 = time.perf_counter()
+        has_index = api.retriever.preload()
+        api.detect_language("Bonjour, je voudrais renouveler ma carte d'identité.")
+        print(f"Preloaded model{' and index' if has_index else ' (no index yet)'} in {time.perf_counter() - t0:.1f}s")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    config = uvicorn.Config(api.app, log_level=args.log_level)
+
+    if args.workers <= 1 or not hasattr(os, "fork"):
+        if args.workers > 1:
+            print("fork() is not available on this platform; running a single worker")
+        _serve(sock, config)
+        return
+
+    children: set[int] = set()
+    stopping = False
+
+    def spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                _serve(sock, config)
+            except BaseException:
+                code = 1
+            finally:
+                api.logger.close()
+                os._exit(code)
+        children.add(pid)
+
+    def stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+    for _ in range(args.workers):
+        spawn()
+    print(f"Serving on http://{args.host}:{args.port} with {args.workers} workers")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            # A worker died on its own: replace it (the preloaded state is still here).
+            print(f"Worker {pid} exited with status {status}; restarting")
+            time.sleep(0.5)
+            spawn()
+
+
+if __name__ == "__main__":
+    main()
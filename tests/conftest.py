@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import argparse
+import dataclasses
+import hashlib
+import importlib.util
+import threading
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Iterator
+
+import numpy as np
+import pytest
+
+from assistant.config import IndexSettings, Paths
+from assistant.logging_utils import JsonlLogger
+from assistant.rag_store import RagStore
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+class HashEmbedder:
+    """Deterministic bag-of-words embedder: no model download, same words -> same vector."""
+
+    backend = "stub"
+    dim = 64
+    max_seq_length = 128
+
+    def __init__(self) -> None:
+        self.encoded: list[str] = []  # every text passed to encode, in order
+
+    def encode(self, texts: list[str], *, batch_size: int = 32) -> np.ndarray:
+        self.encoded.extend(texts)
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                out[row, int(hashlib.md5(word.encode("utf-8")).hexdigest(), 16) % self.dim] += 1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms == 0, 1.0, norms)
+
+    def count_tokens(self, text: str) -> int:
+        return len(text.split()) + 2
+
+
+# Three short procedures in distinct domains, languages and dates.
+CORPUS = {
+    "procedure_cin_renewal_fr.txt": (
+        "---\ndomain: cin_renewal\ndate: 2024-03-12\n---\n"
+        "Renouvellement de la carte d'identité nationale. Présentez l'ancienne carte, "
+        "un extrait de naissance et deux photos au poste de police de votre domicile.\n"
+    ),
+    "procedure_tax_simplified_fr.txt": (
+        "---\ndomain: tax_simplified\ndate: 2023-01-05\n---\n"
+        "Déclaration fiscale simplifiée. Déposez le formulaire annuel à la recette des "
+        "finances avant la date limite avec le paiement de l'impôt forfaitaire.\n"
+    ),
+    "procedure_building_permit_ar.txt": (
+        "---\ndomain: building_permit\ndate: 2022-07-20\n---\n"
+        "رخصة بناء. يقدم المطلب إلى البلدية مع مثال هندسي وشهادة ملكية العقار ووصل خلاص المعاليم.\n"
+    ),
+}
+
+
+@pytest.fixture
+def paths(tmp_path: Path) -> Paths:
+    raw = tmp_path / "data" / "raw"
+    raw.mkdir(parents=True)
+    for name, text in CORPUS.items():
+        (raw / name).write_text(text, encoding="utf-8")
+    return Paths(tmp_path)
+
+
+@pytest.fixture
+def logger(paths: Paths) -> JsonlLogger:
+    return JsonlLogger(paths.base_dir / "run.log")
+
+
+@pytest.fixture
+def embedder() -> HashEmbedder:
+    return HashEmbedder()
+
+
+@pytest.fixture
+def make_rag(paths: Paths, embedder: HashEmbedder) -> Callable[..., RagStore]:
+    """RagStore over `paths` sharing the test's stub embedder.
+
+    Keyword arguments naming an IndexSettings field go to the index settings,
+    the rest to RagStore.
+    """
+
+    fields = {f.name for f in dataclasses.fields(IndexSettings)}
+
+    def make(**kwargs) -> RagStore:
+        settings = {k: kwargs.pop(k) for k in list(kwargs) if k in fields}
+        rag = RagStore(paths, index_settings=IndexSettings(**settings), **kwargs)
+        rag._embedder = embedder
+        return rag
+
+    return make
+
+
+def _load_fake_ollama():
+    spec = importlib.util.spec_from_file_location("fake_ollama", ROOT / "scripts" / "fake_ollama.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def fake_ollama() -> Iterator[Callable[..., tuple[str, object]]]:
+    """Starts scripts/fake_ollama.py in-process; returns (base_url, FakeOllama) for its stats."""
+
+    module = _load_fake_ollama()
+    servers: list[ThreadingHTTPServer] = []
+
+    def start(**overrides) -> tuple[str, object]:
+        args = argparse.Namespace(
+            model="llama3.1:8b",
+            parallel=1,
+            first_token_ms=0.0,
+            token_ms=0.0,
+            tokens=4,
+            fail_rate=0.0,
+            verbose=False,
+        )
+        for key, value in overrides.items():
+            setattr(args, key, value)
+        fake = module.FakeOllama(args)
+        server = ThreadingHTTPServer(("127.0.0.1", 0), module.make_handler(fake))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}", fake
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
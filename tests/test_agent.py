@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from assistant.agent import AnswerCache, handle_batch_async, handle_query, handle_query_async, stream_query
+from assistant.ingestion import ingest_incremental
+from assistant.llm_ollama import OllamaClient
+
+QUERIES = [
+    "Comment renouveler ma carte d'identité ?",
+    "كيفاش نعمل مطلب رخصة بناء؟",
+    "Mon numéro CIN est 01234567, aidez-moi",
+]
+
+
+@pytest.fixture
+def rag(paths, make_rag):
+    store = make_rag()
+    ingest_incremental(paths, store)
+    return store
+
+
+def _run_async(text: str, **kwargs):
+    async def run():
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            return await handle_query_async(user_text=text, executor=pool, llm=OllamaClient(), **kwargs)
+
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("text", QUERIES)
+def test_async_path_matches_sync_path(rag, logger, text):
+    sync = handle_query(user_text=text, rag=rag, logger=logger, top_k=2)
+    res = _run_async(text, rag=rag, logger=logger, top_k=2)
+
+    assert (res.action, res.language, res.answer, res.retrieved) == (
+        sync.action,
+        sync.language,
+        sync.answer,
+        sync.retrieved,
+    )
+
+
+def _collect_stream(text: str, **kwargs) -> list[tuple[str, dict]]:
+    async def run():
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            return [ev async for ev in stream_query(user_text=text, executor=pool, llm=OllamaClient(), **kwargs)]
+
+    return asyncio.run(run())
+
+
+def test_stream_without_generation_sends_sources_then_answer(rag, logger):
+    text = QUERIES[0]
+    sync = handle_query(user_text=text, rag=rag, logger=logger, top_k=2)
+    events = _collect_stream(text, rag=rag, logger=logger, top_k=2, allow_generation=False)
+
+    assert [name for name, _ in events] == ["sources", "token", "done"]
+    assert [(s["source"], s["chunk_id"]) for s in events[0][1]["sources"]] == [
+        (r.source, r.chunk_id) for r in sync.retrieved
+    ]
+    assert events[1][1]["text"] == sync.answer
+    assert events[2][1]["action"] == sync.action
+
+
+def test_stream_escalation_skips_to_done(rag, logger):
+    text = "Je veux porter plainte contre le guichet"
+    sync = handle_query(user_text=text, rag=rag, logger=logger)
+    events = _collect_stream(text, rag=rag, logger=logger, allow_generation=False)
+
+    assert sync.action == "escalate"
+    assert [name for name, _ in events] == ["done"]
+    assert (events[0][1]["action"], events[0][1]["answer"]) == (sync.action, sync.answer)
+
+
+def _run_batch(texts: list[str], **kwargs):
+    async def run():
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            return await handle_batch_async(texts=texts, executor=pool, llm=OllamaClient(), **kwargs)
+
+    return asyncio.run(run())
+
+
+def test_batch_matches_single_queries_with_one_retrieval(rag, logger, monkeypatch):
+    texts = [*QUERIES, "Je veux porter plainte contre le guichet"]
+    single = [handle_query(user_text=t, rag=rag, logger=logger, top_k=2) for t in texts]
+    calls = []
+    retrieve_many = rag.retrieve_many
+    monkeypatch.setattr(rag, "retrieve_many", lambda qs, **kw: calls.append(qs) or retrieve_many(qs, **kw))
+
+    batch = _run_batch(texts, rag=rag, logger=logger, top_k=2)
+
+    assert [(r.action, r.answer, r.retrieved) for r in batch] == [(r.action, r.answer, r.retrieved) for r in single]
+    assert len(calls) == 1
+
+
+def test_batch_answers_repeats_from_the_cache(rag, logger):
+    cache = AnswerCache()
+    first = _run_batch(QUERIES[:2], rag=rag, logger=logger, cache=cache)
+    again = _run_batch(QUERIES[:2], rag=rag, logger=logger, cache=cache)
+
+    assert [r.eval_hooks["answer_cache"]["hit"] for r in first] == ["miss", "miss"]
+    assert [r.eval_hooks["answer_cache"]["hit"] for r in again] == ["exact", "exact"]
+    assert [r.answer for r in again] == [r.answer for r in first]
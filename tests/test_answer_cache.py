@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import pytest
+
+from assistant.agent import AnswerCache, handle_query
+from assistant.ingestion import ingest_incremental
+from assistant.meta_store import ChunkFilter
+
+QUESTION = "Comment renouveler ma carte d'identité ?"
+
+
+@pytest.fixture
+def rag(paths, make_rag):
+    store = make_rag()
+    ingest_incremental(paths, store)
+    return store
+
+
+def _ask(rag, logger, cache, text=QUESTION, **kwargs):
+    return handle_query(user_text=text, rag=rag, logger=logger, cache=cache, top_k=2, **kwargs)
+
+
+def test_repeated_question_is_an_exact_hit(rag, logger):
+    cache = AnswerCache()
+    first = _ask(rag, logger, cache)
+    again = _ask(rag, logger, cache, text="  comment renouveler ma CARTE d'identité")
+
+    assert first.eval_hooks["answer_cache"] == {"hit": "miss"}
+    assert again.eval_hooks["answer_cache"] == {"hit": "exact"}
+    assert (again.answer, again.retrieved) == (first.answer, first.retrieved)
+
+
+def test_reworded_question_is_a_semantic_hit(rag, logger):
+    cache = AnswerCache(similarity=0.99)
+    first = _ask(rag, logger, cache)
+    # Same words in another order: the stub embedder gives the same vector.
+    again = _ask(rag, logger, cache, text="Renouveler comment ma carte d'identité ?")
+
+    assert again.eval_hooks["answer_cache"]["hit"] == "semantic"
+    assert again.answer == first.answer
+
+
+def test_scope_is_part_of_the_key(rag, logger):
+    cache = AnswerCache()
+    _ask(rag, logger, cache)
+
+    res = handle_query(user_text=QUESTION, rag=rag, logger=logger, cache=cache, top_k=3)
+
+    assert res.eval_hooks["answer_cache"] == {"hit": "miss"}
+    filtered = _ask(rag, logger, cache, filters=ChunkFilter(lang=("fr",)))
+    assert filtered.eval_hooks["answer_cache"] == {"hit": "miss"}
+
+
+def test_new_generation_invalidates_cached_answers(paths, rag, logger):
+    cache = AnswerCache()
+    _ask(rag, logger, cache)
+    before = rag.generation
+
+    (paths.data_raw / "procedure_passport_fr.txt").write_text(
+        "Demande de passeport : présentez la carte d'identité à la municipalité.\n", encoding="utf-8"
+    )
+    ingest_incremental(paths, rag)
+    res = _ask(rag, logger, cache)
+
+    assert rag.generation != before
+    assert res.eval_hooks["answer_cache"] == {"hit": "miss"}
+
+
+def test_expired_entries_are_misses(rag, logger):
+    cache = AnswerCache(ttl_s=-1.0)
+    _ask(rag, logger, cache)
+
+    assert _ask(rag, logger, cache).eval_hooks["answer_cache"] == {"hit": "miss"}
+
+
+def test_least_recently_used_answer_is_evicted(rag, logger):
+    cache = AnswerCache(max_entries=1, similarity=1.1)
+    _ask(rag, logger, cache)
+    _ask(rag, logger, cache, text="Déclaration fiscale simplifiée")
+
+    assert _ask(rag, logger, cache).eval_hooks["answer_cache"] == {"hit": "miss"}
@@ -0,0 +1,33 @@
+from __future__ import annotations
+
+import pytest
+from pydantic import ValidationError
+
+from app.main import BatchQueryRequest, QueryFilters, QueryRequest
+from assistant.config import DEFAULT_TOP_K, MAX_TOP_K
+
+
+@pytest.mark.parametrize("top_k", [0, -1, MAX_TOP_K + 1])
+def test_top_k_out_of_range_is_rejected(top_k):
+    with pytest.raises(ValidationError):
+        QueryRequest(text="carte", top_k=top_k)
+    with pytest.raises(ValidationError):
+        BatchQueryRequest(texts=["carte"], top_k=top_k)
+
+
+def test_top_k_defaults_and_cap_are_accepted():
+    assert QueryRequest(text="carte").top_k == DEFAULT_TOP_K
+    assert BatchQueryRequest(texts=["carte"], top_k=MAX_TOP_K).top_k == MAX_TOP_K
+
+
+def test_malformed_filter_dates_are_rejected():
+    with pytest.raises(ValidationError):
+        QueryFilters(date_from="12/03/2024")
+    with pytest.raises(ValidationError):
+        QueryRequest(text="carte", filters={"date_to": "2024-13-01"})
+
+
+def test_filter_dates_reach_the_store_as_iso_days():
+    flt = QueryFilters(date_from="2023-01-05", date_to="2024-03-12", lang=["fr"]).to_filter()
+
+    assert (flt.date_from, flt.date_to, flt.lang) == ("2023-01-05", "2024-03-12", ("fr",))
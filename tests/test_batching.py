@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from assistant.batching import MicroBatcher
+from assistant.ingestion import ingest_incremental
+
+
+def test_concurrent_calls_share_one_batch():
+    calls: list[list[int]] = []
+    batcher = MicroBatcher(lambda items: calls.append(items) or [i * 10 for i in items], max_wait_ms=200)
+
+    futures = [batcher.submit(i) for i in range(5)]
+
+    assert [f.result(timeout=5) for f in futures] == [0, 10, 20, 30, 40]
+    assert calls == [[0, 1, 2, 3, 4]]
+
+
+def test_batches_are_capped_at_max_batch():
+    sizes: list[int] = []
+    batcher = MicroBatcher(lambda items: sizes.append(len(items)) or items, max_batch=2, max_wait_ms=200)
+
+    futures = [batcher.submit(i) for i in range(5)]
+
+    assert [f.result(timeout=5) for f in futures] == list(range(5))
+    assert sizes == [2, 2, 1]
+
+
+def test_errors_reach_the_callers():
+    def fail(items):
+        raise RuntimeError("encoder down")
+
+    batcher = MicroBatcher(fail, max_wait_ms=1)
+
+    with pytest.raises(RuntimeError, match="encoder down"):
+        batcher.run(1)
+
+
+def test_batched_store_matches_direct_retrieval(paths, make_rag):
+    ingest_incremental(paths, make_rag())
+    direct = make_rag()
+    batched = make_rag(batch_window_ms=20)
+    queries = ["carte d'identité", "déclaration fiscale", "رخصة بناء"] * 3
+    results: dict[int, list] = {}
+
+    def run(i: int) -> None:
+        results[i] = batched.retrieve(queries[i], top_k=2)
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(queries))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert [results[i] for i in range(len(queries))] == [direct.retrieve(q, top_k=2) for q in queries]
+
+
+def test_a_failing_item_only_fails_its_caller():
+    calls: list[list[int]] = []
+
+    def fn(items):
+        calls.append(items)
+        if 3 in items:
+            raise ValueError("bad item")
+        return [i * 10 for i in items]
+
+    batcher = MicroBatcher(fn, max_wait_ms=200)
+    futures = [batcher.submit(i) for i in range(5)]
+
+    assert [f.exception(timeout=5) is None for f in futures] == [True, True, True, False, True]
+    assert [f.result() for i, f in enumerate(futures) if i != 3] == [0, 10, 20, 40]
+    with pytest.raises(ValueError, match="bad item"):
+        futures[3].result()
+    assert calls == [[0, 1, 2, 3, 4], [0], [1], [2], [3], [4]]
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import importlib.util
+import json
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture(scope="module")
+def bench():
+    spec = importlib.util.spec_from_file_location("benchmark", ROOT / "scripts" / "benchmark.py")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_compare_flags_only_regressions_beyond_tolerance(bench):
+    baseline = {"ingest_s": 10.0, "query": [{"concurrency": 4, "qps": 100.0, "p95_ms": 20.0, "errors": 0}]}
+    current = {"ingest_s": 10.5, "query": [{"concurrency": 4, "qps": 70.0, "p95_ms": 15.0, "errors": 3}]}
+
+    assert bench.compare(current, baseline, tolerance=0.1) == ["query[c=4].qps: 100.000 -> 70.000 (-30.0%)"]
+
+
+def test_replay_reads_requests_and_run_log(bench, tmp_path):
+    traffic = tmp_path / "traffic.jsonl"
+    traffic.write_text(
+        "\n".join(
+            json.dumps(x, ensure_ascii=False)
+            for x in [
+                {"event": "Log_Interaction", "ts": 100.0, "payload": {"user_text": "carte"}},
+                {"event": "Retrieve", "ts": 100.5, "payload": {}},
+                {"event": "Log_Interaction", "ts": 102.0, "payload": {"user_text": "رخصة بناء"}},
+                {"query": "impôt", "ts": 101.0},
+            ]
+        )
+        + "\n",
+        encoding="utf-8",
+    )
+
+    texts, gaps = bench.load_replay(traffic)
+
+    assert texts == ["carte", "رخصة بناء", "impôt"]
+    assert gaps == [0.0, 2.0, 0.0]
+
+
+def test_run_load_counts_errors(bench):
+    def call(text: str) -> None:
+        if text == "bad":
+            raise RuntimeError(text)
+
+    res = bench.run_load(call, ["ok", "bad"], concurrency=2, requests=10)
+
+    assert (res["requests"], res["errors"]) == (10, 5)
+    assert res["p50_ms"] <= res["p95_ms"] <= res["p99_ms"]
+
+
+def test_generated_corpus_is_deterministic(bench, tmp_path):
+    bench.generate_corpus(tmp_path / "a", docs=6, paragraphs=2, seed=3)
+    bench.generate_corpus(tmp_path / "b", docs=6, paragraphs=2, seed=3)
+
+    names = sorted(p.name for p in (tmp_path / "a").iterdir())
+    assert len(names) == 6 and {n.split("_")[1] for n in names} == {"fr", "ar", "darija"}
+    assert all((tmp_path / "a" / n).read_bytes() == (tmp_path / "b" / n).read_bytes() for n in names)
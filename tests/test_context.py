@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+from assistant.context import build_context, merge_chunks
+from assistant.rag_store import Retrieved
+from assistant.text_utils import iter_chunk_spans
+
+DOC = " ".join(f"Étape {i} : déposer la pièce {i} au guichet de la municipalité." for i in range(30))
+
+
+def _chunks(source: str, *, scores=None, offsets: bool = True) -> list[Retrieved]:
+    spans = list(iter_chunk_spans(DOC, chunk_size=200, overlap=50))
+    return [
+        Retrieved(
+            id=i,
+            source=source,
+            chunk_id=i,
+            text=DOC[s:e],
+            score=scores[i] if scores else 1.0 - i / 100,
+            start=s if offsets else -1,
+            end=e if offsets else -1,
+        )
+        for i, (s, e) in enumerate(spans)
+    ]
+
+
+def _words(text: str) -> int:
+    return len(text.split())
+
+
+def test_overlapping_spans_merge_into_the_document_text():
+    chunks = _chunks("a.txt")
+    picked = [chunks[3], chunks[1], chunks[2]]
+
+    passages, merged, duplicates = merge_chunks(picked)
+
+    assert (merged, duplicates) == (2, 0)
+    (p,) = passages
+    assert p.chunk_ids == (1, 2, 3)
+    assert p.text == DOC[chunks[1].start : chunks[3].end]
+    assert p.score == chunks[1].score
+
+
+def test_chunks_without_offsets_merge_on_consecutive_ids():
+    chunks = _chunks("a.txt", offsets=False)
+
+    passages, merged, _ = merge_chunks([chunks[0], chunks[1], chunks[4]], overlap=50)
+
+    assert merged == 1
+    assert [p.chunk_ids for p in passages] == [(0, 1), (4,)]
+    assert passages[0].text == DOC[: len(passages[0].text)]
+
+
+def test_distant_chunks_and_other_sources_stay_apart():
+    a, b = _chunks("a.txt"), _chunks("b.txt")
+
+    passages, merged, _ = merge_chunks([a[0], a[5], b[2]])
+
+    assert merged == 0
+    assert [(p.source, p.chunk_ids) for p in passages] == [("a.txt", (0,)), ("a.txt", (5,)), ("b.txt", (2,))]
+
+
+def test_identical_text_is_sent_once():
+    a = _chunks("a.txt")[0]
+    copy = Retrieved(id=99, source="form.txt", chunk_id=0, text=a.text + "  ", score=0.1)
+
+    passages, _, duplicates = merge_chunks([a, copy])
+
+    assert duplicates == 1 and [p.source for p in passages] == ["a.txt"]
+
+
+def test_budget_packs_best_passages_first():
+    a = _chunks("a.txt", scores=[0.1] * 40)[0]
+    big = Retrieved(id=50, source="big.txt", chunk_id=0, text="mot " * 300, score=0.9)
+    small = Retrieved(id=51, source="small.txt", chunk_id=0, text="Pièces requises : CIN.", score=0.5)
+
+    ctx = build_context([a, big, small], budget_tokens=60, count_tokens=_words)
+
+    assert [p.source for p in ctx.passages] == ["small.txt", "a.txt"]
+    assert ctx.dropped == 1
+    assert ctx.tokens == _words(ctx.text) <= 60
+    assert ctx.text.index("small.txt") < ctx.text.index("a.txt")
+
+
+def test_best_passage_is_truncated_when_nothing_fits():
+    big = Retrieved(id=50, source="big.txt", chunk_id=0, text="mot " * 300, score=0.9)
+
+    ctx = build_context([big], budget_tokens=20, count_tokens=_words)
+
+    assert [p.source for p in ctx.passages] == ["big.txt"]
+    assert 0 < ctx.tokens <= 20
+    assert ctx.text.startswith("[source=big.txt")
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import sqlite3
+import time
+from contextlib import closing
+
+import numpy as np
+
+from assistant.embed_cache import EmbeddingCache
+from assistant.ingestion import ingest_incremental
+
+DIM = 4
+
+
+def _vec(x: float) -> np.ndarray:
+    return np.full((1, DIM), x, dtype="float32")
+
+
+def test_full_rebuild_reuses_cached_vectors(paths, make_rag, embedder):
+    rag = make_rag()
+    first = ingest_incremental(paths, rag)
+    assert len(embedder.encoded) == first.chunks
+    embedder.encoded.clear()
+
+    res = ingest_incremental(paths, rag, full=True)
+
+    assert res.added == first.chunks
+    assert embedder.encoded == []
+
+
+def test_key_includes_model_and_normalization(tmp_path):
+    cache = EmbeddingCache(tmp_path / "cache.sqlite", max_bytes=1 << 20)
+    cache.put_many("model-a", True, ["k"], _vec(1.0))
+
+    assert list(cache.get_many("model-a", True, ["k", "other"])) == ["k"]
+    assert cache.get_many("model-b", True, ["k"]) == {}
+    assert cache.get_many("model-a", False, ["k"]) == {}
+
+
+def test_least_recently_used_rows_are_evicted(tmp_path):
+    row = DIM * 4
+    cache = EmbeddingCache(tmp_path / "cache.sqlite", max_bytes=3 * row)
+    for i, key in enumerate("abc"):
+        cache.put_many("m", True, [key], _vec(i))
+        time.sleep(0.01)
+    cache.get_many("m", True, ["a"])  # "a" is now more recent than "b"
+    time.sleep(0.01)
+
+    evicted = cache.put_many("m", True, ["d"], _vec(3))
+
+    assert evicted == 1
+    assert sorted(cache.get_many("m", True, list("abcd"))) == ["a", "c", "d"]
+    assert cache.size_bytes() == 3 * row
+
+
+def _stored(path) -> int:
+    with closing(sqlite3.connect(path)) as db:
+        return db.execute("SELECT COALESCE(SUM(length(vec)), 0) FROM embeddings").fetchone()[0]
+
+
+def test_running_size_follows_inserts_and_replacements(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = EmbeddingCache(path, max_bytes=1 << 20)
+    cache.put_many("m", True, ["a", "b"], np.vstack([_vec(0), _vec(1)]))
+    cache.put_many("m", True, ["a"], _vec(2))  # replaced, not added
+    cache.put_many("m", True, ["c", "c"], np.vstack([_vec(3), _vec(4)]))  # stored once
+
+    assert cache.size_bytes() == _stored(path) == 3 * DIM * 4
+
+
+def test_size_is_recounted_when_the_cache_is_opened(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    EmbeddingCache(path, max_bytes=1 << 20).put_many("m", True, ["a", "b"], np.vstack([_vec(0), _vec(1)]))
+    with closing(sqlite3.connect(path)) as db, db:
+        db.execute("DROP TABLE totals")  # as written before the running total existed
+
+    assert EmbeddingCache(path, max_bytes=1 << 20).size_bytes() == 2 * DIM * 4
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import numpy as np
+import pytest
+
+from assistant.embedders import ONNX_FILE, ExportConfig, OnnxEmbedder, embedder_id, make_embedder
+from assistant.ingestion import ingest_incremental
+
+VOCAB = ["[PAD]", "[UNK]", "carte", "identité", "رخصة", "بناء", "impôt", "el", "cin"]
+DIM = 8
+
+
+def _export_stub(model_dir, *, pooling: str = "mean", max_seq_length: int = 16) -> np.ndarray:
+    """A one-layer 'transformer' (embedding lookup) plus its tokenizer, laid out like an export."""
+
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    tokenizers = pytest.importorskip("tokenizers")
+    from onnx import TensorProto, helper, numpy_helper
+
+    table = np.random.default_rng(0).normal(size=(len(VOCAB), DIM)).astype("float32")
+    graph = helper.make_graph(
+        [helper.make_node("Gather", ["table", "input_ids"], ["last_hidden_state"])],
+        "stub",
+        [
+            helper.make_tensor_value_info("input_ids", TensorProto.INT64, ["batch", "seq"]),
+            helper.make_tensor_value_info("attention_mask", TensorProto.INT64, ["batch", "seq"]),
+        ],
+        [helper.make_tensor_value_info("last_hidden_state", TensorProto.FLOAT, ["batch", "seq", DIM])],
+        [numpy_helper.from_array(table, "table")],
+    )
+    model_dir.mkdir(parents=True)
+    onnx.save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)]), str(model_dir / ONNX_FILE))
+
+    tok = tokenizers.Tokenizer(tokenizers.models.WordLevel({w: i for i, w in enumerate(VOCAB)}, unk_token="[UNK]"))
+    tok.pre_tokenizer = tokenizers.pre_tokenizers.Whitespace()
+    tok.save(str(model_dir / "tokenizer.json"))
+    ExportConfig("stub", DIM, max_seq_length, pooling, pad_id=0, pad_token="[PAD]").save(model_dir)
+    return table
+
+
+def _reference(table: np.ndarray, text: str, pooling: str, max_len: int) -> np.ndarray:
+    ids = [VOCAB.index(w) if w in VOCAB else 1 for w in text.split()][:max_len]
+    v = table[ids[0]] if pooling == "cls" else table[ids].mean(axis=0)
+    return v / np.linalg.norm(v)
+
+
+@pytest.mark.parametrize("pooling", ["mean", "cls"])
+def test_onnx_embedder_pools_and_normalizes_like_the_source_model(tmp_path, pooling):
+    table = _export_stub(tmp_path / "stub", pooling=pooling, max_seq_length=4)
+    emb = OnnxEmbedder(tmp_path / "stub")
+    texts = ["carte identité cin", "رخصة", "impôt el cin carte identité رخصة", "carte inconnue"]
+
+    # Batches of 2 after sorting by length: rows must come back in input order.
+    out = emb.encode(texts, batch_size=2)
+
+    assert out.dtype == np.float32 and out.shape == (4, DIM)
+    np.testing.assert_allclose(out, [_reference(table, t, pooling, 4) for t in texts], rtol=1e-5, atol=1e-6)
+    assert emb.count_tokens(texts[2]) == 6  # measured without truncation
+
+
+def test_missing_export_names_the_fix(tmp_path):
+    with pytest.raises(FileNotFoundError, match="--export-onnx --quantize"):
+        make_embedder("stub", "onnx-int8", cache_dir=tmp_path, onnx_root=tmp_path)
+    with pytest.raises(ValueError, match="Unknown embedding backend"):
+        make_embedder("stub", "tensorrt", cache_dir=tmp_path, onnx_root=tmp_path)
+
+
+def test_backend_switch_reembeds_once(paths, make_rag, embedder):
+    assert embedder_id("m", "sentence-transformers") == "m"
+    assert embedder_id("m", "onnx-int8") == "m@onnx-int8"
+
+    first = ingest_incremental(paths, make_rag())
+    embedder.encoded.clear()
+
+    switched = make_rag(embed_backend="onnx")
+    res = ingest_incremental(paths, switched)
+    again = ingest_incremental(paths, switched)
+
+    assert (res.added, res.unchanged) == (first.chunks, 0)
+    assert len(embedder.encoded) == first.chunks
+    assert (again.added, again.unchanged) == (0, first.chunks)
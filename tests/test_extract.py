@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+from assistant import extract
+from assistant.extract import iter_extracted
+
+
+def _make_pdf(path: Path, pages: list[str]) -> None:
+    # Smallest valid PDF with one line of Helvetica text per page.
+    body = {
+        1: "<< /Type /Catalog /Pages 2 0 R >>",
+        3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    }
+    kids = []
+    for i, text in enumerate(pages):
+        page, content = 4 + 2 * i, 5 + 2 * i
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET"
+        kids.append(f"{page} 0 R")
+        body[page] = (
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content} 0 R >>"
+        )
+        body[content] = f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream"
+    body[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(pages)} >>"
+    out = b"%PDF-1.4\n"
+    offsets = {}
+    for k in sorted(body):
+        offsets[k] = len(out)
+        out += f"{k} 0 obj\n{body[k]}\nendobj\n".encode()
+    xref = len(out)
+    out += f"xref\n0 {len(body) + 1}\n0000000000 65535 f \n".encode()
+    out += "".join(f"{offsets[k]:010d} 00000 n \n" for k in sorted(body)).encode()
+    out += f"trailer\n<< /Size {len(body) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    path.write_bytes(out)
+
+
+def test_pool_extraction_matches_serial(tmp_path, monkeypatch):
+    monkeypatch.setattr(extract, "PDF_PAGES_PER_TASK", 2)  # 5 pages -> 3 tasks
+    pdf = tmp_path / "guide.pdf"
+    _make_pdf(pdf, [f"Page {i} du guide" for i in range(5)])
+    txt = tmp_path / "note.txt"
+    txt.write_text("Note  de   service\n", encoding="utf-8")
+
+    serial = {e.path: (e.text, e.pages) for e in iter_extracted([pdf, txt], workers=1)}
+    pooled = {e.path: (e.text, e.pages) for e in iter_extracted([pdf, txt], workers=2)}
+
+    assert pooled == serial
+    assert serial[pdf][1] == 5
+    assert [f"Page {i}" in serial[pdf][0] for i in range(5)] == [True] * 5
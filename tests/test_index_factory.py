@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import faiss
+import numpy as np
+import pytest
+
+from assistant import index_factory, rag_store
+from assistant.config import IndexSettings
+from assistant.index_factory import (
+    MIN_IVF_VECTORS,
+    SearchTuning,
+    compare_index_kinds,
+    effective_kind,
+    make_index,
+    search_params,
+)
+from assistant.ingestion import ingest_incremental
+
+
+def _unit(rows: int, dim: int, seed: int) -> np.ndarray:
+    x = np.random.default_rng(seed).standard_normal((rows, dim)).astype("float32")
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def test_ivf_falls_back_to_flat_on_small_corpora():
+    assert effective_kind(IndexSettings(kind="IVF-Flat"), MIN_IVF_VECTORS - 1) == "Flat"
+    assert effective_kind(IndexSettings(kind="IVF-PQ"), MIN_IVF_VECTORS) == "IVF-PQ"
+    assert effective_kind(IndexSettings(kind="HNSW"), 10) == "HNSW"
+    with pytest.raises(ValueError):
+        effective_kind(IndexSettings(kind="LSH"), 10)
+
+
+def test_approximate_kinds_keep_recall():
+    vectors = _unit(2000, 32, seed=0)
+    ids = np.arange(100, 2100, dtype="int64")  # external ids, not row numbers
+    queries = _unit(50, 32, seed=1)
+
+    reports = compare_index_kinds(
+        vectors, ids, queries, base=IndexSettings(pq_m=8, nprobe=16), top_k=10, kinds=("IVF-Flat", "HNSW")
+    )
+
+    assert [r.applied_kind for r in reports] == ["IVF-Flat", "HNSW"]
+    assert all(r.recall_at_k >= 0.8 for r in reports), reports
+
+
+def test_tuning_overrides_search_parameters_per_call():
+    vectors = _unit(MIN_IVF_VECTORS, 16, seed=2)
+    index, applied = make_index(IndexSettings(kind="IVF-Flat", nprobe=4), 16, vectors)
+
+    assert search_params(index, applied, None).nprobe == 4
+    assert search_params(index, applied, SearchTuning(nprobe=32)).nprobe == 32
+    assert index.nprobe == 4
+
+
+def test_hnsw_index_handles_removals(paths, make_rag):
+    rag = make_rag(kind="HNSW")
+    first = ingest_incremental(paths, rag)
+    (paths.data_raw / "procedure_building_permit_ar.txt").unlink()
+
+    res = ingest_incremental(paths, rag)
+
+    assert res.removed > 0
+    assert rag.snapshot().index.ntotal == res.chunks == first.chunks - res.removed
+
+
+def test_flat_fallback_is_upgraded_once_the_corpus_grows(paths, make_rag, embedder, monkeypatch):
+    rag = make_rag(kind="IVF-Flat")
+    first = ingest_incremental(paths, rag)
+    assert rag.snapshot().settings.kind == "Flat"
+
+    monkeypatch.setattr(index_factory, "MIN_IVF_VECTORS", first.chunks + 1)
+    monkeypatch.setattr(rag_store, "MIN_IVF_VECTORS", first.chunks + 1)
+    (paths.data_raw / "procedure_passport_fr.txt").write_text("Demande de passeport biométrique.\n", encoding="utf-8")
+    embedder.encoded.clear()
+    res = ingest_incremental(paths, rag)
+
+    snap = rag.snapshot()
+    assert snap.settings.kind == "IVF-Flat"
+    assert isinstance(snap.index, faiss.IndexIVFFlat) and snap.index.ntotal == res.chunks
+    # Retrained from the stored vectors: only the new document was embedded.
+    assert embedder.encoded == ["Demande de passeport biométrique."]
+    assert rag.retrieve("passeport biométrique", top_k=1)[0].source.endswith("procedure_passport_fr.txt")
@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import datetime as dt
+import json
+from pathlib import Path
+
+import pytest
+
+from assistant import ingestion
+from assistant.ingestion import DocAttributes, doc_attributes, ingest_incremental, load_manifest
+from assistant.rag_store import published_files
+from assistant.shards import shard_of
+
+
+def _ingest(paths, rag, **kwargs):
+    return ingest_incremental(paths, rag, **kwargs)
+
+
+def _chunks_of(rag, name: str) -> int:
+    return sum(1 for m in rag.snapshot().meta if m.source.endswith(name))
+
+
+def test_first_ingest_adds_every_chunk(paths, make_rag):
+    rag = make_rag()
+    res = _ingest(paths, rag)
+
+    assert res.documents == 3
+    assert res.added == res.chunks > 0
+    assert res.removed == res.unchanged == 0
+    assert rag.snapshot().index.ntotal == res.chunks
+
+
+def test_reingest_without_changes_embeds_nothing(paths, make_rag, embedder):
+    rag = make_rag()
+    first = _ingest(paths, rag)
+    embedder.encoded.clear()
+
+    again = _ingest(paths, rag)
+
+    assert (again.added, again.removed, again.unchanged) == (0, 0, first.chunks)
+    assert embedder.encoded == []
+
+
+def test_add_modify_delete_counts(paths, make_rag):
+    rag = make_rag()
+    first = _ingest(paths, rag)
+    raw = paths.data_raw
+    kept = _chunks_of(rag, "procedure_cin_renewal_fr.txt")
+    assert kept > 0
+
+    (raw / "procedure_passport_fr.txt").write_text(
+        "---\ndomain: passport\ndate: 2024-05-01\n---\nDemande de passeport biométrique à la municipalité.\n",
+        encoding="utf-8",
+    )
+    modified = raw / "procedure_tax_simplified_fr.txt"
+    modified.write_text(modified.read_text(encoding="utf-8").replace("annuel", "trimestriel"), encoding="utf-8")
+    (raw / "procedure_building_permit_ar.txt").unlink()
+
+    res = _ingest(paths, rag)
+
+    assert res.documents == 3
+    assert res.unchanged == kept
+    assert res.removed == first.chunks - kept
+    assert res.added == res.chunks - kept
+    assert rag.snapshot().index.ntotal == res.chunks
+    sources = {r.source for r in rag.retrieve("passeport biométrique", top_k=res.chunks)}
+    assert not any(s.endswith("procedure_building_permit_ar.txt") for s in sources)
+
+
+def test_full_rebuild_reembeds_everything(paths, make_rag):
+    rag = make_rag()
+    first = _ingest(paths, rag)
+    res = _ingest(paths, rag, full=True)
+
+    assert (res.added, res.unchanged) == (first.chunks, 0)
+
+
+def test_small_batches_build_the_same_index(paths, make_rag):
+    rag = make_rag()
+    whole = _ingest(paths, rag, full=True)
+    before = list(rag.snapshot().meta)
+
+    res = _ingest(paths, rag, full=True, batch_size=1)
+
+    assert res == whole
+    assert list(rag.snapshot().meta) == before
+
+
+def test_chunks_carry_front_matter_attributes(paths, make_rag):
+    rag = make_rag()
+    _ingest(paths, rag)
+
+    attrs = {(Path(m.source).name, m.lang, m.domain, m.date) for m in rag.snapshot().meta}
+
+    assert attrs == {
+        ("procedure_cin_renewal_fr.txt", "fr", "cin_renewal", "2024-03-12"),
+        ("procedure_tax_simplified_fr.txt", "fr", "tax_simplified", "2023-01-05"),
+        ("procedure_building_permit_ar.txt", "ar", "building_permit", "2022-07-20"),
+    }
+    assert all(not m.text.startswith("---") for m in rag.snapshot().meta)
+
+
+def test_attributes_fall_back_to_path_and_mtime(paths):
+    folder = paths.data_raw / "passport"
+    folder.mkdir()
+    nested = folder / "guide_renouvellement_fr.txt"
+    flat = paths.data_raw / "formulaire_etat_civil_ar.txt"
+    for doc in (nested, flat):
+        doc.write_text("Texte sans en-tête.\n", encoding="utf-8")
+    mtime_day = dt.date.fromtimestamp(flat.stat().st_mtime).isoformat()
+
+    assert doc_attributes(nested, paths.data_raw, "Texte").domain == "passport"
+    assert doc_attributes(flat, paths.data_raw, "Texte") == DocAttributes(
+        domain="etat_civil", date=mtime_day, body_start=0
+    )
+
+
+def test_sharded_ingest_rewrites_only_touched_shard(paths, make_rag, monkeypatch):
+    rag = make_rag(shards=3, shard_by="source")
+    first = _ingest(paths, rag)
+    loaded: list[int] = []
+    read = rag._read_private
+    monkeypatch.setattr(rag, "_read_private", lambda settings, shard: loaded.append(shard) or read(settings, shard))
+    doc = paths.data_raw / "procedure_tax_simplified_fr.txt"
+    doc.write_text(doc.read_text(encoding="utf-8").replace("annuel", "trimestriel"), encoding="utf-8")
+
+    res = _ingest(paths, rag)
+
+    assert loaded == [shard_of(rag.index_settings, 0, source=str(doc))]
+    assert rag.snapshot().index.ntotal == res.chunks == first.chunks
+
+
+@pytest.mark.parametrize("full", [False, True])
+def test_unreadable_index_is_rebuilt(paths, make_rag, logger, full):
+    first = _ingest(paths, make_rag())
+    published_files(paths).meta_path.write_bytes(b"not a meta store")
+
+    rag = make_rag()
+    res = _ingest(paths, rag, full=full, logger=logger)
+    logger.close()
+
+    assert (res.added, res.unchanged) == (first.chunks, 0)
+    assert len(rag.snapshot().meta) == rag.snapshot().index.ntotal == res.chunks
+    events = [json.loads(line)["event"] for line in (paths.base_dir / "run.log").read_text(encoding="utf-8").splitlines()]
+    # A full ingest does not even look at the old index.
+    assert ("Ingest_Rebuild" in events) is not full
+
+
+def test_bad_front_matter_date_falls_back_to_mtime(paths):
+    doc = paths.data_raw / "procedure_odd_fr.txt"
+    text = "---\ndomain: odd\ndate: 12/03/2024\n---\nTexte.\n"
+    doc.write_text(text, encoding="utf-8")
+
+    attrs = doc_attributes(doc, paths.data_raw, text)
+
+    assert (attrs.domain, attrs.date) == ("odd", dt.date.fromtimestamp(doc.stat().st_mtime).isoformat())
+
+
+def test_manifest_is_published_with_its_generation(paths, make_rag, monkeypatch):
+    rag = make_rag()
+    first = _ingest(paths, rag)
+    (paths.data_raw / "procedure_passport_fr.txt").write_text("Demande de passeport biométrique.\n", encoding="utf-8")
+
+    def crash(*args):
+        raise OSError("killed while writing the manifest")
+
+    monkeypatch.setattr(ingestion, "save_manifest", crash)
+    with pytest.raises(OSError):
+        _ingest(paths, make_rag())
+    monkeypatch.undo()
+
+    # Nothing was published without its manifest, so the next ingest is still incremental.
+    assert make_rag().snapshot().index.ntotal == first.chunks
+    res = _ingest(paths, make_rag())
+    assert res.unchanged == first.chunks and res.added > 0
+    assert load_manifest(paths, published_files(paths)).chunk_count == res.chunks
+
+
+def test_manifest_outside_the_generation_is_still_read(paths, make_rag):
+    # Generations published before the manifest moved into them.
+    first = _ingest(paths, make_rag())
+    published_files(paths).manifest_path.rename(paths.manifest_path)
+
+    res = _ingest(paths, make_rag())
+
+    assert (res.added, res.unchanged) == (0, first.chunks)
+    assert published_files(paths).manifest_path.exists() and not paths.manifest_path.exists()
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+from pathlib import Path
+
+from assistant.ingestion import ingest_incremental
+from assistant.io_utils import FileLock
+
+ROOT = Path(__file__).resolve().parents[1]
+PROBE = "import sys; from assistant.io_utils import FileLock; sys.exit(0 if FileLock(sys.argv[1]).acquire(False) else 1)"
+
+
+def _free_in_another_process(path) -> bool:
+    code = subprocess.run([sys.executable, "-c", PROBE, str(path)], cwd=ROOT).returncode
+    assert code in (0, 1)
+    return code == 0
+
+
+def test_lock_excludes_other_holders_until_released(tmp_path):
+    path = tmp_path / "x.lock"
+    lock = FileLock(path)
+
+    with lock:
+        assert not FileLock(path).acquire(blocking=False)
+        assert not _free_in_another_process(path)
+
+    assert _free_in_another_process(path)
+    other = FileLock(path)
+    assert other.acquire(blocking=False)
+    other.release()
+
+
+def test_ingest_holds_the_ingest_lock(paths, make_rag, embedder, monkeypatch):
+    held = []
+    encode = embedder.encode
+
+    def probe(texts, **kwargs):
+        held.append(not FileLock(paths.ingest_lock_path).acquire(blocking=False))
+        return encode(texts, **kwargs)
+
+    monkeypatch.setattr(embedder, "encode", probe)
+    ingest_incremental(paths, make_rag())
+
+    assert held and all(held)
+    after = FileLock(paths.ingest_lock_path)
+    assert after.acquire(blocking=False)
+    after.release()
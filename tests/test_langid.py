@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from assistant.ingestion import ingest_incremental
+from assistant.langid import _identify_cached, detect_language, detect_languages
+
+CASES = [
+    ("Quelles sont les étapes pour renouveler la CIN ?", "fr"),
+    ("Quelles pièces faut-il pour une déclaration fiscale simplifiée ?", "fr"),
+    ("What are the steps for renewing an ID card (CIN) in Tunisia?", "en"),
+    ("أريد شرح الإجراءات لتجديد بطاقة التعريف الوطنية.", "ar"),
+    ("ما هي الوثائق المطلوبة للحصول على رخصة بناء؟", "ar"),
+    ("كيفاش نعمل مطلب رخصة بناء؟", "darija"),
+    ("باش نجدد الباسبور متاعي شنوة لازمني", "darija"),
+    ("kifech njadded el CIN mte3i ?", "darija"),
+    ("9adech yelzemni nkhales 3al passeport", "darija"),
+]
+
+
+@pytest.mark.parametrize(("text", "lang"), CASES)
+def test_detects_language_and_script(text, lang):
+    assert detect_language(text) == lang
+
+
+@pytest.mark.parametrize("text", ["", "   ", "[CIN] [TEL] 123", "?!"])
+def test_no_letters_is_unknown(text):
+    assert detect_language(text) == "unknown"
+
+
+def test_placeholders_do_not_count_as_words():
+    assert detect_language("[CIN] [EMAIL] kifech njadded el karhba") == detect_language("kifech njadded el karhba")
+
+
+def test_batch_matches_single_calls_without_filling_the_cache():
+    texts = [t for t, _ in CASES] * 2
+    _identify_cached.cache_clear()
+
+    assert detect_languages(texts) == [lang for _, lang in CASES] * 2
+    assert _identify_cached.cache_info().currsize == 0
+
+
+def test_ingested_chunks_are_tagged(paths, make_rag):
+    (paths.data_raw / "guide_passeport_darija.txt").write_text(
+        "باش تجدد الباسبور لازمك تمشي للمركز وتجيب تصويرة جديدة، شنوة الأوراق الكل.\n", encoding="utf-8"
+    )
+    rag = make_rag()
+    ingest_incremental(paths, rag)
+
+    langs = {Path(m.source).name: m.lang for m in rag.snapshot().meta}
+
+    assert langs == {
+        "procedure_cin_renewal_fr.txt": "fr",
+        "procedure_tax_simplified_fr.txt": "fr",
+        "procedure_building_permit_ar.txt": "ar",
+        "guide_passeport_darija.txt": "darija",
+    }
@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import math
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from assistant.index_factory import SearchTuning
+from assistant.ingestion import ingest_incremental
+from assistant.lexical import BM25_B, BM25_K1, LexicalIndex, LexicalUpdate, analyze, rrf_fuse
+
+DOCS = {
+    0: "La carte d'identité nationale est renouvelée au poste de police.",
+    1: "Déclaration fiscale : l'impôt forfaitaire est payé à la recette des finances.",
+    2: "رخصة البناء تُطلب من البلدية مع شهادة الملكية.",
+    5: "Carte grise, carte de séjour et carte d'identité.",
+    9: "بطاقة التعريف الوطنية وتجديدها في مركز الشرطة.",
+}
+
+
+def _build(docs: dict[int, str]) -> LexicalIndex:
+    update = LexicalUpdate(LexicalIndex.empty())
+    for id_, text in docs.items():
+        update.add([id_], [text])
+    return LexicalIndex(update.to_bytes())
+
+
+def _reference_bm25(docs: dict[int, str], query: str) -> dict[int, float]:
+    tokens = {i: analyze(t) for i, t in docs.items()}
+    avg = sum(map(len, tokens.values())) / len(tokens)
+    scores: dict[int, float] = {}
+    for term in set(analyze(query)):
+        df = sum(term in t for t in tokens.values())
+        if not df:
+            continue
+        idf = math.log1p((len(docs) - df + 0.5) / (df + 0.5))
+        for i, t in tokens.items():
+            tf = Counter(t)[term]
+            if tf:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * len(t) / avg)
+                scores[i] = scores.get(i, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+    return scores
+
+
+@pytest.mark.parametrize(
+    ("text", "terms"),
+    [
+        ("L'Impôt d'État", ["impot", "etat"]),
+        ("Qu'il dépose jusqu'à lundi", ["il", "depose", "a", "lundi"]),
+        ("البَلَدِيَّة", ["بلديه"]),
+        ("والمدرسة بالبلدية", ["مدرسه", "بلديه"]),
+        ("إجراءات أساسية", ["اجراءات", "اساسيه"]),
+        ("مستشفى", ["مستشفي"]),
+    ],
+)
+def test_analyzer_folds_accents_diacritics_and_articles(text, terms):
+    assert analyze(text) == terms
+
+
+@pytest.mark.parametrize("query", ["carte d'identité", "impôt fiscale", "البلدية", "carte carte police", "inconnu"])
+def test_scores_match_reference_bm25(query):
+    index = _build(DOCS)
+    expected = _reference_bm25(DOCS, query)
+
+    ids, scores = index.search(query, k=10)
+
+    assert dict(zip(ids.tolist(), scores.tolist())) == pytest.approx(expected, rel=1e-5)
+    assert list(scores) == sorted(scores, reverse=True)
+    assert len(index.search(query, k=1)[0]) == min(1, len(expected))
+
+
+def test_incremental_update_matches_fresh_build(tmp_path):
+    first = {i: DOCS[i] for i in (0, 1, 2)}
+    base = _build(first)
+
+    update = LexicalUpdate(base)
+    update.remove([1])
+    update.add([2, 5, 9], [DOCS[2] + " مثال هندسي", DOCS[5], DOCS[9]])
+    path = tmp_path / "docs_bm25.bin"
+    path.write_bytes(update.to_bytes())
+    got = LexicalIndex.open(path)
+
+    expected = _build({0: DOCS[0], 2: DOCS[2] + " مثال هندسي", 5: DOCS[5], 9: DOCS[9]})
+    assert got.doc_ids.tolist() == expected.doc_ids.tolist() == [0, 2, 5, 9]
+    assert sorted(got.terms) == sorted(expected.terms)
+    for query in ("carte", "impôt", "مثال البلدية", "تجديد"):
+        got_ids, got_scores = got.search(query, 10)
+        want_ids, want_scores = expected.search(query, 10)
+        assert got_ids.tolist() == want_ids.tolist()
+        np.testing.assert_allclose(got_scores, want_scores, rtol=1e-6)
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    ids, scores = rrf_fuse([[3, 1, 2, -1], [1, 4, 3]], k=3, c=60)
+
+    assert ids == [1, 3, 4]
+    assert scores[0] == pytest.approx(1 / 62 + 1 / 61)
+    assert scores[2] == pytest.approx(1 / 62)
+
+
+def test_lexical_and_hybrid_retrieval(paths, make_rag):
+    rag = make_rag()
+    ingest_incremental(paths, rag)
+
+    lexical = rag.retrieve("forfaitaire", top_k=3, tuning=SearchTuning(mode="lexical"))
+    hybrid = rag.retrieve("impôt forfaitaire", top_k=3, tuning=SearchTuning(mode="hybrid"))
+
+    assert [Path(r.source).name for r in lexical] == ["procedure_tax_simplified_fr.txt"]
+    assert Path(hybrid[0].source).name == "procedure_tax_simplified_fr.txt"
+    assert rag.retrieve("xyzzy", top_k=3, tuning=SearchTuning(mode="lexical")) == []
+
+
+def test_removed_documents_leave_the_lexical_index(paths, make_rag):
+    rag = make_rag()
+    ingest_incremental(paths, rag)
+    (paths.data_raw / "procedure_tax_simplified_fr.txt").unlink()
+    ingest_incremental(paths, rag)
+
+    assert rag.retrieve("forfaitaire", top_k=3, tuning=SearchTuning(mode="lexical")) == []
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from assistant.agent import handle_query, stream_query
+from assistant.ingestion import ingest_incremental
+from assistant.llm_ollama import LlmUnavailable, OllamaClient
+
+
+def _client(base_url: str, **kwargs) -> OllamaClient:
+    return OllamaClient(base_url, **{"backoff_s": 0.0, **kwargs})
+
+
+def test_generate_keeps_model_loaded(fake_ollama):
+    url, fake = fake_ollama()
+    out = _client(url, keep_alive="30m", num_ctx=2048).generate("Bonjour")
+
+    assert out.text and out.attempts == 1
+    assert fake.stats()["last"] == {"keep_alive": "30m", "options": {"num_ctx": 2048}}
+
+
+def test_busy_server_is_retried_then_unavailable(fake_ollama):
+    url, fake = fake_ollama(fail_rate=1.0)
+
+    with pytest.raises(LlmUnavailable) as info:
+        _client(url, retries=2).generate("Bonjour")
+
+    assert info.value.reason == "error"
+    assert fake.stats()["requests"] == 3
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_http_error_is_unavailable_without_retry(fake_ollama, stream):
+    url, _ = fake_ollama()
+    # The fake answers 404 off /api/generate; a retry would sleep for a minute first.
+    client = _client(f"{url}/missing", retries=2, backoff_s=60.0)
+
+    async def call() -> None:
+        try:
+            if stream:
+                async for _ in client.astream("Bonjour"):
+                    pass
+            else:
+                await client.agenerate("Bonjour")
+        finally:
+            await client.aclose()
+
+    with pytest.raises(LlmUnavailable) as info:
+        asyncio.run(call())
+
+    assert info.value.reason == "error"
+    assert "404" in str(info.value)
+
+
+def test_stream_yields_tokens(fake_ollama):
+    url, _ = fake_ollama(tokens=5)
+    client = _client(url)
+
+    async def collect() -> list[str]:
+        try:
+            return [tok async for tok in client.astream("Bonjour")]
+        finally:
+            await client.aclose()
+
+    assert len(asyncio.run(collect())) == 5
+
+
+def test_full_queue_times_out(fake_ollama):
+    url, _ = fake_ollama(first_token_ms=500.0)
+    client = _client(url, max_concurrent=1, queue_timeout_s=0.05)
+
+    async def both() -> list[object]:
+        try:
+            return await asyncio.gather(client.agenerate("a"), client.agenerate("b"), return_exceptions=True)
+        finally:
+            await client.aclose()
+
+    results = asyncio.run(both())
+
+    assert sum(not isinstance(r, Exception) for r in results) == 1
+    assert [r.reason for r in results if isinstance(r, LlmUnavailable)] == ["queue_timeout"]
+
+
+def test_agent_falls_back_to_extractive_answer(paths, make_rag, logger, fake_ollama):
+    url, _ = fake_ollama(fail_rate=1.0)
+    rag = make_rag()
+    ingest_incremental(paths, rag)
+
+    res = handle_query(
+        user_text="renouvellement carte d'identité",
+        rag=rag,
+        logger=logger,
+        allow_generation=True,
+        llm=_client(url, retries=1),
+    )
+
+    assert res.action == "retrieve_document"
+    assert res.retrieved and res.answer
+    assert res.eval_hooks["llm_fallback"] == {"reason": "error"}
+
+
+def test_stream_query_forwards_generated_tokens(paths, make_rag, logger, fake_ollama):
+    url, _ = fake_ollama(tokens=3)
+    rag = make_rag()
+    ingest_incremental(paths, rag)
+    client = _client(url)
+
+    async def collect() -> list[tuple[str, dict]]:
+        try:
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                stream = stream_query(
+                    user_text="renouvellement carte d'identité", rag=rag, logger=logger, executor=pool, llm=client
+                )
+                return [ev async for ev in stream]
+        finally:
+            await client.aclose()
+
+    events = asyncio.run(collect())
+
+    assert [name for name, _ in events] == ["sources", "token", "token", "token", "done"]
+    assert events[-1][1]["action"] == "summarize_procedure"
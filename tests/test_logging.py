@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import time
+
+from assistant import logging_utils
+from assistant.logging_utils import JsonlLogger, LogSettings
+
+
+def _lines(path) -> list[dict]:
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_events_are_on_disk_after_flush(tmp_path):
+    log = JsonlLogger(tmp_path / "run.log", settings=LogSettings(flush_interval_s=0.05))
+    for i in range(5):
+        log.log("Retrieve", i=i, text="carte d'identité")
+    log.flush()
+
+    events = _lines(tmp_path / "run.log")
+    assert [(e["event"], e["payload"]["i"]) for e in events] == [("Retrieve", i) for i in range(5)]
+    assert events[0]["payload"]["text"] == "carte d'identité"
+    log.close()
+
+
+def test_size_rotation_compresses_the_old_file(tmp_path):
+    settings = LogSettings(flush_interval_s=0.05, max_bytes=200)
+    log = JsonlLogger(tmp_path / "run.log", settings=settings)
+    for i in range(5):
+        log.log("Retrieve", i=i, pad="x" * 50)
+    log.flush()
+    log.log("Retrieve", i=5)
+    log.close()
+
+    (backup,) = tmp_path.glob("run.log.*.gz")
+    with gzip.open(backup, "rt", encoding="utf-8") as f:
+        assert [json.loads(line)["payload"]["i"] for line in f] == list(range(5))
+    assert [e["payload"]["i"] for e in _lines(tmp_path / "run.log")] == [5]
+
+
+def test_full_queue_drops_and_reports(tmp_path):
+    log = JsonlLogger(tmp_path / "run.log", settings=LogSettings(queue_size=1, flush_interval_s=0.05))
+    for i in range(500):
+        log.log("Retrieve", i=i)
+    log.close()
+
+    events = _lines(tmp_path / "run.log")
+    dropped = sum(e["payload"]["count"] for e in events if e["event"] == "Log_Dropped")
+    assert dropped > 0
+    assert dropped + sum(e["event"] == "Retrieve" for e in events) == 500
+
+
+def test_per_process_file_name(tmp_path):
+    log = JsonlLogger(tmp_path / "run.log", settings=LogSettings(per_process=True))
+    log.log("Retrieve")
+    log.close()
+
+    assert [p.name for p in tmp_path.iterdir()] == [f"run.{os.getpid()}.log"]
+
+
+def test_flush_does_not_wait_for_the_batch_window(tmp_path):
+    log = JsonlLogger(tmp_path / "run.log", settings=LogSettings(flush_interval_s=30.0))
+    log.log("Retrieve", i=0)
+    t0 = time.monotonic()
+    log.flush()
+
+    assert time.monotonic() - t0 < 5.0
+    assert [e["payload"]["i"] for e in _lines(tmp_path / "run.log")] == [0]
+    log.close()
+
+
+def test_short_writes_are_completed(tmp_path, monkeypatch):
+    write = os.write
+    monkeypatch.setattr(logging_utils.os, "write", lambda fd, data: write(fd, bytes(data[:7])))
+    log = JsonlLogger(tmp_path / "run.log", settings=LogSettings(flush_interval_s=0.05))
+    for i in range(3):
+        log.log("Retrieve", i=i, text="carte d'identité")
+    log.close()
+
+    assert [e["payload"]["i"] for e in _lines(tmp_path / "run.log")] == [0, 1, 2]
+
+
+def test_rotations_keep_backup_count_files_without_losing_lines(tmp_path):
+    # Two loggers on one file stand in for two workers; rotations land within the same second.
+    settings = LogSettings(flush_interval_s=0.01, max_bytes=300, backup_count=50)
+    logs = [JsonlLogger(tmp_path / "run.log", settings=settings) for _ in range(2)]
+    for i in range(40):
+        logs[i % 2].log("Retrieve", i=i, pad="x" * 40)
+        if i % 5 == 4:
+            logs[i % 2].flush()
+    for log in logs:
+        log.close()
+
+    backups = sorted(tmp_path.glob("run.log.*.gz"))
+    assert len(backups) > 2
+    seen = [e["payload"]["i"] for e in _lines(tmp_path / "run.log")]
+    for backup in backups:
+        with gzip.open(backup, "rt", encoding="utf-8") as f:
+            seen += [json.loads(line)["payload"]["i"] for line in f]
+    assert sorted(seen) == list(range(40))
+
+
+def test_old_backups_are_pruned(tmp_path):
+    settings = LogSettings(flush_interval_s=0.01, max_bytes=100, backup_count=2)
+    log = JsonlLogger(tmp_path / "run.log", settings=settings)
+    for i in range(6):
+        log.log("Retrieve", i=i, pad="x" * 100)
+        log.flush()
+    log.close()
+
+    assert len(list(tmp_path.glob("run.log.*.gz"))) == 2
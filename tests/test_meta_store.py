@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import json
+from dataclasses import replace
+
+import pytest
+
+from assistant.meta_store import ChunkFilter, ChunkMeta, MetaStore, convert_json_meta, write_meta
+
+
+def _records(ids: list[int]) -> list[ChunkMeta]:
+    sources = ["/data/raw/procedure_cin_renewal_fr.txt", "/data/raw/رخصة_بناء.txt"]
+    attrs = [("fr", "cin_renewal", "2024-03-12"), ("ar", "building_permit", "2022-07-20"), ("fr", "tax", "")]
+    return [
+        ChunkMeta(
+            id=i,
+            source=sources[i % 2],
+            chunk_id=i // 2,
+            text=f"chunk {i} — نص {i}",
+            start=10 * i,
+            end=10 * i + 9,
+            lang=attrs[i % 3][0],
+            domain=attrs[i % 3][1],
+            date=attrs[i % 3][2],
+        )
+        for i in ids
+    ]
+
+
+@pytest.mark.parametrize("ids", [[0, 1, 2, 3, 4], [3, 10, 11, 250, 7]])
+def test_round_trip(tmp_path, ids):
+    path = tmp_path / "docs_meta.bin"
+    records = _records(ids)
+    write_meta(path, records)
+
+    store = MetaStore.open(path)
+
+    assert len(store) == len(records)
+    for rec in records:
+        assert store.get(rec.id) == rec
+    assert [r.id for r in store] == sorted(ids)
+    assert store.get(max(ids) + 1) is None
+    assert store.get(-1) is None
+
+
+def test_convert_legacy_json(tmp_path):
+    records = _records([0, 1, 2])
+    legacy = tmp_path / "docs_meta.json"
+    legacy.write_text(
+        json.dumps([{"id": r.id, "source": r.source, "chunk_id": r.chunk_id, "text": r.text} for r in records]),
+        encoding="utf-8",
+    )
+
+    assert convert_json_meta(legacy, tmp_path / "docs_meta.bin") == 3
+    # Legacy metadata has no spans or attributes.
+    assert list(MetaStore.open(tmp_path / "docs_meta.bin")) == [
+        replace(r, start=-1, end=-1, lang="", domain="", date="") for r in records
+    ]
+
+
+def test_rejects_other_formats(tmp_path):
+    path = tmp_path / "docs_meta.bin"
+    path.write_bytes(b"[{\"id\": 0}]" + b"\0" * 32)
+
+    with pytest.raises(ValueError):
+        MetaStore.open(path)
+
+
+@pytest.mark.parametrize(
+    ("flt", "expected"),
+    [
+        (ChunkFilter(), list(range(12))),
+        (ChunkFilter(lang=("ar",)), [1, 4, 7, 10]),
+        (ChunkFilter(domain=("tax", "building_permit")), [1, 2, 4, 5, 7, 8, 10, 11]),
+        (ChunkFilter(source=("رخصة_بناء.txt",)), [1, 3, 5, 7, 9, 11]),
+        (ChunkFilter(source=("/data/raw/procedure_cin_renewal_fr.txt",), lang=("fr",)), [0, 2, 6, 8]),
+        (ChunkFilter(date_from="2023-01-01"), [0, 3, 6, 9]),
+        (ChunkFilter(date_to="2022-07-20"), [1, 4, 7, 10]),
+        (ChunkFilter(date_from="2022-07-21", date_to="2024-03-11"), []),
+        # Undated chunks (2, 5, 8, 11) are outside every range; malformed bounds match nothing.
+        (ChunkFilter(date_from="0001-01-01"), [0, 1, 3, 4, 6, 7, 9, 10]),
+        (ChunkFilter(date_from="12/03/2024"), []),
+        (ChunkFilter(date_to="12/03/2024"), []),
+        (ChunkFilter(lang=("en",)), []),
+    ],
+)
+def test_select_uses_the_columns(tmp_path, flt, expected):
+    path = tmp_path / "docs_meta.bin"
+    write_meta(path, _records(list(range(12))))
+
+    assert MetaStore.open(path).select(flt).tolist() == expected
@@ -0,0 +1,47 @@
+from __future__ import annotations
+
+from assistant.agent import handle_query
+from assistant.ingestion import ingest_incremental
+from assistant.metrics import REGISTRY, STAGE_METRIC, Histogram, Registry
+
+
+def _count(registry: Registry, stage: str) -> int:
+    return registry.histogram(STAGE_METRIC, stage).count
+
+
+def test_histogram_buckets_are_upper_bounds():
+    h = Histogram(buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        h.observe(value)
+
+    assert h.counts == [2, 1, 1]
+    assert (h.count, round(h.sum, 6)) == (4, 3.65)
+
+
+def test_render_is_cumulative_prometheus_text():
+    registry = Registry()
+    h = registry.histogram("latency_seconds", "retrieve")
+    for value in (0.0004, 0.003, 0.003, 120.0):
+        h.observe(value)
+    registry.inc("cache_hits_total", "exact", 2)
+
+    lines = registry.render().splitlines()
+
+    assert "# TYPE latency_seconds histogram" in lines
+    assert 'latency_seconds_bucket{stage="retrieve",le="0.0005"} 1' in lines
+    assert 'latency_seconds_bucket{stage="retrieve",le="0.005"} 3' in lines
+    assert 'latency_seconds_bucket{stage="retrieve",le="60.0"} 3' in lines
+    assert 'latency_seconds_bucket{stage="retrieve",le="+Inf"} 4' in lines
+    assert 'latency_seconds_count{stage="retrieve"} 4' in lines
+    assert 'cache_hits_total{kind="exact"} 2' in lines
+
+
+def test_query_records_every_stage(paths, make_rag, logger):
+    rag = make_rag()
+    ingest_incremental(paths, rag)
+    stages = ("language_detect", "safety_check", "retrieve", "encode", "index_search", "generate_extractive")
+    before = {s: _count(REGISTRY, s) for s in stages}
+
+    handle_query(user_text="renouvellement carte d'identité", rag=rag, logger=logger)
+
+    assert {s: _count(REGISTRY, s) - before[s] for s in stages} == dict.fromkeys(stages, 1)
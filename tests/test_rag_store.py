@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import faiss
+import pytest
+
+from assistant.ingestion import build_chunks, ingest_incremental, load_documents, save_metadata
+from assistant.rag_store import published_files
+
+
+def _build(paths, rag) -> int:
+    chunks = build_chunks(load_documents(paths.data_raw))
+    save_metadata(paths, chunks)
+    rag.build_and_save([c.text for c in chunks])
+    return len(chunks)
+
+
+def test_index_stays_resident_between_queries(paths, make_rag, monkeypatch):
+    _build(paths, make_rag())
+    rag = make_rag()
+    rag.retrieve("carte d'identité")
+
+    reads = []
+    monkeypatch.setattr(faiss, "read_index", lambda *a: reads.append(a))
+    for _ in range(3):
+        assert rag.retrieve("déclaration fiscale", top_k=2)
+
+    assert reads == []
+
+
+def test_reader_reloads_after_another_store_rebuilds(paths, make_rag):
+    _build(paths, make_rag())
+    reader = make_rag()
+    assert reader.snapshot().index.ntotal == 3
+
+    (paths.data_raw / "procedure_passport_fr.txt").write_text("Demande de passeport biométrique.\n", encoding="utf-8")
+    n = _build(paths, make_rag())
+
+    snap = reader.snapshot()
+    assert snap.index.ntotal == len(snap.meta) == n == 4
+    assert any(r.source.endswith("procedure_passport_fr.txt") for r in reader.retrieve("passeport biométrique"))
+
+
+def _generations(paths) -> list[str]:
+    return sorted(p.name for p in (paths.data_index / "gen").iterdir())
+
+
+def test_ingest_publishes_generation_directories(paths, make_rag):
+    rag = make_rag()
+    for _ in range(3):
+        ingest_incremental(paths, rag, full=True)
+
+    published = published_files(paths)
+    # The published generation and the one before it, for readers still loading it.
+    assert _generations(paths) == ["000002", "000003"]
+    assert published.root.name == "000003"
+    assert published.meta_path.exists() and published.faiss_index_path.exists()
+    assert not paths.legacy_files.faiss_index_path.exists()
+
+
+def test_failed_publish_leaves_the_published_generation(paths, make_rag, monkeypatch):
+    rag = make_rag()
+    ingest_incremental(paths, rag)
+    reader = make_rag()
+    before = [r.chunk_id for r in reader.retrieve("carte d'identité")]
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    (paths.data_raw / "procedure_passport_fr.txt").write_text("Demande de passeport biométrique.\n", encoding="utf-8")
+    monkeypatch.setattr(faiss, "write_index", fail)
+    with pytest.raises(OSError):
+        ingest_incremental(paths, make_rag(), full=True)
+    monkeypatch.undo()
+
+    assert published_files(paths).root.name == "000001"
+    assert [r.chunk_id for r in reader.retrieve("carte d'identité")] == before
+    # The abandoned directory goes with the next successful publish.
+    ingest_incremental(paths, make_rag(), full=True)
+    assert _generations(paths) == ["000001", "000003"]
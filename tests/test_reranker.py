@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import time
+
+import pytest
+
+from assistant.index_factory import SearchTuning
+from assistant.ingestion import ingest_incremental
+from assistant.reranker import Reranker
+
+
+class StubCrossEncoder:
+    """Scores a pair by the words it shares with the query; `delay_s` per call."""
+
+    def __init__(self, delay_s: float = 0.0) -> None:
+        self.delay_s = delay_s
+        self.pairs = 0
+
+    def predict(self, pairs, **_):
+        time.sleep(self.delay_s)
+        self.pairs += len(pairs)
+        return [float(len(set(q.split()) & set(t.split()))) for q, t in pairs]
+
+
+def _reranker(model: StubCrossEncoder, **kwargs) -> Reranker:
+    rr = Reranker("stub", **kwargs)
+    rr._model = model
+    return rr
+
+
+TEXTS = ["carte grise", "carte d'identité nationale", "impôt annuel"]
+
+
+def test_scores_and_caches_pairs():
+    model = StubCrossEncoder()
+    rr = _reranker(model, budget_ms=1000.0)
+
+    first = rr.score("carte d'identité", [1, 2, 3], TEXTS)
+    again = rr.score("carte d'identité", [3, 2, 4], [TEXTS[2], TEXTS[1], "carte"])
+
+    assert first.scores.tolist() == [1.0, 2.0, 0.0] and first.cached == 0
+    assert again.scores.tolist() == [0.0, 2.0, 1.0] and again.cached == 2
+    assert model.pairs == 4
+
+
+def test_slow_pass_times_out_but_fills_the_cache():
+    model = StubCrossEncoder(delay_s=0.2)
+    rr = _reranker(model, budget_ms=20.0)
+
+    out = rr.score("carte", [1, 2, 3], TEXTS)
+    assert (out.scores, out.fallback) == (None, "timeout")
+
+    # The pass keeps running on the single rerank thread; queue behind it.
+    rr._pool.submit(lambda: None).result(timeout=2.0)
+    cached = rr.score("carte", [1, 2, 3], TEXTS)
+    assert cached.fallback is None and cached.cached == 3
+
+
+def test_known_slow_pass_is_not_started():
+    model = StubCrossEncoder(delay_s=0.05)
+    rr = _reranker(model, budget_ms=1000.0)
+    rr.score("carte", [1, 2, 3], TEXTS)
+    rr.budget_ms = 10.0
+
+    out = rr.score("impôt", [1, 2, 3], TEXTS)
+
+    assert (out.scores, out.fallback) == (None, "estimate")
+    assert model.pairs == 3
+
+
+def test_model_load_is_not_counted_as_scoring_time():
+    class SlowLoad(Reranker):
+        @property
+        def model(self):
+            if self._model is None:
+                time.sleep(0.3)
+                self._model = StubCrossEncoder()
+            return self._model
+
+    rr = SlowLoad("stub", budget_ms=1000.0)
+    rr.score("carte", [1, 2, 3], TEXTS)
+    rr.budget_ms = 20.0
+
+    assert rr.score("impôt", [1, 2, 3], TEXTS).fallback is None
+
+
+def test_warmup_seeds_the_estimate():
+    model = StubCrossEncoder(delay_s=0.05)
+    rr = _reranker(model, budget_ms=10.0)
+
+    rr.warmup("carte", TEXTS)
+    out = rr.score("impôt", [1, 2, 3], TEXTS)
+
+    assert (out.scores, out.fallback) == (None, "estimate")
+    assert model.pairs == 2 * len(TEXTS)  # warmup only
+
+
+def test_estimate_is_probed_again_after_probe_s():
+    model = StubCrossEncoder(delay_s=0.05)
+    rr = _reranker(model, budget_ms=1000.0, probe_s=0.2)
+    rr.score("carte", [1, 2, 3], TEXTS)
+    model.delay_s = 0.0  # the first pass was slow, the model is not
+    rr.budget_ms = 10.0
+
+    assert rr.score("impôt", [1, 2, 3], TEXTS).fallback == "estimate"
+    time.sleep(0.25)
+    probe = rr.score("impôt", [1, 2, 3], TEXTS)
+
+    assert probe.fallback is None and probe.scores.tolist() == [0.0, 0.0, 1.0]
+    assert rr.score("grise", [1, 2, 3], TEXTS).fallback == "estimate"  # one probe per interval
+
+
+def test_store_reorders_candidates_unless_disabled(paths, make_rag):
+    rag = make_rag(reranker=_reranker(StubCrossEncoder(), budget_ms=1000.0), rerank_candidates=10)
+    ingest_incremental(paths, rag)
+    query = "formulaire annuel recette finances"
+    dense = SearchTuning(mode="dense", rerank=False)
+
+    first_stage = rag.retrieve(query, top_k=10, tuning=dense)
+    reranked = rag.retrieve(query, top_k=2, tuning=SearchTuning(mode="dense"))
+
+    expected = sorted(first_stage, key=lambda r: -len(set(query.split()) & set(r.text.split())))[:2]
+    assert [r.id for r in reranked] == [r.id for r in expected]
+    assert [r.id for r in rag.retrieve(query, top_k=2, tuning=dense)] == [r.id for r in first_stage[:2]]
+    assert reranked[0].score == pytest.approx(len(set(query.split()) & set(expected[0].text.split())))
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from assistant import rag_store
+from assistant.index_factory import SearchTuning
+from assistant.ingestion import ingest_incremental
+from assistant.meta_store import ChunkFilter
+from assistant.shards import ShardedIndex
+
+QUERIES = [
+    "renouvellement carte d'identité",
+    "déclaration fiscale simplifiée",
+    "رخصة بناء البلدية",
+]
+DENSE = SearchTuning(mode="dense")
+
+
+def _hits(rag, query, **kwargs):
+    return [(r.source, r.chunk_id, round(r.score, 5)) for r in rag.retrieve(query, top_k=5, **kwargs)]
+
+
+@pytest.mark.parametrize("shard_by", ["hash", "source", "domain"])
+def test_sharded_search_matches_single_index(paths, make_rag, shard_by):
+    single = make_rag()
+    ingest_incremental(paths, single)
+    expected = {q: _hits(single, q, tuning=DENSE) for q in QUERIES}
+
+    sharded = make_rag(shards=3, shard_by=shard_by)
+    ingest_incremental(paths, sharded)
+
+    index = sharded.snapshot().index
+    assert isinstance(index, ShardedIndex) and len(index.shards) == 3
+    for q in QUERIES:
+        got = _hits(sharded, q, tuning=DENSE)
+        # Equal scores may come back in either order after the shard merge.
+        assert [h[2] for h in got] == [h[2] for h in expected[q]]
+        assert sorted(got) == sorted(expected[q])
+
+
+@pytest.mark.parametrize("shards", [1, 2])
+def test_retrieve_many_matches_retrieve(paths, make_rag, shards):
+    rag = make_rag(shards=shards)
+    ingest_incremental(paths, rag)
+
+    assert rag.retrieve_many(QUERIES, top_k=5) == [rag.retrieve(q, top_k=5) for q in QUERIES]
+
+
+@pytest.mark.parametrize("mode", ["dense", "hybrid", "lexical"])
+@pytest.mark.parametrize(
+    ("flt", "expected"),
+    [
+        (ChunkFilter(lang=("ar",)), {"procedure_building_permit_ar.txt"}),
+        (ChunkFilter(domain=("tax_simplified",)), {"procedure_tax_simplified_fr.txt"}),
+        (ChunkFilter(source=("procedure_cin_renewal_fr.txt",)), {"procedure_cin_renewal_fr.txt"}),
+        (ChunkFilter(date_from="2023-01-01", date_to="2023-12-31"), {"procedure_tax_simplified_fr.txt"}),
+        (ChunkFilter(date_from="2023-01-01"), {"procedure_cin_renewal_fr.txt", "procedure_tax_simplified_fr.txt"}),
+    ],
+)
+def test_filters_restrict_results(paths, make_rag, mode, flt, expected):
+    rag = make_rag(shards=2, shard_by="source")
+    ingest_incremental(paths, rag)
+
+    hits = rag.retrieve("carte fiscale بناء", top_k=10, tuning=SearchTuning(mode=mode), filters=flt)
+
+    assert hits
+    assert {Path(h.source).name for h in hits} <= expected
+
+
+@pytest.mark.parametrize("exact_max", [0, 10_000])
+@pytest.mark.parametrize("kind", ["Flat", "HNSW"])
+def test_filtered_search_equals_filtering_full_results(paths, make_rag, monkeypatch, exact_max, kind):
+    # exact_max=0 sends every filter through the FAISS selector instead of the exact path.
+    monkeypatch.setattr(rag_store, "FILTER_EXACT_MAX", exact_max)
+    rag = make_rag(kind=kind)
+    ingest_incremental(paths, rag)
+    flt = ChunkFilter(lang=("fr",))
+    allowed = set(rag.snapshot().meta.select(flt).tolist())
+
+    for q in QUERIES:
+        full = rag.retrieve(q, top_k=100, tuning=DENSE)
+        hits = rag.retrieve(q, top_k=2, tuning=DENSE, filters=flt)
+        assert [h.id for h in hits] == [h.id for h in full if h.id in allowed][:2]
+
+
+def test_filter_matching_nothing_returns_nothing(paths, make_rag):
+    rag = make_rag()
+    ingest_incremental(paths, rag)
+
+    assert rag.retrieve("carte", top_k=5, filters=ChunkFilter(domain=("passport",))) == []
+
+
+def test_malformed_filter_date_matches_nothing(paths, make_rag):
+    rag = make_rag()
+    ingest_incremental(paths, rag)
+
+    assert rag.retrieve("carte", top_k=5, filters=ChunkFilter(date_to="12/03/2024")) == []
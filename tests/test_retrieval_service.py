@@ -0,0 +1,108 @@
+from __future__ import annotations
+
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+from assistant.index_factory import SearchTuning
+from assistant.ingestion import ingest_incremental
+from assistant.meta_store import ChunkFilter
+from assistant.retrieval_service import RetrievalClient, RetrievalServer, RetrievalServiceError, parse_address
+
+QUERIES = [
+    "renouvellement carte d'identité",
+    "déclaration fiscale simplifiée",
+    "رخصة بناء البلدية",
+]
+
+
+@pytest.fixture
+def served(paths, make_rag, tmp_path):
+    rag = make_rag()
+    ingest_incremental(paths, rag)
+    server = RetrievalServer(rag, f"unix:{tmp_path / 'svc.sock'}")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    clients: list[RetrievalClient] = []
+
+    def client(**kwargs) -> RetrievalClient:
+        c = RetrievalClient(server.address, paths, timeout_s=5.0, **kwargs)
+        clients.append(c)
+        return c
+
+    yield rag, client
+    for c in clients:
+        c.close()
+    server.shutdown()
+
+
+def _keys(hits) -> list[tuple]:
+    return [(h.id, h.source, h.chunk_id, h.text, round(h.score, 5), h.start, h.end) for h in hits]
+
+
+@pytest.mark.parametrize("batch_window_ms", [0.0, 5.0])
+def test_client_answers_like_the_local_store(served, batch_window_ms):
+    rag, client = served
+    remote = client(batch_window_ms=batch_window_ms)
+    flt = ChunkFilter(lang=("fr",))
+
+    for q in QUERIES:
+        for kwargs in ({}, {"tuning": SearchTuning(mode="dense")}, {"filters": flt}):
+            assert _keys(remote.retrieve(q, top_k=3, **kwargs)) == _keys(rag.retrieve(q, top_k=3, **kwargs))
+        np.testing.assert_allclose(remote.embed_query(q), rag.embed_query(q), rtol=1e-6)
+    assert [_keys(h) for h in remote.retrieve_many(QUERIES, top_k=2)] == [
+        _keys(h) for h in rag.retrieve_many(QUERIES, top_k=2)
+    ]
+    assert remote.generation == rag.generation
+    assert remote.preload() is True
+
+
+def test_precomputed_vector_is_sent_along(served):
+    rag, client = served
+    vector = rag.embed_query(QUERIES[0])
+
+    hits = client().retrieve("texte sans rapport", top_k=3, tuning=SearchTuning(mode="dense"), vector=vector)
+
+    assert _keys(hits) == _keys(rag.retrieve(QUERIES[0], top_k=3, tuning=SearchTuning(mode="dense")))
+
+
+def test_service_errors_reach_the_caller_and_the_connection_survives(served):
+    _, client = served
+    remote = client()
+
+    with pytest.raises(RetrievalServiceError, match="Unknown retrieval mode"):
+        remote.retrieve("carte", tuning=SearchTuning(mode="fuzzy"))
+    assert remote.retrieve("carte", top_k=1)
+
+
+def test_dropped_connection_is_reopened(served):
+    _, client = served
+    remote = client()
+    remote.retrieve("carte", top_k=1)
+    remote._local.sock.shutdown(socket.SHUT_RDWR)
+
+    assert remote.retrieve("carte", top_k=1)
+
+
+def test_unreachable_service(paths, tmp_path):
+    remote = RetrievalClient(f"unix:{tmp_path / 'none.sock'}", paths, timeout_s=0.3)
+
+    with pytest.raises(RetrievalServiceError):
+        remote.retrieve("carte")
+
+
+def test_parse_address():
+    assert parse_address("unix:/tmp/x.sock") == (socket.AF_UNIX, "/tmp/x.sock")
+    assert parse_address("127.0.0.1:7000") == (socket.AF_INET, ("127.0.0.1", 7000))
+    with pytest.raises(ValueError):
+        parse_address("localhost")
+
+
+def test_mmap_index_gives_the_same_results(paths, make_rag):
+    rag = make_rag()
+    ingest_incremental(paths, rag)
+    mapped = make_rag(mmap_index=True)
+
+    for q in QUERIES:
+        assert _keys(mapped.retrieve(q, top_k=3)) == _keys(rag.retrieve(q, top_k=3))
@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import pytest
+
+from assistant.agent import handle_query
+from assistant.ingestion import ingest_incremental
+from assistant.safety import SafetyEngine, check_safety
+
+
+@pytest.mark.parametrize(
+    ("text", "kind", "match"),
+    [
+        ("ma CIN 01234567 expire", "cin", "01234567"),
+        ("appelez le +216 98 765 432 svp", "phone", "+216 98 765 432"),
+        ("tel 71.234.567 bureau", "phone", "71.234.567"),
+        ("écrire à foulen.benfoulen@mail.tn.", "email", "foulen.benfoulen@mail.tn"),
+        ("IBAN TN59 1000 6035 1835 9847 8831 merci", "iban", "TN59 1000 6035 1835 9847 8831"),
+        ("RIB 12345678901234567890 ok", "rib", "12345678901234567890"),
+    ],
+)
+def test_pii_spans(text, kind, match):
+    (span,) = SafetyEngine().scan(text)
+
+    assert (span.kind, span.category, text[span.start : span.end]) == (kind, "pii", match)
+
+
+@pytest.mark.parametrize("text", ["dossier 123456789 reçu", "frais de 12345 dinars", "formulaire n°0123456"])
+def test_other_numbers_are_not_pii(text):
+    assert SafetyEngine().scan(text) == []
+
+
+def test_identifiers_are_redacted_and_the_question_kept():
+    decision = check_safety("Mon CIN est 01234567 et mon numéro 98 765 432, comment renouveler ma carte ?")
+
+    assert decision.action == "redact"
+    assert decision.text == "Mon CIN est [CIN] et mon numéro [TEL], comment renouveler ma carte ?"
+    assert decision.redacted == ["cin", "phone"]
+
+
+def test_nothing_left_after_redaction_is_refused():
+    decision = check_safety("  01234567 ?")
+
+    assert decision.action == "refuse"
+    assert decision.text == "[CIN] ?"
+
+
+@pytest.mark.parametrize(
+    ("text", "label"),
+    [
+        ("Je veux déposer une reclamation", "complaint"),
+        ("Je veux déposer une réclamation", "complaint"),
+        ("سأذهب إلى المحكمة غدا", "legal"),
+        ("وبالرشوة طلبوا مني", "corruption"),
+        ("nechki 3al baladiya", "complaint"),
+        ("He made a THREAT", "threat"),
+    ],
+)
+def test_escalation_lexicon(text, label):
+    decision = check_safety(text)
+
+    assert decision.action == "escalate"
+    assert [s.kind for s in decision.spans] == [label]
+
+
+def test_custom_lexicon_matches_accent_variants():
+    engine = SafetyEngine(lexicon={"legal": ["huissier", "notaire"]})
+
+    assert [(s.kind, s.category) for s in engine.scan("Le HUISSIÉR et le notaire")] == [
+        ("legal", "escalation"),
+        ("legal", "escalation"),
+    ]
+    assert engine.scan("notaires") == []
+
+
+def test_words_inside_longer_words_do_not_escalate():
+    assert check_safety("procès-verbal du ministère de la justice, plaintes reçues ?").action == "allow"
+
+
+def test_raw_identifiers_never_reach_the_log(paths, make_rag, logger):
+    rag = make_rag()
+    ingest_incremental(paths, rag)
+
+    res = handle_query(user_text="Ma CIN 01234567 : comment renouveler la carte d'identité ?", rag=rag, logger=logger)
+    logger.flush()
+
+    assert res.action == "retrieve_document"
+    assert res.answer.startswith("Note")
+    assert res.eval_hooks["after_Safety_Check"] == {"action": "redact", "redacted": ["cin"]}
+    log = (paths.base_dir / "run.log").read_text(encoding="utf-8")
+    assert "01234567" not in log
+    assert "[CIN]" in log
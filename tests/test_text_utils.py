@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from assistant.text_utils import iter_chunk_spans, normalize_text
+
+_WORDS = ["carte", "d'identité", "البلدية", "رخصة", "بناء", "formulaire", "impôt", "el", "CIN", "tjaddadha"]
+
+
+def _text(seed: int) -> str:
+    rng = random.Random(seed)
+    paras = []
+    for _ in range(rng.randint(1, 6)):
+        sentences = []
+        for _ in range(rng.randint(1, 8)):
+            words = [rng.choice(_WORDS) for _ in range(rng.randint(1, 25))]
+            sentences.append(" ".join(words) + rng.choice([".", "?", "؟", "!", ""]))
+        paras.append(" ".join(sentences))
+    # An unbroken run longer than a chunk must still be cut.
+    paras.append("x" * rng.randint(0, 300))
+    return normalize_text("\n\n".join(paras))
+
+
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.parametrize(("chunk_size", "overlap"), [(80, 0), (120, 30), (400, 100)])
+def test_span_invariants(seed, chunk_size, overlap):
+    text = _text(seed)
+    spans = list(iter_chunk_spans(text, chunk_size=chunk_size, overlap=overlap))
+
+    assert spans
+    covered = [False] * len(text)
+    prev_start, prev_end = -1, 0
+    for start, end in spans:
+        assert 0 <= start < end <= len(text)
+        assert end - start <= chunk_size
+        chunk = text[start:end]
+        assert chunk == chunk.strip()
+        assert start > prev_start and end > prev_end
+        assert prev_end - start <= overlap
+        for i in range(start, end):
+            covered[i] = True
+        prev_start, prev_end = start, end
+    assert all(covered[i] for i, ch in enumerate(text) if not ch.isspace())
+
+
+def test_spans_prefer_paragraph_then_sentence_boundaries():
+    text = "Première phrase. Deuxième phrase.\n\nUn autre paragraphe ici."
+
+    assert [text[s:e] for s, e in iter_chunk_spans(text, chunk_size=40, overlap=0)] == [
+        "Première phrase. Deuxième phrase.",
+        "Un autre paragraphe ici.",
+    ]
+    assert [text[s:e] for s, e in iter_chunk_spans(text, chunk_size=25, overlap=0)][0] == "Première phrase."
+
+
+def test_token_budget_shortens_spans():
+    text = _text(7)
+    count = lambda s: len(s.split())  # noqa: E731
+
+    spans = list(iter_chunk_spans(text, chunk_size=400, overlap=50, max_tokens=12, count_tokens=count))
+
+    assert all(count(text[s:e]) <= 12 for s, e in spans if " " in text[s:e])
+    assert len(spans) > len(list(iter_chunk_spans(text, chunk_size=400, overlap=50)))
+
+
+@pytest.mark.parametrize(("chunk_size", "overlap"), [(0, 0), (100, -1), (100, 100)])
+def test_rejects_bad_sizes(chunk_size, overlap):
+    with pytest.raises(ValueError):
+        list(iter_chunk_spans("texte", chunk_size=chunk_size, overlap=overlap))
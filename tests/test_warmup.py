@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import json
+import os
+import signal
+
+import pytest
+
+from assistant.batching import MicroBatcher
+from assistant.ingestion import ingest_incremental
+from assistant.logging_utils import JsonlLogger, LogSettings
+
+
+def test_warmup_without_an_index_only_encodes(make_rag, embedder):
+    rag = make_rag()
+
+    timings = rag.warmup(batch_sizes=(1, 3))
+
+    assert set(timings) == {"load_ms", "batch_1_ms", "batch_3_ms"}
+    assert len(embedder.encoded) == 4
+
+
+def test_warmup_searches_the_published_index(paths, make_rag, logger):
+    rag = make_rag(logger=logger)
+    ingest_incremental(paths, rag)
+
+    assert rag.preload() is True
+    timings = rag.warmup(batch_sizes=(2,))
+    logger.flush()
+
+    assert set(timings) == {"load_ms", "batch_2_ms"}
+    events = [json.loads(line) for line in (paths.base_dir / "run.log").read_text(encoding="utf-8").splitlines()]
+    (warm,) = [e["payload"] for e in events if e["event"] == "Warmup"]
+    assert warm["index"] is True and "batch_2_ms" in warm
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork")
+def test_background_threads_restart_in_a_forked_child(tmp_path):
+    batcher = MicroBatcher(lambda xs: [x * 2 for x in xs], max_wait_ms=1.0)
+    log = JsonlLogger(tmp_path / "run.log", settings=LogSettings(flush_interval_s=0.05))
+    assert batcher.run(1) == 2
+
+    pid = os.fork()
+    if pid == 0:  # child: without a restarted thread these calls would hang
+        code = 1
+        signal.alarm(10)
+        try:
+            if batcher.run(21) == 42:
+                log.log("Child", pid=os.getpid())
+                log.flush()
+                code = 0
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    events = [json.loads(line) for line in (tmp_path / "run.log").read_text(encoding="utf-8").splitlines()]
+    assert [e["payload"]["pid"] for e in events if e["event"] == "Child"] == [pid]
+    log.close()